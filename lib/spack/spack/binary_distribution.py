@@ -4,6 +4,7 @@
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
 import codecs
+import gzip
 import os
 import re
 import tarfile
@@ -11,9 +12,12 @@
 import tempfile
 import hashlib
 import glob
+import io
+import multiprocessing.pool
 import platform
+import time
 
-from contextlib import closing
+from contextlib import closing, contextmanager
 import ruamel.yaml as yaml
 
 import json
@@ -22,12 +26,16 @@
 
 import llnl.util.tty as tty
 from llnl.util.filesystem import mkdirp
+from llnl.util.lang import dedupe
 
+import spack.caches
 import spack.cmd
 import spack.config as config
 import spack.fetch_strategy as fs
 import spack.util.gpg
 import spack.relocate as relocate
+import spack.util.parallel_gzip as parallel_gzip
+import spack.util.spack_json as sjson
 import spack.util.spack_yaml as syaml
 import spack.mirror
 import spack.util.url as url_util
@@ -55,6 +63,15 @@
 
 BUILD_CACHE_INDEX_ENTRY_TEMPLATE = '  <li><a href="{path}">{path}</a></li>'
 
+#: Name of the consolidated index of the specs in a build cache
+BUILD_CACHE_SPEC_INDEX = 'index.json.gz'
+
+#: Name of the file holding the sha256 checksum of the spec index
+BUILD_CACHE_SPEC_INDEX_HASH = 'index.json.gz.hash'
+
+#: Maximum number of concurrent requests to a mirror
+_mirror_concurrency = 32
+
 
 class NoOverwriteException(spack.error.SpackError):
     """
@@ -110,6 +127,21 @@ class NoChecksumException(spack.error.SpackError):
     pass
 
 
+class BuildTarballException(spack.error.SpackError):
+    """
+    Raised if the binary package of a spec can't be created.
+    """
+    pass
+
+
+class InvalidTarballException(spack.error.SpackError):
+    """
+    Raised if a binary package is malformed, or would write outside of its
+    install prefix.
+    """
+    pass
+
+
 class NewLayoutException(spack.error.SpackError):
     """
     Raised if directory layout is different from buildcache.
@@ -146,10 +178,13 @@ def read_buildinfo_file(prefix):
     return buildinfo
 
 
-def write_buildinfo_file(spec, workdir, rel=False):
+def write_buildinfo_file(spec, workdir, rel=False, jobs=None):
     """
     Create a cache file containing information
-    required for the relocation
+    required for the relocation and return its content
+
+    The files of the prefix are scanned by ``jobs`` threads or processes
+    (default: number of cores), or in the current thread if ``jobs`` is 1.
     """
     prefix = spec.prefix
     text_to_relocate = []
@@ -163,31 +198,36 @@ def write_buildinfo_file(spec, workdir, rel=False):
         prefix_to_hash[str(d.prefix)] = d.dag_hash()
     # Do this at during tarball creation to save time when tarball unpacked.
     # Used by make_package_relative to determine binaries to change.
+    path_names = []
     for root, dirs, files in os.walk(prefix, topdown=True):
         dirs[:] = [d for d in dirs if d not in blacklist]
-        for filename in files:
-            path_name = os.path.join(root, filename)
-            m_type, m_subtype = relocate.mime_type(path_name)
-            if os.path.islink(path_name):
-                link = os.readlink(path_name)
-                if os.path.isabs(link):
-                    # Relocate absolute links into the spack tree
-                    if link.startswith(spack.store.layout.root):
-                        rel_path_name = os.path.relpath(path_name, prefix)
-                        link_to_relocate.append(rel_path_name)
-                    else:
-                        msg = 'Absolute link %s to %s ' % (path_name, link)
-                        msg += 'outside of prefix %s ' % prefix
-                        msg += 'should not be relocated.'
-                        tty.warn(msg)
-
-            if relocate.needs_binary_relocation(m_type, m_subtype):
-                if not filename.endswith('.o'):
+        path_names.extend(os.path.join(root, f) for f in files)
+
+    # Classify all the files at once, in parallel
+    mime_types = relocate.mime_types(path_names, jobs)
+    for path_name in path_names:
+        filename = os.path.basename(path_name)
+        m_type, m_subtype = mime_types[path_name]
+        if os.path.islink(path_name):
+            link = os.readlink(path_name)
+            if os.path.isabs(link):
+                # Relocate absolute links into the spack tree
+                if link.startswith(spack.store.layout.root):
                     rel_path_name = os.path.relpath(path_name, prefix)
-                    binary_to_relocate.append(rel_path_name)
-            if relocate.needs_text_relocation(m_type, m_subtype):
+                    link_to_relocate.append(rel_path_name)
+                else:
+                    msg = 'Absolute link %s to %s ' % (path_name, link)
+                    msg += 'outside of prefix %s ' % prefix
+                    msg += 'should not be relocated.'
+                    tty.warn(msg)
+
+        if relocate.needs_binary_relocation(m_type, m_subtype):
+            if not filename.endswith('.o'):
                 rel_path_name = os.path.relpath(path_name, prefix)
-                text_to_relocate.append(rel_path_name)
+                binary_to_relocate.append(rel_path_name)
+        if relocate.needs_text_relocation(m_type, m_subtype):
+            rel_path_name = os.path.relpath(path_name, prefix)
+            text_to_relocate.append(rel_path_name)
 
     # Create buildinfo data and write it to disk
     buildinfo = {}
@@ -200,9 +240,54 @@ def write_buildinfo_file(spec, workdir, rel=False):
     buildinfo['relocate_binaries'] = binary_to_relocate
     buildinfo['relocate_links'] = link_to_relocate
     buildinfo['prefix_to_hash'] = prefix_to_hash
+
+    # Record where the prefixes to be relocated occur, so that installing
+    # the package doesn't need to scan all the files again. Binaries made
+    # relative are modified while the tarball is created, so their offsets
+    # would not be valid.
+    prefixes = list(prefix_to_hash) + [spack.store.layout.root]
+    sbang_line = '#!/bin/bash {0}/bin/sbang'.format(spack.paths.prefix)
+    text_offsets = relocate.prefix_offsets(
+        [os.path.join(prefix, f) for f in text_to_relocate],
+        prefixes + [sbang_line], text=True, jobs=jobs)
+    buildinfo['relocation_offsets'] = {
+        'text': _relative_index(text_offsets, prefix)
+    }
+    if not rel:
+        binaries = [os.path.join(prefix, f) for f in binary_to_relocate]
+        binary_offsets = relocate.prefix_offsets(
+            binaries, prefixes + [spack.paths.prefix], text=False,
+            jobs=jobs)
+        buildinfo['relocation_offsets']['binary'] = _relative_index(
+            binary_offsets, prefix)
+        elf_rpaths = {}
+        for rel_path_name, binary in zip(binary_to_relocate, binaries):
+            rpaths = relocate.elf_rpaths(binary)
+            if rpaths is not None:
+                elf_rpaths[rel_path_name] = rpaths
+        buildinfo['elf_rpaths'] = elf_rpaths
+
     filename = buildinfo_file_name(workdir)
     with open(filename, 'w') as outfile:
         outfile.write(syaml.dump(buildinfo, default_flow_style=True))
+    return buildinfo
+
+
+def _relative_index(index, prefix):
+    """Return a copy of an index computed by ``relocate.prefix_offsets``
+    where the files are relative to ``prefix``."""
+    files = dict((os.path.relpath(f, prefix), entry)
+                 for f, entry in index['files'].items())
+    return {'prefixes': index['prefixes'], 'files': files}
+
+
+def _absolute_index(index, prefix):
+    """Inverse of ``_relative_index``"""
+    if not index:
+        return None
+    files = dict((os.path.join(prefix, f), entry)
+                 for f, entry in index['files'].items())
+    return {'prefixes': index['prefixes'], 'files': files}
 
 
 def tarball_directory_name(spec):
@@ -249,8 +334,12 @@ def checksum_tarball(file):
     return hasher.hexdigest()
 
 
-def sign_tarball(key, force, specfile_path):
-    # Sign the packages if keys available
+def select_signing_key(key=None):
+    """
+    Return the key used to sign build caches: ``key`` if given, otherwise
+    the only signing key available. Resolving it once lets many tarballs
+    be signed without listing the keys each time.
+    """
     if spack.util.gpg.Gpg.gpg() is None:
         raise NoGpgException(
             "gpg2 is not available in $PATH .\n"
@@ -270,6 +359,13 @@ def sign_tarball(key, force, specfile_path):
             msg += " to create a default key."
             raise NoKeyException(msg)
 
+    return key
+
+
+def sign_tarball(key, force, specfile_path):
+    # Sign the packages if keys available
+    key = select_signing_key(key)
+
     if os.path.exists('%s.asc' % specfile_path):
         if force:
             os.remove('%s.asc' % specfile_path)
@@ -285,13 +381,17 @@ def generate_package_index(cache_prefix):
     Creates (or replaces) the "index.html" page at the location given in
     cache_prefix.  This page contains a link for each binary package (*.yaml)
     and public key (*.key) under cache_prefix.
+
+    The contents of all the spec.yaml files are also gathered in a single
+    compressed index, so that clients can download it at once.
     """
     tmpdir = tempfile.mkdtemp()
     try:
+        entries = list(web_util.list_url(cache_prefix))
         index_html_path = os.path.join(tmpdir, 'index.html')
         file_list = (
             entry
-            for entry in web_util.list_url(cache_prefix)
+            for entry in entries
             if (entry.endswith('.yaml')
                 or entry.endswith('.key')))
 
@@ -307,15 +407,180 @@ def generate_package_index(cache_prefix):
             url_util.join(cache_prefix, 'index.html'),
             keep_original=False,
             extra_args={'ContentType': 'text/html'})
+
+        specfile_names = [e for e in entries if e.endswith('.spec.yaml')]
+        generate_spec_index(cache_prefix, specfile_names, tmpdir)
     finally:
         shutil.rmtree(tmpdir)
 
 
+def generate_spec_index(cache_prefix, specfile_names, tmpdir):
+    """Create the consolidated index of the specs in a build cache.
+
+    The index is a gzip compressed JSON file mapping the name of each
+    spec.yaml file to its contents. A second file holds the sha256 checksum
+    of the index, so that clients can tell whether their copy is current
+    without downloading the index again.
+
+    Args:
+        cache_prefix (str): URL of the build cache
+        specfile_names (list): names of the spec.yaml files to be indexed
+        tmpdir (str): directory for temporary files
+    """
+    def read_specfile(name):
+        return name, _read_yaml_from_url(url_util.join(cache_prefix, name))
+
+    specs = {}
+    if specfile_names:
+        tp = multiprocessing.pool.ThreadPool(
+            processes=min(len(specfile_names), _mirror_concurrency))
+        try:
+            specs = dict(tp.map(read_specfile, specfile_names))
+        finally:
+            tp.close()
+
+    index_path = os.path.join(tmpdir, BUILD_CACHE_SPEC_INDEX)
+    with open(index_path, 'wb') as f:
+        with closing(gzip.GzipFile(filename='', mode='wb', fileobj=f)) as z:
+            z.write(json.dumps({'specs': specs}).encode('utf-8'))
+
+    hash_path = os.path.join(tmpdir, BUILD_CACHE_SPEC_INDEX_HASH)
+    with open(hash_path, 'w') as f:
+        f.write(checksum_tarball(index_path))
+
+    # Push the index first, so that a client reading the new checksum
+    # finds the new index
+    web_util.push_to_url(
+        index_path, url_util.join(cache_prefix, BUILD_CACHE_SPEC_INDEX),
+        keep_original=False)
+    web_util.push_to_url(
+        hash_path, url_util.join(cache_prefix, BUILD_CACHE_SPEC_INDEX_HASH),
+        keep_original=False, extra_args={'ContentType': 'text/plain'})
+
+
+def _read_from_url(url):
+    """Return the contents of ``url`` as bytes"""
+    _, _, response = web_util.read_from_url(url)
+    try:
+        return response.read()
+    finally:
+        response.close()
+
+
+def _read_yaml_from_url(url):
+    """Return the YAML document at ``url``"""
+    return syaml.load(_read_from_url(url).decode('utf-8'))
+
+
+def _spec_index_cache_key(cache_prefix):
+    """Key of the local copy of the spec index of a build cache in the
+    misc cache."""
+    url_hash = hashlib.sha256(cache_prefix.encode('utf-8')).hexdigest()
+    return 'buildcache/{0}-index.json'.format(url_hash)
+
+
+def get_spec_index(cache_prefix, force=False):
+    """Return the contents of the consolidated spec index of a build cache.
+
+    A copy of the index is kept in the misc cache. For
+    ``config:buildcache_index_ttl`` seconds after it was last checked the
+    copy is used without contacting the mirror. After that the checksum of
+    the index is read from the mirror, and the index is downloaded again
+    only if it changed.
+
+    Args:
+        cache_prefix (str): URL of the build cache
+        force (bool): download the index even if the local copy is current
+
+    Returns:
+        Dictionary mapping the names of the spec.yaml files in the build
+        cache to their contents, or None if the build cache has no index
+        or it could not be read.
+    """
+    misc_cache = spack.caches.misc_cache
+    cache_key = _spec_index_cache_key(cache_prefix)
+    ttl = config.get('config:buildcache_index_ttl', 600)
+
+    cached = None
+    if misc_cache.init_entry(cache_key) and not force:
+        cached, mtime = _read_cached_spec_index(cache_prefix, cache_key)
+        if time.time() - mtime < ttl:
+            return cached['specs']
+
+    hash_url = url_util.join(cache_prefix, BUILD_CACHE_SPEC_INDEX_HASH)
+    index_url = url_util.join(cache_prefix, BUILD_CACHE_SPEC_INDEX)
+    try:
+        index_hash = _read_from_url(hash_url).decode('utf-8').strip()
+    except (URLError, IOError, web_util.SpackWebError) as e:
+        tty.debug('No spec index at {0}: {1}'.format(
+            url_util.format(cache_prefix), str(e)))
+        return None
+
+    if cached and cached.get('hash') == index_hash:
+        # Still current: restart the TTL
+        cache_path = misc_cache.cache_path(cache_key)
+        os.utime(cache_path, None)
+        _spec_indexes[cache_prefix] = (os.stat(cache_path).st_mtime, cached)
+        return cached['specs']
+
+    try:
+        data = _read_from_url(index_url)
+    except (URLError, IOError, web_util.SpackWebError) as e:
+        tty.debug('Cannot read {0}: {1}'.format(
+            url_util.format(index_url), str(e)))
+        return None
+
+    if hashlib.sha256(data).hexdigest() != index_hash:
+        tty.warn('Ignoring {0}: its checksum does not match'.format(
+            url_util.format(index_url)))
+        return None
+
+    with closing(gzip.GzipFile(fileobj=io.BytesIO(data))) as z:
+        specs = sjson.load(z.read().decode('utf-8'))['specs']
+
+    cached = {'url': cache_prefix, 'hash': index_hash, 'specs': specs}
+    with misc_cache.write_transaction(cache_key) as (old, new):
+        sjson.dump(cached, new)
+    cache_path = misc_cache.cache_path(cache_key)
+    _spec_indexes[cache_prefix] = (os.stat(cache_path).st_mtime, cached)
+    return specs
+
+
+# Spec indexes read from the misc cache by this process, by build cache
+_spec_indexes = {}
+
+
+def _read_cached_spec_index(cache_prefix, cache_key):
+    """Return the local copy of the spec index of a build cache, and the
+    time it was last checked against the mirror.
+
+    The copy is parsed again only if the file in the misc cache changed
+    since this process last read it.
+    """
+    misc_cache = spack.caches.misc_cache
+    mtime = os.stat(misc_cache.cache_path(cache_key)).st_mtime
+    cached_mtime, cached = _spec_indexes.get(cache_prefix, (None, None))
+    if cached is None or cached_mtime != mtime:
+        with misc_cache.read_transaction(cache_key) as f:
+            cached = sjson.load(f)
+    _spec_indexes[cache_prefix] = (mtime, cached)
+    return cached, mtime
+
+
 def build_tarball(spec, outdir, force=False, rel=False, unsigned=False,
-                  allow_root=False, key=None, regenerate_index=False):
+                  allow_root=False, key=None, regenerate_index=False,
+                  jobs=None):
     """
     Build a tarball from given spec and put it into the directory structure
     used at the mirror (following <tarball_directory_name>).
+
+    The install prefix is read only once: files are relativized on the fly
+    while they are added to the compressed tarball, which in turn is
+    streamed directly into the ``.spack`` archive. ``jobs`` is passed to
+    ``write_buildinfo_file``: use 1 when several tarballs are built by
+    concurrent threads, so that none of them forks a pool of processes.
+
+    Return the size in bytes of the ``.spack`` archive.
     """
     if not spec.concrete:
         raise ValueError('spec must be concrete to build tarball')
@@ -326,7 +591,6 @@ def build_tarball(spec, outdir, force=False, rel=False, unsigned=False,
 
     tarfile_name = tarball_name(spec, '.tar.gz')
     tarfile_dir = os.path.join(cache_prefix, tarball_directory_name(spec))
-    tarfile_path = os.path.join(tarfile_dir, tarfile_name)
     spackfile_path = os.path.join(
         cache_prefix, tarball_path_name(spec, '.spack'))
 
@@ -357,51 +621,58 @@ def build_tarball(spec, outdir, force=False, rel=False, unsigned=False,
         else:
             raise NoOverwriteException(url_util.format(remote_specfile_path))
 
-    # make a copy of the install directory to work with
+    # scratch directory mirroring the prefix: it only holds the buildinfo
+    # file and, one at a time, the binaries being made relative
     workdir = os.path.join(tmpdir, os.path.basename(spec.prefix))
-    # install_tree copies hardlinks
-    # create a temporary tarfile from prefix and exract it to workdir
-    # tarfile preserves hardlinks
-    temp_tarfile_name = tarball_name(spec, '.tar')
-    temp_tarfile_path = os.path.join(tarfile_dir, temp_tarfile_name)
-    with closing(tarfile.open(temp_tarfile_path, 'w')) as tar:
-        tar.add(name='%s' % spec.prefix,
-                arcname='.')
-    with closing(tarfile.open(temp_tarfile_path, 'r')) as tar:
-        tar.extractall(workdir)
-    os.remove(temp_tarfile_path)
-
-    # create info for later relocation and create tar
-    write_buildinfo_file(spec, workdir, rel)
-
-    # optionally make the paths in the binaries relative to each other
-    # in the spack install tree before creating tarball
-    if rel:
+    mkdirp(os.path.join(workdir, '.spack'))
+
+    # create info for later relocation
+    buildinfo = write_buildinfo_file(spec, workdir, rel, jobs)
+
+    # without relative rpaths binaries are stored as they are, so check
+    # them before writing anything
+    if not rel:
         try:
-            make_package_relative(workdir, spec, allow_root)
+            check_package_relocatable(buildinfo, spec, allow_root)
         except Exception as e:
-            shutil.rmtree(workdir)
-            shutil.rmtree(tarfile_dir)
             shutil.rmtree(tmpdir)
-            tty.die(e)
-    else:
+            raise BuildTarballException(str(e))
+
+    # The compressed tarball of the install prefix is the first member of
+    # the .spack archive: reserve room for its header, stream the payload
+    # right after it and write the header once the size is known.
+    payload_info = tarfile.TarInfo(tarfile_name)
+    header_size = len(payload_info.tobuf(tarfile.GNU_FORMAT))
+    with open(spackfile_path, 'wb') as spackfile:
+        spackfile.write(tarfile.NUL * header_size)
+        payload = _HashingWriter(spackfile)
         try:
-            check_package_relocatable(workdir, spec, allow_root)
+            with closing(_payload_compressor(payload)) as compressor:
+                with closing(tarfile.open(fileobj=compressor,
+                                          mode='w|')) as tar:
+                    _add_prefix_to_tarball(tar, spec, workdir, buildinfo,
+                                           rel, allow_root)
         except Exception as e:
-            shutil.rmtree(workdir)
-            shutil.rmtree(tarfile_dir)
+            spackfile.close()
             shutil.rmtree(tmpdir)
-            tty.die(e)
+            raise BuildTarballException(str(e))
+
+        _, remainder = divmod(payload.size, tarfile.BLOCKSIZE)
+        if remainder:
+            spackfile.write(
+                tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
 
-    # create gzip compressed tarball of the install prefix
-    with closing(tarfile.open(tarfile_path, 'w:gz')) as tar:
-        tar.add(name='%s' % workdir,
-                arcname='%s' % os.path.basename(spec.prefix))
-    # remove copy of install directory
+        payload_info.size = payload.size
+        payload_info.mtime = int(time.time())
+        payload_info.mode = 0o644
+        spackfile.seek(0)
+        spackfile.write(payload_info.tobuf(tarfile.GNU_FORMAT))
+
+    # remove the scratch copy of the install directory
     shutil.rmtree(workdir)
 
-    # get the sha256 checksum of the tarball
-    checksum = checksum_tarball(tarfile_path)
+    # the sha256 checksum of the tarball was computed while streaming it
+    checksum = payload.hexdigest()
 
     # add sha256 checksum to spec.yaml
     with open(spec_file, 'r') as inputfile:
@@ -432,19 +703,22 @@ def build_tarball(spec, outdir, force=False, rel=False, unsigned=False,
     # sign the tarball and spec file with gpg
     if not unsigned:
         sign_tarball(key, force, specfile_path)
-    # put tarball, spec and signature files in .spack archive
-    with closing(tarfile.open(spackfile_path, 'w')) as tar:
-        tar.add(name=tarfile_path, arcname='%s' % tarfile_name)
-        tar.add(name=specfile_path, arcname='%s' % specfile_name)
-        if not unsigned:
-            tar.add(name='%s.asc' % specfile_path,
-                    arcname='%s.asc' % specfile_name)
+
+    # append spec and signature files to the .spack archive
+    with open(spackfile_path, 'r+b') as spackfile:
+        spackfile.seek(0, os.SEEK_END)
+        with closing(tarfile.open(fileobj=spackfile, mode='w',
+                                  format=tarfile.GNU_FORMAT)) as tar:
+            tar.add(name=specfile_path, arcname='%s' % specfile_name)
+            if not unsigned:
+                tar.add(name='%s.asc' % specfile_path,
+                        arcname='%s.asc' % specfile_name)
 
     # cleanup file moved to archive
-    os.remove(tarfile_path)
     if not unsigned:
         os.remove('%s.asc' % specfile_path)
 
+    spackfile_size = os.path.getsize(spackfile_path)
     web_util.push_to_url(
         spackfile_path, remote_spackfile_path, keep_original=False)
     web_util.push_to_url(
@@ -462,7 +736,7 @@ def build_tarball(spec, outdir, force=False, rel=False, unsigned=False,
     finally:
         shutil.rmtree(tmpdir)
 
-    return None
+    return spackfile_size
 
 
 def download_tarball(spec):
@@ -491,47 +765,189 @@ def download_tarball(spec):
     return None
 
 
-def make_package_relative(workdir, spec, allow_root):
+class _HashingWriter(object):
+    """Write-only file object that forwards data to another file object,
+    keeping track of its size and sha256 checksum on the way."""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.hasher = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.hasher.update(data)
+        self.size += len(data)
+        self.fileobj.write(data)
+
+    def hexdigest(self):
+        return self.hasher.hexdigest()
+
+
+def _payload_compressor(fileobj):
+    """Return a file object compressing what is written to it into
+    ``fileobj``, according to the ``config:buildcache_compression`` setting.
+
+    Both formats produce valid gzip data: ``parallel-gzip`` compresses
+    independent blocks on all the available cores, ``gzip`` produces a
+    single stream on one core.
     """
-    Change paths in binaries to relative paths. Change absolute symlinks
-    to relative symlinks.
+    compression = config.get('config:buildcache_compression',
+                             'parallel-gzip')
+    if compression == 'parallel-gzip':
+        return parallel_gzip.GzipWriter(fileobj)
+    return gzip.GzipFile(filename='', mode='wb', fileobj=fileobj)
+
+
+class _HashingReader(object):
+    """Read-only file object that reads from another file object, keeping
+    track of the sha256 checksum of the data read on the way."""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.hasher = hashlib.sha256()
+        self.pending = b''
+
+    def peek(self, size):
+        """Return the next ``size`` bytes without consuming them"""
+        if len(self.pending) < size:
+            self.pending += self.fileobj.read(size - len(self.pending))
+        return self.pending[:size]
+
+    def read(self, size=-1):
+        data, self.pending = self.pending, b''
+        if size < 0:
+            data += self.fileobj.read()
+        elif len(data) < size:
+            data += self.fileobj.read(size - len(data))
+        else:
+            data, self.pending = data[:size], data[size:]
+        self.hasher.update(data)
+        return data
+
+    def drain(self):
+        """Read, and hash, what is left in the stream"""
+        while self.read(1024 * 1024):
+            pass
+
+    def hexdigest(self):
+        return self.hasher.hexdigest()
+
+
+@contextmanager
+def _open_payload(fileobj):
+    """Open the compressed tarball of an install prefix for extraction, as
+    a stream. ``fileobj`` must support ``peek``, as ``_HashingReader`` does.
+
+    Tarballs written with ``parallel-gzip`` are decompressed in parallel;
+    every other format (``.tar.gz`` and ``.tar.bz2`` from older buildcaches)
+    is detected and read by ``tarfile``.
     """
-    prefix = spec.prefix
-    buildinfo = read_buildinfo_file(workdir)
-    old_layout_root = buildinfo['buildpath']
-    orig_path_names = list()
-    cur_path_names = list()
-    for filename in buildinfo['relocate_binaries']:
-        orig_path_names.append(os.path.join(prefix, filename))
-        cur_path_names.append(os.path.join(workdir, filename))
+    header = fileobj.peek(parallel_gzip.header_size)
+    if not parallel_gzip.is_parallel_gzip_header(header):
+        with closing(tarfile.open(fileobj=fileobj, mode='r|*')) as tar:
+            yield tar
+        return
+
+    with closing(parallel_gzip.GzipReader(fileobj)) as reader:
+        with closing(tarfile.open(fileobj=reader, mode='r|')) as tar:
+            yield tar
+
+
+def _add_prefix_to_tarball(tar, spec, workdir, buildinfo, rel, allow_root):
+    """Add the install prefix of ``spec`` to ``tar`` walking it only once.
+
+    The buildinfo file in ``workdir`` replaces the one that might be in the
+    prefix. If ``rel`` is True the binaries and links listed in
+    ``buildinfo`` are made relative on the fly: each binary is copied to
+    ``workdir`` just before being added and removed right after.
+    """
+    prefix = str(spec.prefix)
+    top = os.path.basename(prefix)
+    buildinfo_path = buildinfo_file_name(workdir)
+    buildinfo_relpath = os.path.relpath(buildinfo_path, workdir)
+    binaries = set(buildinfo['relocate_binaries'])
+    links = set(buildinfo['relocate_links'])
+
+    def add(path, relpath):
+        arcname = os.path.join(top, relpath) if relpath else top
+        info = tar.gettarinfo(path, arcname)
+        if info is None:
+            # sockets and other special files can't be archived
+            tty.debug('skipping %s' % path)
+            return
+
+        if info.isdir():
+            tar.addfile(info)
+            for entry in sorted(os.listdir(path)):
+                entry_relpath = os.path.join(relpath, entry)
+                if entry_relpath != buildinfo_relpath:
+                    add(os.path.join(path, entry), entry_relpath)
+
+        elif info.issym():
+            if rel and relpath in links:
+                info.linkname = make_link_relative_target(path)
+            tar.addfile(info)
+
+        elif info.isreg():
+            source = path
+            if rel and relpath in binaries:
+                source = make_binary_relative(
+                    path, os.path.join(workdir, relpath),
+                    spec, buildinfo['buildpath'], allow_root)
+                info.size = os.path.getsize(source)
+            try:
+                with open(source, 'rb') as f:
+                    tar.addfile(info, f)
+            finally:
+                if source != path:
+                    os.remove(source)
+
+        else:
+            # hard links, fifos and devices have no payload
+            tar.addfile(info)
+
+    add(prefix, '')
+    tar.add(name=buildinfo_path, arcname=os.path.join(top, buildinfo_relpath))
+
+
+def make_binary_relative(orig_path, cur_path, spec, old_layout_root,
+                         allow_root):
+    """
+    Copy the binary ``orig_path`` to ``cur_path`` and change the paths in
+    the copy to relative paths. Return the path of the copy.
+    """
+    mkdirp(os.path.dirname(cur_path))
+    shutil.copy2(orig_path, cur_path)
     if (spec.architecture.platform == 'darwin' or
         spec.architecture.platform == 'test' and
             platform.system().lower() == 'darwin'):
-        relocate.make_macho_binaries_relative(cur_path_names, orig_path_names,
+        relocate.make_macho_binaries_relative([cur_path], [orig_path],
                                               old_layout_root)
     if (spec.architecture.platform == 'linux' or
         spec.architecture.platform == 'test' and
             platform.system().lower() == 'linux'):
-        relocate.make_elf_binaries_relative(cur_path_names, orig_path_names,
+        relocate.make_elf_binaries_relative([cur_path], [orig_path],
                                             old_layout_root)
-    relocate.raise_if_not_relocatable(cur_path_names, allow_root)
-    orig_path_names = list()
-    cur_path_names = list()
-    for linkname in buildinfo.get('relocate_links', []):
-        orig_path_names.append(os.path.join(prefix, linkname))
-        cur_path_names.append(os.path.join(workdir, linkname))
-    relocate.make_link_relative(cur_path_names, orig_path_names)
+    relocate.raise_if_not_relocatable([cur_path], allow_root)
+    return cur_path
 
 
-def check_package_relocatable(workdir, spec, allow_root):
+def make_link_relative_target(link):
+    """
+    Return the target of the absolute symbolic link ``link`` relative to
+    the directory containing it.
+    """
+    target = os.readlink(link)
+    return os.path.relpath(target, os.path.dirname(link))
+
+
+def check_package_relocatable(buildinfo, spec, allow_root):
     """
     Check if package binaries are relocatable.
-    Change links to placeholder links.
     """
-    buildinfo = read_buildinfo_file(workdir)
     cur_path_names = list()
     for filename in buildinfo['relocate_binaries']:
-        cur_path_names.append(os.path.join(workdir, filename))
+        cur_path_names.append(os.path.join(spec.prefix, filename))
     relocate.raise_if_not_relocatable(cur_path_names, allow_root)
 
 
@@ -590,11 +1006,19 @@ def is_backup_file(file):
     if old_layout_root != new_layout_root:
         paths_to_relocate = [old_spack_prefix, old_layout_root]
         paths_to_relocate.extend(prefix_to_hash.keys())
-        files_to_relocate = list(filter(
-            lambda pathname: not relocate.file_is_relocatable(
-                pathname, paths_to_relocate=paths_to_relocate),
-            map(lambda filename: os.path.join(workdir, filename),
-                buildinfo['relocate_binaries'])))
+        binaries = [os.path.join(workdir, filename)
+                    for filename in buildinfo['relocate_binaries']]
+        offsets = buildinfo.get('relocation_offsets', {})
+        text_offsets = _absolute_index(offsets.get('text'), workdir)
+        binary_offsets = _absolute_index(offsets.get('binary'), workdir)
+        if binary_offsets:
+            # Binaries where none of the prefixes occur are relocatable
+            binaries = [b for b in binaries if b in binary_offsets['files']]
+        relocatable = relocate.files_are_relocatable(
+            binaries, paths_to_relocate=paths_to_relocate)
+        files_to_relocate = [b for b in binaries if not relocatable[b]]
+        elf_rpaths = dict((os.path.join(workdir, b), rpaths) for b, rpaths
+                          in buildinfo.get('elf_rpaths', {}).items())
         # If the buildcache was not created with relativized rpaths
         # do the relocation of path in binaries
         if (spec.architecture.platform == 'darwin' or
@@ -614,7 +1038,8 @@ def is_backup_file(file):
                                            new_layout_root,
                                            prefix_to_prefix, rel,
                                            old_prefix,
-                                           new_prefix)
+                                           new_prefix,
+                                           rpaths=elf_rpaths)
             # Relocate links to the new install prefix
             links = [link for link in buildinfo.get('relocate_links', [])]
             relocate.relocate_links(
@@ -628,20 +1053,26 @@ def is_backup_file(file):
                                old_prefix, new_prefix,
                                old_spack_prefix,
                                new_spack_prefix,
-                               prefix_to_prefix)
+                               prefix_to_prefix,
+                               offsets=text_offsets)
 
         # relocate the install prefixes in binary files including dependencies
         relocate.relocate_text_bin(files_to_relocate,
                                    old_prefix, new_prefix,
                                    old_spack_prefix,
                                    new_spack_prefix,
-                                   prefix_to_prefix)
+                                   prefix_to_prefix,
+                                   offsets=binary_offsets)
 
 
 def extract_tarball(spec, filename, allow_root=False, unsigned=False,
                     force=False):
     """
     extract binary tarball for given package into install area
+
+    The compressed tarball of the prefix is never copied out of the
+    ``.spack`` archive: it is checksummed while it is extracted next to
+    the install prefix, and moved in place only if the checksum matches.
     """
     if os.path.exists(spec.prefix):
         if force:
@@ -653,92 +1084,62 @@ def extract_tarball(spec, filename, allow_root=False, unsigned=False,
     stagepath = os.path.dirname(filename)
     spackfile_name = tarball_name(spec, '.spack')
     spackfile_path = os.path.join(stagepath, spackfile_name)
-    tarfile_name = tarball_name(spec, '.tar.gz')
-    tarfile_path = os.path.join(tmpdir, tarfile_name)
     specfile_name = tarball_name(spec, '.spec.yaml')
     specfile_path = os.path.join(tmpdir, specfile_name)
-
-    with closing(tarfile.open(spackfile_path, 'r')) as tar:
-        tar.extractall(tmpdir)
     # some buildcache tarfiles use bzip2 compression
-    if not os.path.exists(tarfile_path):
-        tarfile_name = tarball_name(spec, '.tar.bz2')
-        tarfile_path = os.path.join(tmpdir, tarfile_name)
-    if not unsigned:
-        if os.path.exists('%s.asc' % specfile_path):
-            try:
-                suppress = config.get('config:suppress_gpg_warnings', False)
-                Gpg.verify('%s.asc' % specfile_path, specfile_path, suppress)
-            except Exception as e:
-                shutil.rmtree(tmpdir)
-                raise e
-        else:
-            shutil.rmtree(tmpdir)
-            raise NoVerifyException(
-                "Package spec file failed signature verification.\n"
-                "Use spack buildcache keys to download "
-                "and install a key for verification from the mirror.")
-    # get the sha256 checksum of the tarball
-    checksum = checksum_tarball(tarfile_path)
-
-    # get the sha256 checksum recorded at creation
-    spec_dict = {}
-    with open(specfile_path, 'r') as inputfile:
-        content = inputfile.read()
-        spec_dict = syaml.load(content)
-    bchecksum = spec_dict['binary_cache_checksum']
+    tarfile_names = [tarball_name(spec, '.tar.gz'),
+                     tarball_name(spec, '.tar.bz2')]
 
-    # if the checksums don't match don't install
-    if bchecksum['hash'] != checksum:
+    try:
+        with closing(tarfile.open(spackfile_path, 'r')) as spackfile:
+            names = spackfile.getnames()
+            for name in (specfile_name, specfile_name + '.asc'):
+                if name in names:
+                    spackfile.extract(name, tmpdir)
+            if not unsigned:
+                _verify_specfile(specfile_path)
+
+            # get the sha256 checksum recorded at creation
+            spec_dict = {}
+            with open(specfile_path, 'r') as inputfile:
+                content = inputfile.read()
+                spec_dict = syaml.load(content)
+            bchecksum = spec_dict['binary_cache_checksum']
+
+            new_relative_prefix = str(os.path.relpath(spec.prefix,
+                                                      spack.store.layout.root))
+            # if the original relative prefix is in the spec file use it
+            buildinfo = spec_dict.get('buildinfo', {})
+            old_relative_prefix = buildinfo.get('relative_prefix',
+                                                new_relative_prefix)
+            rel = buildinfo.get('relative_rpaths')
+            # if the original relative prefix and new relative prefix differ
+            # the directory layout has changed and the  buildcache cannot be
+            # installed if it was created with relative rpaths
+            info = 'old relative prefix %s\nnew relative prefix %s\n'
+            info += 'relative rpaths %s'
+            tty.debug(info %
+                      (old_relative_prefix, new_relative_prefix, rel))
+#           if (old_relative_prefix != new_relative_prefix and (rel)):
+#               shutil.rmtree(tmpdir)
+#               msg = "Package tarball was created from an install "
+#               msg += "prefix with a different directory layout. "
+#               msg += "It cannot be relocated because it "
+#               msg += "uses relative rpaths."
+#               raise NewLayoutException(msg)
+
+            present = [n for n in tarfile_names if n in names]
+            if not present:
+                raise InvalidTarballException(
+                    "Package tarball has no {0} or {1} archive.\n"
+                    "It cannot be installed.".format(*tarfile_names))
+
+            # if the checksums don't match don't install
+            _extract_payload(
+                spec, _HashingReader(spackfile.extractfile(present[0])),
+                bchecksum['hash'])
+    finally:
         shutil.rmtree(tmpdir)
-        raise NoChecksumException(
-            "Package tarball failed checksum verification.\n"
-            "It cannot be installed.")
-
-    new_relative_prefix = str(os.path.relpath(spec.prefix,
-                                              spack.store.layout.root))
-    # if the original relative prefix is in the spec file use it
-    buildinfo = spec_dict.get('buildinfo', {})
-    old_relative_prefix = buildinfo.get('relative_prefix', new_relative_prefix)
-    rel = buildinfo.get('relative_rpaths')
-    # if the original relative prefix and new relative prefix differ the
-    # directory layout has changed and the  buildcache cannot be installed
-    # if it was created with relative rpaths
-    info = 'old relative prefix %s\nnew relative prefix %s\nrelative rpaths %s'
-    tty.debug(info %
-              (old_relative_prefix, new_relative_prefix, rel))
-#    if (old_relative_prefix != new_relative_prefix and (rel)):
-#        shutil.rmtree(tmpdir)
-#        msg = "Package tarball was created from an install "
-#        msg += "prefix with a different directory layout. "
-#        msg += "It cannot be relocated because it "
-#        msg += "uses relative rpaths."
-#        raise NewLayoutException(msg)
-
-    # extract the tarball in a temp directory
-    with closing(tarfile.open(tarfile_path, 'r')) as tar:
-        tar.extractall(path=tmpdir)
-    # get the parent directory of the file .spack/binary_distribution
-    # this should the directory unpacked from the tarball whose
-    # name is unknown because the prefix naming is unknown
-    bindist_file = glob.glob('%s/*/.spack/binary_distribution' % tmpdir)[0]
-    workdir = re.sub('/.spack/binary_distribution$', '', bindist_file)
-    tty.debug('workdir %s' % workdir)
-    # install_tree copies hardlinks
-    # create a temporary tarfile from prefix and exract it to workdir
-    # tarfile preserves hardlinks
-    temp_tarfile_name = tarball_name(spec, '.tar')
-    temp_tarfile_path = os.path.join(tmpdir, temp_tarfile_name)
-    with closing(tarfile.open(temp_tarfile_path, 'w')) as tar:
-        tar.add(name='%s' % workdir,
-                arcname='.')
-    with closing(tarfile.open(temp_tarfile_path, 'r')) as tar:
-        tar.extractall(spec.prefix)
-    os.remove(temp_tarfile_path)
-
-    # cleanup
-    os.remove(tarfile_path)
-    os.remove(specfile_path)
 
     try:
         relocate_package(spec, allow_root)
@@ -753,23 +1154,117 @@ def extract_tarball(spec, filename, allow_root=False, unsigned=False,
             spec_id = spec.format('{name}/{hash:7}')
             tty.warn('No manifest file in tarball for spec %s' % spec_id)
     finally:
-        shutil.rmtree(tmpdir)
         if os.path.exists(filename):
             os.remove(filename)
 
 
+def _verify_specfile(specfile_path):
+    """Check the signature of the spec.yaml file of a binary package"""
+    if not os.path.exists('%s.asc' % specfile_path):
+        raise NoVerifyException(
+            "Package spec file failed signature verification.\n"
+            "Use spack buildcache keys to download "
+            "and install a key for verification from the mirror.")
+
+    suppress = config.get('config:suppress_gpg_warnings', False)
+    Gpg.verify('%s.asc' % specfile_path, specfile_path, suppress)
+
+
+def _safe_members(tar):
+    """Yield the members of ``tar``, and raise InvalidTarballException at
+    the first one that would be written outside of the extraction
+    directory: absolute paths, ``..`` components, hard links to such
+    paths, paths under symbolic links, and device files."""
+    def check(name, kind='path'):
+        parts = name.split('/')
+        if os.path.isabs(name) or '..' in parts:
+            raise InvalidTarballException(
+                "Package tarball contains the unsafe {0} {1}.\n"
+                "It cannot be installed.".format(kind, name))
+        for i in range(1, len(parts) + 1):
+            if '/'.join(parts[:i]) in symlinks:
+                raise InvalidTarballException(
+                    "Package tarball writes {0} through a symbolic link.\n"
+                    "It cannot be installed.".format(name))
+
+    symlinks = set()
+    for member in tar:
+        check(member.name)
+        if member.islnk():
+            check(member.linkname, 'hard link target')
+        elif member.isdev():
+            raise InvalidTarballException(
+                "Package tarball contains the device file {0}.\n"
+                "It cannot be installed.".format(member.name))
+        if member.issym():
+            symlinks.add(member.name.rstrip('/'))
+        yield member
+
+
+def _extract_payload(spec, payload, checksum):
+    """Extract the tarball of an install prefix from ``payload``, a
+    ``_HashingReader``, and move it to the prefix of ``spec`` if the sha256
+    checksum of the payload is ``checksum``.
+
+    The tarball is extracted in a hidden directory next to the prefix, so
+    that moving it in place is a rename, and nothing is installed if the
+    checksum doesn't match. Each byte of the payload is read only once.
+    Extracting with tarfile preserves hard links.
+    """
+    def check():
+        # tarfile may stop before the padding at the end of the stream
+        payload.drain()
+        if payload.hexdigest() != checksum:
+            raise NoChecksumException(
+                "Package tarball failed checksum verification.\n"
+                "It cannot be installed.")
+
+    parent = os.path.dirname(spec.prefix)
+    mkdirp(parent)
+    stagedir = tempfile.mkdtemp(
+        prefix='.%s-' % os.path.basename(spec.prefix), dir=parent)
+    try:
+        try:
+            with _open_payload(payload) as tar:
+                tar.extractall(path=stagedir, members=_safe_members(tar))
+        except Exception:
+            # Report a tampered payload rather than what it broke
+            check()
+            raise
+        check()
+
+        # get the parent directory of the file .spack/binary_distribution
+        # this should the directory unpacked from the tarball whose
+        # name is unknown because the prefix naming is unknown
+        bindist_file = glob.glob(
+            '%s/*/.spack/binary_distribution' % stagedir)[0]
+        workdir = re.sub('/.spack/binary_distribution$', '', bindist_file)
+        tty.debug('workdir %s' % workdir)
+        os.rename(workdir, spec.prefix)
+    finally:
+        shutil.rmtree(stagedir)
+
+
 # Internal cache for downloaded specs
 _cached_specs = set()
 
 
-def try_download_specs(urls=None, force=False):
+def try_download_specs(urls=None, force=False, spec_index=None):
     '''
-    Try to download the urls and cache them
+    Try to download the urls and cache them. The urls found in spec_index,
+    which maps urls to the contents of spec.yaml files, are not downloaded.
     '''
     global _cached_specs
     if urls is None:
         return {}
+    spec_index = spec_index or {}
     for link in urls:
+        if link in spec_index:
+            spec = Spec.from_dict(spec_index[link])
+            spec._mark_concrete()
+            _cached_specs.add(spec)
+            continue
+
         with Stage(link, name="build_cache", keep=True) as stage:
             if force and os.path.exists(stage.save_filename):
                 os.remove(stage.save_filename)
@@ -806,9 +1301,11 @@ def get_spec(spec=None, force=False):
     if _cached_specs and spec in _cached_specs:
         return _cached_specs
 
+    spec_index = {}
     for mirror in spack.mirror.MirrorCollection().values():
         fetch_url_build_cache = url_util.join(
             mirror.fetch_url, _build_cache_relative_path)
+        spec_index.update(_mirror_spec_index(fetch_url_build_cache, force))
 
         mirror_dir = url_util.local_file_path(fetch_url_build_cache)
         if mirror_dir:
@@ -822,7 +1319,7 @@ def get_spec(spec=None, force=False):
             link = url_util.join(fetch_url_build_cache, specfile_name)
             urls.add(link)
 
-    return try_download_specs(urls=urls, force=force)
+    return try_download_specs(urls=urls, force=force, spec_index=spec_index)
 
 
 def get_specs(force=False, allarch=False):
@@ -843,9 +1340,12 @@ def get_specs(force=False, allarch=False):
         return {}
 
     urls = set()
+    spec_index = {}
     for mirror in spack.mirror.MirrorCollection().values():
         fetch_url_build_cache = url_util.join(
             mirror.fetch_url, _build_cache_relative_path)
+        mirror_index = _mirror_spec_index(fetch_url_build_cache, force)
+        spec_index.update(mirror_index)
 
         mirror_dir = url_util.local_file_path(fetch_url_build_cache)
         if mirror_dir:
@@ -860,14 +1360,37 @@ def get_specs(force=False, allarch=False):
         else:
             tty.msg("Finding buildcaches at %s" %
                     url_util.format(fetch_url_build_cache))
-            p, links = web_util.spider(
-                url_util.join(fetch_url_build_cache, 'index.html'))
+            if mirror_index:
+                # The spec index lists the same files as index.html
+                links = mirror_index.keys()
+            else:
+                p, links = web_util.spider(
+                    url_util.join(fetch_url_build_cache, 'index.html'))
             for link in links:
                 m = arch_re.search(link)
                 if m:
                     urls.add(link)
 
-    return try_download_specs(urls=urls, force=force)
+    return try_download_specs(urls=urls, force=force, spec_index=spec_index)
+
+
+def _mirror_spec_index(fetch_url_build_cache, force=False):
+    """Return a dictionary mapping the urls of the spec.yaml files listed in
+    the spec index of a build cache to their contents."""
+    specs = get_spec_index(fetch_url_build_cache, force=force) or {}
+    return dict((url_util.join(fetch_url_build_cache, name), contents)
+                for name, contents in specs.items())
+
+
+def indexed_specfile_names(force=False):
+    """Return the names of the spec.yaml files listed in the spec indexes of
+    the build caches of all the configured mirrors."""
+    names = set()
+    for mirror in spack.mirror.MirrorCollection().values():
+        fetch_url_build_cache = url_util.join(
+            mirror.fetch_url, _build_cache_relative_path)
+        names.update(get_spec_index(fetch_url_build_cache, force=force) or {})
+    return names
 
 
 def get_keys(install=False, trust=False, force=False):
@@ -923,7 +1446,8 @@ def get_keys(install=False, trust=False, force=False):
                             'Use -t to install all downloaded keys')
 
 
-def needs_rebuild(spec, mirror_url, rebuild_on_errors=False):
+def needs_rebuild(spec, mirror_url, rebuild_on_errors=False,
+                  spec_index=None):
     if not spec.concrete:
         raise ValueError('spec must be concrete to check against mirror')
 
@@ -937,13 +1461,23 @@ def needs_rebuild(spec, mirror_url, rebuild_on_errors=False):
         pkg_name, pkg_version, pkg_hash, pkg_full_hash))
     tty.debug(spec.tree())
 
-    # Try to retrieve the .spec.yaml directly, based on the known
-    # format of the name, in order to determine if the package
-    # needs to be rebuilt.
     cache_prefix = build_cache_prefix(mirror_url)
     spec_yaml_file_name = tarball_name(spec, '.spec.yaml')
     file_path = os.path.join(cache_prefix, spec_yaml_file_name)
 
+    # The spec index of the mirror is enough to know that the package is
+    # up to date. Otherwise confirm it with the .spec.yaml itself, in case
+    # the index is not current.
+    if spec_index is None:
+        spec_index = get_spec_index(cache_prefix) or {}
+    indexed_spec_yaml = spec_index.get(spec_yaml_file_name, {})
+    if indexed_spec_yaml.get('full_hash') == pkg_full_hash:
+        return False
+
+    # Try to retrieve the .spec.yaml directly, based on the known
+    # format of the name, in order to determine if the package
+    # needs to be rebuilt.
+
     result_of_error = 'Package ({0}) will {1}be rebuilt'.format(
         spec.short_spec, '' if rebuild_on_errors else 'not ')
 
@@ -986,6 +1520,58 @@ def needs_rebuild(spec, mirror_url, rebuild_on_errors=False):
     return False
 
 
+def needs_rebuilds(specs, mirror_urls, rebuild_on_errors=False, jobs=None):
+    """Check many specs against the build caches on many mirrors at once.
+
+    The spec index of each mirror is read first, so that up to date specs
+    are found without any further request. The remaining checks are done
+    concurrently by a bounded pool of threads.
+
+    Arguments:
+        specs (iterable): concrete specs to be checked
+        mirror_urls (iterable): URLs of the mirrors
+        rebuild_on_errors (boolean): treat any errors encountered while
+            checking specs as a signal to rebuild package
+        jobs (int): number of concurrent checks
+
+    Returns:
+        Dictionary mapping each mirror URL to the list of the specs that
+        need to be rebuilt, in the order they were given.
+    """
+    specs, mirror_urls = list(specs), list(dedupe(mirror_urls))
+    for spec in specs:
+        if not spec.concrete:
+            raise ValueError('spec must be concrete to check against mirror')
+        # Compute the hashes once, before the specs are shared by threads
+        spec.dag_hash()
+        spec.full_hash()
+    spec_indexes = dict(
+        (url, get_spec_index(build_cache_prefix(url)) or {})
+        for url in mirror_urls)
+
+    checks = [(spec, url) for url in mirror_urls for spec in specs]
+    if not checks:
+        return dict((url, []) for url in mirror_urls)
+
+    def check(args):
+        spec, mirror_url = args
+        return needs_rebuild(spec, mirror_url, rebuild_on_errors,
+                             spec_index=spec_indexes[mirror_url])
+
+    tp = multiprocessing.pool.ThreadPool(
+        processes=min(len(checks), jobs or _mirror_concurrency))
+    try:
+        results = tp.map(check, checks)
+    finally:
+        tp.close()
+
+    rebuilds = dict((url, []) for url in mirror_urls)
+    for (spec, mirror_url), rebuild in zip(checks, results):
+        if rebuild:
+            rebuilds[mirror_url].append(spec)
+    return rebuilds
+
+
 def check_specs_against_mirrors(mirrors, specs, output_file=None,
                                 rebuild_on_errors=False):
     """Check all the given specs against buildcaches on the given mirrors and
@@ -1005,18 +1591,18 @@ def check_specs_against_mirrors(mirrors, specs, output_file=None,
     Returns: 1 if any spec was out-of-date on any mirror, 0 otherwise.
 
     """
-    rebuilds = {}
-    for mirror in spack.mirror.MirrorCollection(mirrors).values():
+    mirrors = list(spack.mirror.MirrorCollection(mirrors).values())
+    for mirror in mirrors:
         tty.msg('Checking for built specs at %s' % mirror.fetch_url)
+    rebuild_map = needs_rebuilds(
+        specs, [m.fetch_url for m in mirrors], rebuild_on_errors)
 
-        rebuild_list = []
-
-        for spec in specs:
-            if needs_rebuild(spec, mirror.fetch_url, rebuild_on_errors):
-                rebuild_list.append({
-                    'short_spec': spec.short_spec,
-                    'hash': spec.dag_hash()
-                })
+    rebuilds = {}
+    for mirror in mirrors:
+        rebuild_list = [{
+            'short_spec': spec.short_spec,
+            'hash': spec.dag_hash()
+        } for spec in rebuild_map[mirror.fetch_url]]
 
         if rebuild_list:
             rebuilds[mirror.fetch_url] = {
@@ -769,7 +769,7 @@ def modifications_from_dependencies(spec, context):
     return env
 
 
-def fork(pkg, function, dirty, fake):
+def fork(pkg, function, dirty, fake, jobs=None):
     """Fork a child process to do part of a spack build.
 
     Args:
@@ -781,6 +781,8 @@ def fork(pkg, function, dirty, fake):
         dirty (bool): If True, do NOT clean the environment before
             building.
         fake (bool): If True, skip package setup b/c it's not a real build
+        jobs (int): If not None, the value of ``config:build_jobs`` in the
+            child process, e.g. when several builds run at once
 
     Usage::
 
@@ -807,6 +809,11 @@ def child_process(child_pipe, input_stream):
         if input_stream is not None:
             sys.stdin = input_stream
 
+        # The child exits when done, so the scope is never removed
+        if jobs is not None:
+            spack.config.config.push_scope(spack.config.InternalConfigScope(
+                'build_jobs', {'config': {'build_jobs': jobs}}))
+
         try:
             if not fake:
                 setup_package(pkg, dirty=dirty)
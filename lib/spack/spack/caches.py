@@ -4,6 +4,7 @@
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
 """Caches used by Spack to store data"""
+import errno
 import os
 
 import llnl.util.lang
@@ -80,7 +81,13 @@ def symlink(self, mirror_ref):
                 # to https://github.com/spack/spack/pull/13908)
                 os.unlink(cosmetic_path)
             mkdirp(os.path.dirname(cosmetic_path))
-            os.symlink(relative_dst, cosmetic_path)
+            try:
+                os.symlink(relative_dst, cosmetic_path)
+            except OSError as e:
+                # Another process creating the mirror may have made the
+                # same link in the meantime
+                if e.errno != errno.EEXIST:
+                    raise
 
 
 #: Spack's local cache for downloaded source archives
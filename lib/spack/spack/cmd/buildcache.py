@@ -3,9 +3,11 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+import multiprocessing.pool
 import os
 import shutil
 import sys
+import time
 
 import llnl.util.tty as tty
 import spack.binary_distribution as bindist
@@ -32,6 +34,11 @@
 section = "packaging"
 level = "long"
 
+#: Default number of packages written at once by ``buildcache create``. Each
+#: of them is already compressed on all the cores, so this mostly overlaps
+#: signing and uploads.
+_default_create_jobs = 4
+
 
 def setup_parser(subparser):
     setup_parser.parser = subparser
@@ -73,6 +80,10 @@ def setup_parser(subparser):
                                             "building package(s)")
     create.add_argument('-y', '--spec-yaml', default=None,
                         help='Create buildcache entry for spec from yaml file')
+    create.add_argument('-j', '--jobs', type=int, default=None,
+                        help="number of packages written at once" +
+                             " (default: %d, at most the number of cores)" %
+                             _default_create_jobs)
     create.add_argument('--only', default='package,dependencies',
                         dest='things_to_install',
                         choices=['package', 'dependencies'],
@@ -325,7 +336,7 @@ def match_downloaded_specs(pkgs, allow_multiple_matches=False, force=False,
 
 def _createtarball(env, spec_yaml, packages, add_spec, add_deps,
                    output_location, key, force, rel, unsigned, allow_root,
-                   no_rebuild_index):
+                   no_rebuild_index, jobs=None):
     if spec_yaml:
         packages = set()
         with open(spec_yaml, 'r') as fd:
@@ -392,11 +403,64 @@ def _createtarball(env, spec_yaml, packages, add_spec, add_deps,
 
     tty.debug('writing tarballs to %s/build_cache' % outdir)
 
+    # Resolve the signing key once for all the packages
+    if not unsigned:
+        signkey = bindist.select_signing_key(signkey)
+
+    # Hashes are cached on the specs: compute them before sharing the specs
+    # between threads
+    specs = list(specs)
     for spec in specs:
+        spec.full_hash()
+
+    jobs = min(jobs or _default_create_jobs,
+               multiprocessing.cpu_count(), max(len(specs), 1))
+
+    def create(spec):
         tty.debug('creating binary cache file for package %s ' % spec.format())
-        bindist.build_tarball(spec, outdir, force, rel,
-                              unsigned, allow_root, signkey,
-                              not no_rebuild_index)
+        try:
+            # Threads building tarballs concurrently must not fork pools of
+            # processes to scan their prefixes, while the others may hold
+            # locks, nor oversubscribe the cores
+            return bindist.build_tarball(spec, outdir, force, rel,
+                                         unsigned, allow_root, signkey,
+                                         regenerate_index=False,
+                                         jobs=1 if jobs > 1 else None), None
+        except (Exception, SystemExit) as e:
+            # Pool workers only handle Exception: anything else, like the
+            # SystemExit raised by tty.die, would hang map() forever
+            return 0, e
+
+    start = time.time()
+    if jobs < 2:
+        results = [create(spec) for spec in specs]
+    else:
+        tp = multiprocessing.pool.ThreadPool(processes=jobs)
+        try:
+            results = tp.map(create, specs)
+        finally:
+            tp.close()
+            tp.join()
+    elapsed = time.time() - start
+
+    created = [size for size, error in results if error is None]
+    errors = [error for _, error in results if error is not None]
+
+    # Regenerate the index once, if anything was written
+    if created and not no_rebuild_index:
+        bindist.generate_package_index(
+            url_util.join(outdir, bindist.build_cache_relative_path()))
+
+    if created:
+        total = sum(created)
+        elapsed = max(elapsed, 1e-6)
+        tty.msg('Created {0} buildcache entries ({1:.1f} MB) in {2:.1f}s: '
+                '{3:.1f} MB/s, {4:.2f} specs/s'.format(
+                    len(created), total / 1e6, elapsed,
+                    total / 1e6 / elapsed, len(created) / elapsed))
+
+    if errors:
+        raise errors[0]
 
 
 def createtarball(args):
@@ -445,7 +509,8 @@ def createtarball(args):
 
     _createtarball(env, args.spec_yaml, args.specs, add_spec, add_deps,
                    output_location, args.key, args.force, args.rel,
-                   args.unsigned, args.allow_root, args.no_rebuild_index)
+                   args.unsigned, args.allow_root, args.no_rebuild_index,
+                   args.jobs)
 
 
 def installtarball(args):
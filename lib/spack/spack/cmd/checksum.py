@@ -29,6 +29,10 @@ def setup_parser(subparser):
     subparser.add_argument(
         '-b', '--batch', action='store_true',
         help="don't ask which versions to checksum")
+    subparser.add_argument(
+        '-j', '--jobs', type=int, default=None,
+        help="number of versions to fetch at once (default: %d)" %
+        spack.stage.checksum_jobs)
     arguments.add_common_arguments(subparser, ['package'])
     subparser.add_argument(
         'versions', nargs=argparse.REMAINDER,
@@ -66,7 +70,7 @@ def checksum(parser, args):
     version_lines = spack.stage.get_checksums_for_versions(
         url_dict, pkg.name, keep_stage=args.keep_stage,
         batch=(args.batch or len(args.versions) > 0),
-        fetch_options=pkg.fetch_options)
+        fetch_options=pkg.fetch_options, jobs=args.jobs)
 
     print()
     print(version_lines)
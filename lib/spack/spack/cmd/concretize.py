@@ -14,11 +14,15 @@ def setup_parser(subparser):
     subparser.add_argument(
         '-f', '--force', action='store_true',
         help="Re-concretize even if already concretized.")
+    subparser.add_argument(
+        '-j', '--jobs', type=int, default=None,
+        help="Concretize up to this many specs at once, when they are "
+        "concretized separately.")
 
 
 def concretize(parser, args):
     env = ev.get_env(args, 'concretize', required=True)
     with env.write_transaction():
-        concretized_specs = env.concretize(force=args.force)
+        concretized_specs = env.concretize(force=args.force, jobs=args.jobs)
         ev.display_specs(concretized_specs)
         env.write()
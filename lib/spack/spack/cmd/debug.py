@@ -72,7 +72,9 @@ def create_db_tarball(args):
 
     wd = os.path.dirname(str(spack.store.root))
     with working_dir(wd):
-        files = [spack.store.db._index_path]
+        db = spack.store.db
+        files = [f for f in (db._index_path, db._sqlite_path)
+                 if os.path.exists(f)]
         files += glob('%s/*/*/*/.spack/spec.yaml' % base)
         files = [os.path.relpath(f) for f in files]
 
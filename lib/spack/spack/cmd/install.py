@@ -44,6 +44,8 @@ def update_kwargs_from_args(args, kwargs):
         'explicit': True,  # Always true for install command
         'stop_at': args.until,
         'unsigned': args.unsigned,
+        'package_jobs': args.package_jobs,
+        'cooperative': args.cooperative,
     })
 
     kwargs.update({
@@ -75,6 +77,13 @@ def setup_parser(subparser):
         '-u', '--until', type=str, dest='until', default=None,
         help="phase to stop after when installing (default None)")
     arguments.add_common_arguments(subparser, ['jobs'])
+    subparser.add_argument(
+        '--package-jobs', type=int, default=1, metavar='N',
+        help="build up to N packages at once, sharing the build jobs")
+    subparser.add_argument(
+        '--cooperative', action='store_true',
+        help="share the installation with other spack processes, possibly "
+        "on other nodes, installing the same specs")
     subparser.add_argument(
         '--overwrite', action='store_true',
         help="reinstall an existing spec, even if it has dependents")
@@ -65,6 +65,13 @@ def setup_parser(subparser):
         '-n', '--versions-per-spec',
         help="the number of versions to fetch for each spec, choose 'all' to"
              " retrieve all versions of each package")
+    create_parser.add_argument(
+        '-j', '--jobs', type=int, default=None,
+        help="number of packages to fetch at once (default: one at a time)")
+    create_parser.add_argument(
+        '--connections-per-host', type=int, default=None,
+        help="maximum number of packages fetched from the same upstream"
+             " host at once (configured mirrors are not limited)")
     arguments.add_common_arguments(create_parser, ['specs'])
 
     # used to construct scope arguments below
@@ -344,7 +351,8 @@ def mirror_create(args):
 
     # Actually do the work to create the mirror
     present, mirrored, error = spack.mirror.create(
-        directory, mirror_specs, args.skip_unstable_versions)
+        directory, mirror_specs, args.skip_unstable_versions,
+        jobs=args.jobs, connections_per_host=args.connections_per_host)
     p, m, e = len(present), len(mirrored), len(error)
 
     verb = "updated" if existed else "created"
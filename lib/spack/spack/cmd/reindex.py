@@ -10,5 +10,16 @@
 level = "long"
 
 
+def setup_parser(subparser):
+    subparser.add_argument(
+        '-i', '--incremental', action='store_true', default=False,
+        help="only read the spec files of installations that changed "
+        "since the last reindex")
+    subparser.add_argument(
+        '-j', '--jobs', type=int, default=None,
+        help="number of processes reading spec files "
+        "(default: number of cores)")
+
+
 def reindex(parser, args):
-    spack.store.store.reindex()
+    spack.store.store.reindex(incremental=args.incremental, jobs=args.jobs)
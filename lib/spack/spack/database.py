@@ -20,6 +20,7 @@
 filesystem.
 """
 
+import binascii
 import contextlib
 import datetime
 import os
@@ -32,6 +33,11 @@
 except ImportError:
     _use_uuid = False
     pass
+try:
+    import sqlite3
+    _use_sqlite = True
+except ImportError:
+    _use_sqlite = False
 
 import llnl.util.tty as tty
 import six
@@ -86,12 +92,42 @@
 # Types of dependencies tracked by the database
 _tracked_deps = ('link', 'run')
 
+# Tables of the SQLite index. Each install record is stored as JSON, along
+# with the fields that queries filter on, and the generation of the write
+# that last changed it, so that readers only need to load what changed
+# since they last read the index.
+_sqlite_schema = """
+CREATE TABLE IF NOT EXISTS installs (
+    hash TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    installed INTEGER NOT NULL,
+    explicit INTEGER NOT NULL,
+    generation INTEGER NOT NULL,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS installs_name ON installs (name);
+CREATE INDEX IF NOT EXISTS installs_installed ON installs (installed);
+CREATE INDEX IF NOT EXISTS installs_explicit ON installs (explicit);
+CREATE INDEX IF NOT EXISTS installs_generation ON installs (generation);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
 
 def _now():
     """Returns the time since the epoch"""
     return time.time()
 
 
+def _new_sqlite_id():
+    """Returns a random id for a new SQLite index"""
+    if _use_uuid:
+        return str(uuid.uuid4())
+    return binascii.hexlify(os.urandom(16)).decode('ascii')
+
+
 def _autospec(function):
     """Decorator that automatically converts the argument of a single-arg
        function to a Spec."""
@@ -134,6 +170,56 @@ def canonicalize(cls, query_arg):
             return query_arg
 
 
+class _SpecReader(object):
+    """Construct the spec of an install record read from the database the
+    first time it is needed.
+
+    Args:
+        hash_key (str): DAG hash of the spec
+        node_dict (dict): node dictionary of the spec, as stored in the
+            database
+        read_dependents (callable): function constructing the specs of the
+            other records, called when the dependents of the spec are needed
+    """
+
+    def __init__(self, hash_key, node_dict, read_dependents):
+        self.hash_key = hash_key
+        self.node_dict = node_dict
+        self.name = next(iter(node_dict))
+        self.read_dependents = read_dependents
+
+        #: (record, deptypes) tuples for the dependencies of the spec
+        self.dependencies = []
+        self.spec = None
+
+    def __call__(self):
+        if self.spec is None:
+            self.spec = self._read()
+        return self.spec
+
+    def _read(self):
+        # Install records don't include hash with spec, so we add it in here
+        # to ensure it is read properly.
+        node_dict = dict(
+            (name, dict(node, hash=self.hash_key))
+            for name, node in self.node_dict.items())
+        try:
+            spec = spack.spec.Spec.from_node_dict(node_dict)
+        except Exception as e:
+            raise CorruptDatabaseError(
+                "Invalid record in Spack database: hash: %s, cause: %s: %s"
+                % (self.hash_key, type(e).__name__, str(e)))
+
+        # The dependencies are built first, so that all the specs read from
+        # the database share their nodes.  Specs are marked concrete only
+        # once their dependencies are connected, since that caches hashes.
+        for record, deptypes in self.dependencies:
+            spec._add_dependency(record.spec, deptypes)
+        spec._mark_concrete()
+        spec._dependents_reader = self.read_dependents
+        return spec
+
+
 class InstallRecord(object):
     """A record represents one installation in the DB.
 
@@ -149,8 +235,14 @@ class InstallRecord(object):
     actually remove from the database until a spec has no installed
     dependents left.
 
+    The spec of a record read from the database is only constructed when
+    it is first accessed.  A spec only knows the dependents whose specs were
+    constructed, so asking a spec read from the database for its dependents
+    constructs the specs of all the records.
+
     Args:
-        spec (Spec): spec tracked by the install record
+        spec (Spec): spec tracked by the install record, or a callable
+            returning it
         path (str): path where the spec has been installed
         installed (bool): whether or not the spec is currently installed
         ref_count (int): number of specs that depend on this one
@@ -169,7 +261,7 @@ def __init__(
             installation_time=None,
             deprecated_for=None
     ):
-        self.spec = spec
+        self._spec = spec
         self.path = str(path) if path else None
         self.installed = bool(installed)
         self.ref_count = ref_count
@@ -177,6 +269,17 @@ def __init__(
         self.installation_time = installation_time or _now()
         self.deprecated_for = deprecated_for
 
+    @property
+    def spec(self):
+        if not isinstance(self._spec, spack.spec.Spec):
+            self._spec = self._spec()
+        return self._spec
+
+    @property
+    def name(self):
+        """Name of the spec, which doesn't need the spec to be read."""
+        return self._spec.name
+
     def install_type_matches(self, installed):
         installed = InstallStatuses.canonicalize(installed)
         if self.installed:
@@ -188,7 +291,9 @@ def install_type_matches(self, installed):
 
     def to_dict(self):
         rec_dict = {
-            'spec': self.spec.to_node_dict(),
+            'spec': (self._spec.node_dict
+                     if isinstance(self._spec, _SpecReader)
+                     else self.spec.to_node_dict()),
             'path': self.path,
             'installed': self.installed,
             'ref_count': self.ref_count,
@@ -199,6 +304,11 @@ def to_dict(self):
             rec_dict.update({'deprecated_for': self.deprecated_for})
         return rec_dict
 
+    def state(self):
+        """Return the mutable fields of the record, to detect changes."""
+        return (self.path, self.installed, self.ref_count, self.explicit,
+                self.installation_time, self.deprecated_for)
+
     @classmethod
     def from_dict(cls, spec, dictionary):
         d = dict(dictionary.items())
@@ -211,6 +321,50 @@ def from_dict(cls, spec, dictionary):
         return InstallRecord(spec, **d)
 
 
+class _InstallRecords(dict):
+    """Install records by DAG hash, indexed by package name.
+
+    The index is maintained as records are added and removed, so that
+    queries for a package only look at the records of that package.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(_InstallRecords, self).__init__()
+        self.by_name = {}
+        self.update(*args, **kwargs)
+
+    def __setitem__(self, key, record):
+        super(_InstallRecords, self).__setitem__(key, record)
+        self.by_name.setdefault(record.name, set()).add(key)
+
+    def __delitem__(self, key):
+        record = self[key]
+        super(_InstallRecords, self).__delitem__(key)
+        keys = self.by_name[record.name]
+        keys.discard(key)
+        if not keys:
+            del self.by_name[record.name]
+
+    def update(self, *args, **kwargs):
+        for key, record in dict(*args, **kwargs).items():
+            self[key] = record
+
+    def pop(self, key, *default):
+        if key not in self:
+            return super(_InstallRecords, self).pop(key, *default)
+        record = self[key]
+        del self[key]
+        return record
+
+    def clear(self):
+        super(_InstallRecords, self).clear()
+        self.by_name.clear()
+
+    def with_names(self, names):
+        """Return the keys of the records of the packages in ``names``."""
+        return [key for name in names for key in self.by_name.get(name, ())]
+
+
 class ForbiddenLockError(SpackError):
     """Raised when an upstream DB attempts to acquire a lock"""
 
@@ -285,9 +439,11 @@ def __init__(self, root, db_dir=None, upstream_dbs=None,
         exist.  This is the ``db_dir``.
 
         The Database will attempt to read an ``index.json`` file in
-        ``db_dir``.  If that does not exist, it will create a database
-        when needed by scanning the entire Database root for ``spec.yaml``
-        files according to Spack's ``DirectoryLayout``.
+        ``db_dir``, or an ``index.db`` SQLite file if ``config:db_format``
+        is ``sqlite``.  An index in the other format is migrated.  If
+        neither exists, it will create a database when needed by scanning
+        the entire Database root for ``spec.yaml`` files according to
+        Spack's ``DirectoryLayout``.
 
         Caller may optionally provide a custom ``db_dir`` parameter
         where data will be stored. This is intended to be used for
@@ -300,7 +456,10 @@ def __init__(self, root, db_dir=None, upstream_dbs=None,
 
         # Set up layout of database files within the db dir
         self._index_path = os.path.join(self._db_dir, 'index.json')
+        self._sqlite_path = os.path.join(self._db_dir, 'index.db')
         self._verifier_path = os.path.join(self._db_dir, 'index_verifier')
+        self._format_path = os.path.join(self._db_dir, 'index_format')
+        self._reindex_state_path = os.path.join(self._db_dir, 'reindex.json')
         self._lock_path = os.path.join(self._db_dir, 'lock')
 
         # This is for other classes to use to lock prefix directories.
@@ -324,6 +483,18 @@ def __init__(self, root, db_dir=None, upstream_dbs=None,
         self.is_upstream = is_upstream
         self.last_seen_verifier = ''
 
+        # Format of the index, and state of the SQLite index when it was
+        # last read or written: the id of the index file, its generation,
+        # and the state of each record, or None if all of them are to be
+        # written.
+        self.db_format = spack.config.get('config:db_format', 'json')
+        if self.db_format == 'sqlite' and not _use_sqlite:
+            tty.warn('sqlite3 is not available, using a JSON database index')
+            self.db_format = 'json'
+        self._sqlite_id = None
+        self._sqlite_generation = -1
+        self._sqlite_state = None
+
         # initialize rest of state.
         self.db_lock_timeout = (
             spack.config.get('config:db_lock_timeout') or _db_lock_timeout)
@@ -337,13 +508,16 @@ def __init__(self, root, db_dir=None, upstream_dbs=None,
         tty.debug('PACKAGE LOCK TIMEOUT: {0}'.format(
                   str(timeout_format_str)))
 
+        # Whether the specs of all the records in _data were constructed
+        self._specs_read = True
+
         if self.is_upstream:
             self.lock = ForbiddenLock()
         else:
             self.lock = lk.Lock(self._lock_path,
                                 default_timeout=self.db_lock_timeout,
                                 desc='database')
-        self._data = {}
+        self._data = _InstallRecords()
 
         self.upstream_dbs = list(upstream_dbs) if upstream_dbs else []
 
@@ -575,22 +749,6 @@ def _write_to_file(self, stream):
         except (TypeError, ValueError) as e:
             raise sjson.SpackJSONError("error writing JSON database:", str(e))
 
-    def _read_spec_from_dict(self, hash_key, installs):
-        """Recursively construct a spec from a hash in a YAML database.
-
-        Does not do any locking.
-        """
-        spec_dict = installs[hash_key]['spec']
-
-        # Install records don't include hash with spec, so we add it in here
-        # to ensure it is read properly.
-        for name in spec_dict:
-            spec_dict[name]['hash'] = hash_key
-
-        # Build spec from dict first.
-        spec = spack.spec.Spec.from_node_dict(spec_dict)
-        return spec
-
     def db_for_spec_hash(self, hash_key):
         with self.read_transaction():
             if hash_key in self._data:
@@ -613,12 +771,12 @@ def query_by_spec_hash(self, hash_key, data=None):
         return False, None
 
     def _assign_dependencies(self, hash_key, installs, data):
-        # Add dependencies from other records in the install DB to
-        # form a full spec.
-        spec = data[hash_key].spec
+        # Find the records of the dependencies in the install DB, to form
+        # a full spec when it is read.
+        reader = data[hash_key]._spec
         spec_dict = installs[hash_key]['spec']
-        if 'dependencies' in spec_dict[spec.name]:
-            yaml_deps = spec_dict[spec.name]['dependencies']
+        if 'dependencies' in spec_dict[reader.name]:
+            yaml_deps = spec_dict[reader.name]['dependencies']
             for dname, dhash, dtypes in spack.spec.Spec.read_yaml_dep_specs(
                     yaml_deps):
                 # It is important that we always check upstream installations
@@ -630,19 +788,17 @@ def _assign_dependencies(self, hash_key, installs, data):
                 # depends on, so the convention ensures that this isn't an
                 # issue.
                 upstream, record = self.query_by_spec_hash(dhash, data=data)
-                child = record.spec if record else None
 
-                if not child:
+                if not record:
                     msg = ("Missing dependency not in database: "
-                           "%s needs %s-%s" % (
-                               spec.cformat('{name}{/hash:7}'),
-                               dname, dhash[:7]))
+                           "%s/%s needs %s-%s" % (
+                               reader.name, hash_key[:7], dname, dhash[:7]))
                     if self._fail_when_missing_deps:
                         raise MissingDependenciesError(msg)
                     tty.warn(msg)
                     continue
 
-                spec._add_dependency(child, dtypes)
+                reader.dependencies.append((record, dtypes))
 
     def _read_from_file(self, filename):
         """Fill database from file, do not maintain old data.
@@ -692,38 +848,56 @@ def check(cond, msg):
                     (k, v.to_dict()) for k, v in self._data.items()
                 )
 
+        data = _InstallRecords()
+        self._read_records(installs, data)
+        self._data = data
+
+    def _read_records(self, installs, data):
+        """Add install records read from an index to ``data``.
+
+        ``installs`` maps hashes to install records in dictionary form.
+        The specs of the new records share the nodes of the specs that are
+        already in ``data``.  Records already in ``data`` only have their
+        fields updated, since the spec of a hash never changes.
+
+        Does not do any locking.
+        """
         def invalid_record(hash_key, error):
             msg = ("Invalid record in Spack database: "
                    "hash: %s, cause: %s: %s")
             msg %= (hash_key, type(error).__name__, str(error))
             raise CorruptDatabaseError(msg, self._index_path)
 
-        # Build up the database in three passes:
+        # Build up the database in two passes:
         #
-        #   1. Read in all specs without dependencies.
-        #   2. Hook dependencies up among specs.
-        #   3. Mark all specs concrete.
+        #   1. Read in all records, without their specs.
+        #   2. Find the records of the dependencies of each spec.
         #
-        # The database is built up so that ALL specs in it share nodes
-        # (i.e., its specs are a true Merkle DAG, unlike most specs.)
+        # Specs are only constructed when they are first needed, from the
+        # specs of their dependencies, so that ALL specs in the database
+        # share nodes (i.e., its specs are a true Merkle DAG, unlike most
+        # specs.)
 
-        # Pass 1: Iterate through database and build specs w/o dependencies
-        data = {}
+        # Pass 1: Iterate through database and create the records
+        new_keys = []
         for hash_key, rec in installs.items():
             try:
-                # This constructs a spec DAG from the list of all installs
-                spec = self._read_spec_from_dict(hash_key, installs)
-
-                # Insert the brand new spec in the database.  Each
-                # spec has its own copies of its dependency specs.
-                # TODO: would a more immmutable spec implementation simplify
-                #       this?
-                data[hash_key] = InstallRecord.from_dict(spec, rec)
+                if hash_key in data:
+                    data[hash_key] = InstallRecord.from_dict(
+                        data[hash_key]._spec, rec)
+                    continue
+
+                reader = _SpecReader(hash_key, rec['spec'], self._read_specs)
+                data[hash_key] = InstallRecord.from_dict(reader, rec)
+                new_keys.append(hash_key)
             except Exception as e:
                 invalid_record(hash_key, e)
 
-        # Pass 2: Assign dependencies once all specs are created.
-        for hash_key in data:
+        if new_keys:
+            self._specs_read = False
+
+        # Pass 2: Assign dependencies once all records are created.
+        for hash_key in new_keys:
             try:
                 self._assign_dependencies(hash_key, installs, data)
             except MissingDependenciesError:
@@ -731,20 +905,136 @@ def invalid_record(hash_key, error):
             except Exception as e:
                 invalid_record(hash_key, e)
 
-        # Pass 3: Mark all specs concrete.  Specs representing real
-        # installations must be explicitly marked.
-        # We do this *after* all dependencies are connected because if we
-        # do it *while* we're constructing specs,it causes hashes to be
-        # cached prematurely.
-        for hash_key, rec in data.items():
-            rec.spec._mark_concrete()
+    def _connect(self):
+        """Open a connection to the SQLite index.
+
+        Connections are not kept across transactions, since they cannot be
+        used by forked processes.
+        """
+        conn = sqlite3.connect(self._sqlite_path)
+        conn.text_factory = str
+        return conn
+
+    def _read_from_sqlite(self):
+        """Update the database from the SQLite index, loading only the
+        records written since it was last read.
 
+        Does not do any locking.
+        """
+        try:
+            with contextlib.closing(self._connect()) as conn:
+                meta = dict(conn.execute('SELECT key, value FROM meta'))
+                db_id = meta.get('id')
+                generation = int(meta['generation'])
+
+                # Generations restart when the index is created again, so
+                # they only compare within the same file
+                since = self._sqlite_generation
+                if db_id != self._sqlite_id or generation < since:
+                    since = -1
+                elif generation == since:
+                    return
+
+                version = Version(meta['version'])
+                if version > _db_version:
+                    raise InvalidDatabaseVersionError(_db_version, version)
+
+                hashes = set(row[0] for row in conn.execute(
+                    'SELECT hash FROM installs'))
+                installs = dict(
+                    (hash_key, sjson.load(record))
+                    for hash_key, record in conn.execute(
+                        'SELECT hash, record FROM installs '
+                        'WHERE generation > ?', (since,)))
+        except InvalidDatabaseVersionError:
+            raise
+        except Exception as e:
+            raise CorruptDatabaseError(
+                "error reading database:", str(e))
+
+        # Records that are not in the index anymore were removed
+        data = _InstallRecords()
+        if since >= 0:
+            data.update((k, v) for k, v in self._data.items() if k in hashes)
+        self._read_records(installs, data)
         self._data = data
+        self._sqlite_id = db_id
+        self._sqlite_generation = generation
+        self._sqlite_state = dict(
+            (k, v.state()) for k, v in self._data.items())
+
+    def _write_to_sqlite(self):
+        """Write the install records that changed since the SQLite index
+        was last read or written to it, in a single transaction.
+
+        This function does not do any locking.
+        """
+        state = dict((k, v.state()) for k, v in self._data.items())
+        with contextlib.closing(self._connect()) as conn:
+            conn.executescript(_sqlite_schema)
+            with conn:
+                meta = dict(conn.execute('SELECT key, value FROM meta'))
+                db_id = meta.get('id')
+                generation = int(meta.get('generation', -1)) + 1
+
+                # Only write what changed if the index is the one that was
+                # last read or written
+                old_state = self._sqlite_state
+                if db_id is None or db_id != self._sqlite_id:
+                    old_state = None
+                    if db_id is None:
+                        db_id = _new_sqlite_id()
+                if old_state is None:
+                    changed, removed = list(state), []
+                    conn.execute('DELETE FROM installs')
+                else:
+                    changed = [k for k, v in state.items()
+                               if old_state.get(k) != v]
+                    removed = [k for k in old_state if k not in state]
+                conn.executemany('DELETE FROM installs WHERE hash = ?',
+                                 [(k,) for k in removed])
+                rows = []
+                for k in changed:
+                    rec = self._data[k]
+                    rows.append((k, rec.name, int(rec.installed),
+                                 int(rec.explicit), generation,
+                                 sjson.dump(rec.to_dict())))
+                conn.executemany('INSERT OR REPLACE INTO installs '
+                                 'VALUES (?, ?, ?, ?, ?, ?)', rows)
+                conn.executemany(
+                    'INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                    [('version', str(_db_version)),
+                     ('id', db_id),
+                     ('generation', str(generation))])
+
+        self._sqlite_id = db_id
+        self._sqlite_generation = generation
+        self._sqlite_state = state
+
+    def _migrate(self):
+        """Write the index, just read in the other format, in the configured
+        format.
+
+        Takes a write lock.
+        """
+        tty.msg('Migrating the Spack database index to {0}'
+                .format(self.db_format))
+        self._sqlite_state = None
+        with lk.WriteTransaction(self.lock, release=self._write):
+            pass
 
-    def reindex(self, directory_layout):
+    def reindex(self, directory_layout, incremental=False, jobs=None):
         """Build database index from scratch based on a directory layout.
 
         Locks the DB if it isn't locked already.
+
+        Args:
+            directory_layout: layout of the installations to index
+            incremental (bool): reuse the records of the installations whose
+                spec files did not change since the last reindex instead of
+                reading their spec files again
+            jobs (int): number of processes reading spec files (default:
+                number of cores)
         """
         if self.is_upstream:
             raise UpstreamDatabaseLockingError(
@@ -754,11 +1044,17 @@ def reindex(self, directory_layout):
         # ignore errors if we need to rebuild a corrupt database.
         def _read_suppress_error():
             try:
-                if os.path.isfile(self._index_path):
+                index_format = self._index_format()
+                if index_format == 'sqlite':
+                    self._read_from_sqlite()
+                elif index_format == 'json':
                     self._read_from_file(self._index_path)
             except CorruptDatabaseError as e:
                 self._error = e
-                self._data = {}
+                self._data = _InstallRecords()
+
+            # Write every record of the new index
+            self._sqlite_state = None
 
         transaction = lk.WriteTransaction(
             self.lock, acquire=_read_suppress_error, release=self._write
@@ -775,10 +1071,11 @@ def _read_suppress_error():
             old_data = self._data
             try:
                 self._construct_from_directory_layout(
-                    directory_layout, old_data)
+                    directory_layout, old_data, incremental, jobs)
             except BaseException:
                 # If anything explodes, restore old data, skip write.
                 self._data = old_data
+                self._specs_read = False
                 raise
 
     def _construct_entry_from_directory_layout(self, directory_layout,
@@ -806,69 +1103,148 @@ def _construct_entry_from_directory_layout(self, directory_layout,
         if deprecator:
             self._deprecate(spec, deprecator)
 
-    def _construct_from_directory_layout(self, directory_layout, old_data):
+    def _read_reindex_state(self, root):
+        """Return a dictionary mapping the spec files under ``root``,
+        relative to it, to their modification time and hash at the last
+        reindex."""
+        try:
+            with open(self._reindex_state_path) as f:
+                state = sjson.load(f)
+        except (IOError, OSError, ValueError) as e:
+            tty.debug(e)
+            return {}
+
+        if state.get('root') != root:
+            return {}
+        return state.get('spec_files', {})
+
+    def _write_reindex_state(self, root, spec_files):
+        """Record the modification time and hash of the spec files read by
+        a reindex of the installations under ``root``.
+
+        Does no locking.
+        """
+        temp_file = self._reindex_state_path + (
+            '.%s.%s.temp' % (socket.getfqdn(), os.getpid()))
+        try:
+            with open(temp_file, 'w') as f:
+                sjson.dump({'root': root, 'spec_files': spec_files}, f)
+            os.rename(temp_file, self._reindex_state_path)
+        except BaseException:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
+
+    def _construct_from_directory_layout(self, directory_layout, old_data,
+                                         incremental=False, jobs=None):
         # Read first the `spec.yaml` files in the prefixes. They should be
         # considered authoritative with respect to DB reindexing, as
         # entries in the DB may be corrupted in a way that still makes
         # them readable. If we considered DB entries authoritative
         # instead, we would perpetuate errors over a reindex.
+        root = directory_layout.root
+        spec_files = directory_layout.all_spec_files()
+        deprecated_files = directory_layout.all_deprecated_spec_files()
+        mtimes = dict(
+            (path, os.stat(path).st_mtime) for path in
+            spec_files + [p for pair in deprecated_files for p in pair])
+
+        # In incremental mode, a spec file that was not modified since the
+        # last reindex is trusted to still hold the spec of its old record
+        specs = {}
+        if incremental:
+            state = self._read_reindex_state(root)
+            for path, mtime in mtimes.items():
+                last = state.get(os.path.relpath(path, root))
+                if last and last[0] == mtime and last[1] in old_data:
+                    specs[path] = old_data[last[1]].spec
+            tty.debug('REINDEX: {0} of {1} spec files unchanged'.format(
+                len(specs), len(mtimes)))
+
+        specs.update(directory_layout.read_specs(
+            [path for path in mtimes if path not in specs], jobs))
+
         with directory_layout.disable_upstream_check():
-            # Initialize data in the reconstructed DB
-            self._data = {}
-
-            # Start inspecting the installed prefixes
-            processed_specs = set()
-
-            for spec in directory_layout.all_specs():
-                self._construct_entry_from_directory_layout(directory_layout,
-                                                            old_data, spec)
-                processed_specs.add(spec)
-
-            for spec, deprecator in directory_layout.all_deprecated_specs():
-                self._construct_entry_from_directory_layout(directory_layout,
-                                                            old_data, spec,
-                                                            deprecator)
-                processed_specs.add(spec)
-
-            for key, entry in old_data.items():
-                # We already took care of this spec using
-                # `spec.yaml` from its prefix.
-                if entry.spec in processed_specs:
-                    msg = 'SKIPPING RECONSTRUCTION FROM OLD DB: {0}'
-                    msg += ' [already reconstructed from spec.yaml]'
-                    tty.debug(msg.format(entry.spec))
-                    continue
+            with directory_layout.read_spec_cache(specs):
+                self._construct_from_specs(
+                    directory_layout, old_data, specs,
+                    spec_files, deprecated_files)
+
+        self._write_reindex_state(root, dict(
+            (os.path.relpath(path, root), [mtime, specs[path].dag_hash()])
+            for path, mtime in mtimes.items()))
+
+    def _construct_from_specs(self, directory_layout, old_data, specs,
+                              spec_files, deprecated_files):
+        # Initialize data in the reconstructed DB
+        self._data = _InstallRecords()
+
+        # Start inspecting the installed prefixes
+        processed_specs = set()
+
+        for path in spec_files:
+            spec = specs[path]
+            self._construct_entry_from_directory_layout(directory_layout,
+                                                        old_data, spec)
+            processed_specs.add(spec)
+
+        for path, deprecator_path in deprecated_files:
+            spec = specs[path]
+            self._construct_entry_from_directory_layout(
+                directory_layout, old_data, spec, specs[deprecator_path])
+            processed_specs.add(spec)
+
+        for key, entry in old_data.items():
+            # We already took care of this spec using
+            # `spec.yaml` from its prefix.
+            if entry.spec in processed_specs:
+                msg = 'SKIPPING RECONSTRUCTION FROM OLD DB: {0}'
+                msg += ' [already reconstructed from spec.yaml]'
+                tty.debug(msg.format(entry.spec))
+                continue
 
-                # If we arrived here it very likely means that
-                # we have external specs that are not dependencies
-                # of other specs. This may be the case for externally
-                # installed compilers or externally installed
-                # applications.
-                tty.debug(
-                    'RECONSTRUCTING FROM OLD DB: {0}'.format(entry.spec))
-                try:
-                    layout = spack.store.layout
-                    if entry.spec.external:
-                        layout = None
-                        install_check = True
-                    else:
-                        install_check = layout.check_installed(entry.spec)
-
-                    if install_check:
-                        kwargs = {
-                            'spec': entry.spec,
-                            'directory_layout': layout,
-                            'explicit': entry.explicit,
-                            'installation_time': entry.installation_time  # noqa: E501
-                        }
-                        self._add(**kwargs)
-                        processed_specs.add(entry.spec)
-                except Exception as e:
-                    # Something went wrong, so the spec was not restored
-                    # from old data
-                    tty.debug(e)
-
-            self._check_ref_counts()
+            # If we arrived here it very likely means that
+            # we have external specs that are not dependencies
+            # of other specs. This may be the case for externally
+            # installed compilers or externally installed
+            # applications.
+            tty.debug(
+                'RECONSTRUCTING FROM OLD DB: {0}'.format(entry.spec))
+            try:
+                layout = spack.store.layout
+                if entry.spec.external:
+                    layout = None
+                    install_check = True
+                else:
+                    install_check = layout.check_installed(entry.spec)
+
+                if install_check:
+                    kwargs = {
+                        'spec': entry.spec,
+                        'directory_layout': layout,
+                        'explicit': entry.explicit,
+                        'installation_time': entry.installation_time  # noqa: E501
+                    }
+                    self._add(**kwargs)
+                    processed_specs.add(entry.spec)
+            except Exception as e:
+                # Something went wrong, so the spec was not restored
+                # from old data
+                tty.debug(e)
+
+        self._check_ref_counts()
+
+    def _read_specs(self):
+        """Construct the specs of all the install records that were not
+        read yet, so that the specs know all their installed dependents.
+
+        Does no locking.
+        """
+        if self._specs_read:
+            return
+        for rec in self._data.values():
+            rec.spec
+        self._specs_read = True
 
     def _check_ref_counts(self):
         """Ensure consistency of reference counts in the DB.
@@ -909,8 +1285,15 @@ def _write(self, type, value, traceback):
 
         This routine does no locking.
         """
-        # Do not write if exceptions were raised
+        # Do not write if exceptions were raised, and read all the records
+        # again at the start of the next transaction
         if type is not None:
+            self._sqlite_generation = -1
+            return
+
+        if self.db_format == 'sqlite':
+            self._write_to_sqlite()
+            self._write_index_format()
             return
 
         temp_file = self._index_path + (
@@ -932,15 +1315,68 @@ def _write(self, type, value, traceback):
             if os.path.exists(temp_file):
                 os.remove(temp_file)
             raise
+        self._write_index_format()
+
+    def _read_index_format(self):
+        """Return the format of the index written last, as recorded in the
+        index_format file, or None if it isn't recorded."""
+        try:
+            with open(self._format_path, 'r') as f:
+                return f.read().strip() or None
+        except (IOError, OSError):
+            return None
+
+    def _write_index_format(self):
+        """Record that the index was written last in the configured format.
+
+        Called with the write lock held, after the index is written.
+        """
+        if self._read_index_format() == self.db_format:
+            return
+        temp_file = self._format_path + (
+            '.%s.%s.temp' % (socket.getfqdn(), os.getpid()))
+        try:
+            with open(temp_file, 'w') as f:
+                f.write(self.db_format)
+            os.rename(temp_file, self._format_path)
+        except BaseException:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
+
+    def _index_format(self):
+        """Return the format of the index to read, or None if there is no
+        index.
+
+        Processes configured with different formats can share a database,
+        and leave an index in each format: only the one written last, as
+        recorded by ``_write_index_format``, is up to date. Databases that
+        don't record it were written by versions of Spack that only write
+        ``index.json``.
+        """
+        paths = {'json': self._index_path}
+        if _use_sqlite:
+            paths['sqlite'] = self._sqlite_path
+
+        recorded = self._read_index_format()
+        if recorded in paths and os.path.exists(paths[recorded]):
+            return recorded
+        for index_format in ('json', 'sqlite'):
+            if index_format in paths and os.path.exists(paths[index_format]):
+                return index_format
+        return None
 
     def _read(self):
         """Re-read Database from the data in the set location.
 
         This does no locking, with one exception: it will automatically
         try to regenerate a missing DB if local. This requires taking a
-        write lock.
+        write lock, and to migrate an index in the other format.
         """
-        if os.path.isfile(self._index_path):
+        index_format = self._index_format()
+        if index_format == 'sqlite':
+            self._read_from_sqlite()
+        elif index_format == 'json':
             current_verifier = ''
             if _use_uuid:
                 try:
@@ -953,6 +1389,11 @@ def _read(self):
                 self.last_seen_verifier = current_verifier
                 # Read from file if a database exists
                 self._read_from_file(self._index_path)
+
+        if index_format is not None:
+            # The index in the configured format is missing or outdated
+            if index_format != self.db_format and not self.is_upstream:
+                self._migrate()
             return
         elif self.is_upstream:
             raise UpstreamDatabaseLockingError(
@@ -1373,31 +1814,40 @@ def _query(
             else:
                 return []
 
-        # Abstract specs require more work -- currently we test
-        # against everything.
-        results = []
-        start_date = start_date or datetime.datetime.min
-        end_date = end_date or datetime.datetime.max
+        # Abstract specs require more work -- we test against the records
+        # of the packages that may satisfy them.
+        if query_spec is not any and \
+                not isinstance(query_spec, spack.spec.Spec):
+            query_spec = spack.spec.Spec(query_spec)
+        keys = self._query_candidates(query_spec)
+        if hashes is not None:
+            keys = [key for key in keys if key in hashes]
 
-        for key, rec in self._data.items():
-            if hashes is not None and rec.spec.dag_hash() not in hashes:
-                continue
+        # Whether packages are known, by name
+        known_names = {}
 
+        results = []
+        for key in keys:
+            rec = self._data[key]
             if not rec.install_type_matches(installed):
                 continue
 
             if explicit is not any and rec.explicit != explicit:
                 continue
 
-            if known is not any and spack.repo.path.exists(
-                    rec.spec.name) != known:
-                continue
+            if known is not any:
+                if rec.name not in known_names:
+                    known_names[rec.name] = spack.repo.path.exists(rec.name)
+                if known_names[rec.name] != known:
+                    continue
 
-            inst_date = datetime.datetime.fromtimestamp(
-                rec.installation_time
-            )
-            if not (start_date < inst_date < end_date):
-                continue
+            if start_date or end_date:
+                inst_date = datetime.datetime.fromtimestamp(
+                    rec.installation_time
+                )
+                if not ((start_date or datetime.datetime.min) < inst_date <
+                        (end_date or datetime.datetime.max)):
+                    continue
 
             if (query_spec is any or
                 rec.spec.satisfies(query_spec, strict=True)):
@@ -1405,6 +1855,23 @@ def _query(
 
         return results
 
+    def _query_candidates(self, query_spec):
+        """Return the keys of the records whose specs may satisfy an abstract
+        query spec: the records of the package it names, or of the providers
+        of the virtual package it names.
+
+        Does no locking.
+        """
+        if query_spec is any or not query_spec.name:
+            return list(self._data)
+
+        # Packages that Spack doesn't know anymore may still be installed
+        if not spack.repo.path.is_virtual(query_spec.name):
+            return self._data.with_names([query_spec.name])
+
+        providers = spack.repo.path.providers_for(query_spec.name)
+        return self._data.with_names(set(p.name for p in providers))
+
     _query.__doc__ += _query_docstring
 
     def query_local(self, *args, **kwargs):
@@ -1416,6 +1883,17 @@ def query_local(self, *args, **kwargs):
 
     def query(self, *args, **kwargs):
         """Query the Spack database including all upstream databases."""
+        # A concrete spec is looked up by hash, and the local database takes
+        # precedence over upstream ones, so stop at the first one having it
+        query_spec = args[0] if args else kwargs.get('query_spec', any)
+        if isinstance(query_spec, spack.spec.Spec) and query_spec.concrete:
+            results = self.query_local(*args, **kwargs)
+            for upstream_db in self.upstream_dbs:
+                if results:
+                    break
+                results = upstream_db._query(*args, **kwargs) or []
+            return results
+
         upstream_results = []
         for upstream_db in self.upstream_dbs:
             # queries for upstream DBs need to *not* lock - we may not
@@ -6,6 +6,7 @@
 import os
 import shutil
 import glob
+import multiprocessing
 import tempfile
 import re
 from contextlib import contextmanager
@@ -16,6 +17,7 @@
 
 import spack.config
 import spack.spec
+import spack.util.spack_json as sjson
 from spack.error import SpackError
 
 
@@ -25,6 +27,38 @@ def _check_concrete(spec):
         raise ValueError('Specs passed to a DirectoryLayout must be concrete!')
 
 
+def _load_spec_data(path):
+    """Parse the YAML spec file at ``path``, resolving only basic tags."""
+    with open(path) as f:
+        return yaml.safe_load(f)
+
+
+def _load_spec_file(path):
+    """Parse the YAML spec file at ``path`` and return its contents as JSON,
+    which is much faster to load than YAML, along with an error message if
+    the file could not be read."""
+    try:
+        return sjson.dump(_load_spec_data(path)), None
+    except Exception as e:
+        return None, str(e)
+
+
+def _spec_from_file(path, load):
+    """Construct the concrete spec stored at ``path`` from the data returned
+    by ``load(path)``, raising SpecReadError if it cannot be read."""
+    try:
+        spec = spack.spec.Spec.from_dict(load(path))
+    except Exception as e:
+        if spack.config.get('config:debug'):
+            raise
+        raise SpecReadError(
+            'Unable to read file: %s' % path, 'Cause: ' + str(e))
+
+    # Specs read from actual installations are always concrete
+    spec._mark_concrete()
+    return spec
+
+
 class DirectoryLayout(object):
     """A directory layout is used to associate unique paths with specs.
        Different installations are going to want differnet layouts for their
@@ -207,6 +241,9 @@ def __init__(self, root, **kwargs):
         self.packages_dir        = 'repos'  # archive of package.py files
         self.manifest_file_name  = 'install_manifest.json'
 
+        # Specs already read from spec files, see read_spec_cache()
+        self._spec_cache = {}
+
     @property
     def hidden_file_paths(self):
         return (self.metadata_dir,)
@@ -225,18 +262,52 @@ def write_spec(self, spec, path):
 
     def read_spec(self, path):
         """Read the contents of a file and parse them as a spec"""
+        if path in self._spec_cache:
+            return self._spec_cache[path]
+        return _spec_from_file(path, _load_spec_data)
+
+    def read_specs(self, paths, jobs=None):
+        """Read many spec files, parsing them with a pool of processes.
+
+        Args:
+            paths (list): paths of the spec files to read
+            jobs (int): number of processes used to parse the files
+                (default: number of cores)
+
+        Returns:
+            Dictionary mapping each path to the spec read from it
+        """
+        paths = [p for p in paths if p not in self._spec_cache]
+        jobs = min(jobs or multiprocessing.cpu_count(), len(paths))
+        if jobs < 2 or spack.config.get('config:debug'):
+            return dict((p, self.read_spec(p)) for p in paths)
+
+        pool = multiprocessing.Pool(processes=jobs)
+        try:
+            results = pool.map(_load_spec_file, paths)
+        finally:
+            pool.close()
+            pool.join()
+
+        results = dict(zip(paths, results))
+
+        def load(path):
+            data, error = results[path]
+            if error is not None:
+                raise ValueError(error)
+            return sjson.load(data)
+
+        return dict((p, _spec_from_file(p, load)) for p in paths)
+
+    @contextmanager
+    def read_spec_cache(self, specs):
+        """Use the specs in ``specs``, a dictionary mapping paths of spec
+        files to specs, instead of reading those files again."""
+        self._spec_cache = specs
         try:
-            with open(path) as f:
-                spec = spack.spec.Spec.from_yaml(f)
-        except Exception as e:
-            if spack.config.get('config:debug'):
-                raise
-            raise SpecReadError(
-                'Unable to read file: %s' % path, 'Cause: ' + str(e))
-
-        # Specs read from actual installations are always concrete
-        spec._mark_concrete()
-        return spec
+            yield
+        finally:
+            self._spec_cache = {}
 
     def spec_file_path(self, spec):
         """Gets full path to spec file"""
@@ -332,17 +403,19 @@ def check_installed(self, spec):
             raise InconsistentInstallDirectoryError(
                 'Spec file in %s does not match hash!' % spec_file_path)
 
-    def all_specs(self):
+    def all_spec_files(self):
+        """Return the paths of the spec files of all the installations."""
         if not os.path.isdir(self.root):
             return []
 
         path_elems = ["*"] * len(self.path_scheme.split(os.sep))
         path_elems += [self.metadata_dir, self.spec_file_name]
         pattern = os.path.join(self.root, *path_elems)
-        spec_files = glob.glob(pattern)
-        return [self.read_spec(s) for s in spec_files]
+        return glob.glob(pattern)
 
-    def all_deprecated_specs(self):
+    def all_deprecated_spec_files(self):
+        """Return pairs with the path of the spec file of each deprecated
+        installation and the path of the spec file of its deprecator."""
         if not os.path.isdir(self.root):
             return []
 
@@ -353,8 +426,19 @@ def all_deprecated_specs(self):
         spec_files = glob.glob(pattern)
         get_depr_spec_file = lambda x: os.path.join(
             os.path.dirname(os.path.dirname(x)), self.spec_file_name)
-        return set((self.read_spec(s), self.read_spec(get_depr_spec_file(s)))
-                   for s in spec_files)
+        return [(s, get_depr_spec_file(s)) for s in spec_files]
+
+    def all_specs(self, jobs=None):
+        spec_files = self.all_spec_files()
+        specs = self.read_specs(spec_files, jobs)
+        return [specs.get(s) or self.read_spec(s) for s in spec_files]
+
+    def all_deprecated_specs(self, jobs=None):
+        spec_files = self.all_deprecated_spec_files()
+        specs = self.read_specs(
+            set(p for pair in spec_files for p in pair), jobs)
+        read = lambda x: specs.get(x) or self.read_spec(x)
+        return set((read(s), read(d)) for s, d in spec_files)
 
     def specs_by_hash(self):
         by_hash = {}
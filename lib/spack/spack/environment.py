@@ -32,6 +32,7 @@
 import spack.user_environment as uenv
 from spack.filesystem_view import YamlFilesystemView
 import spack.util.environment
+import spack.util.parallel
 import spack.architecture as architecture
 from spack.spec import Spec
 from spack.spec_list import SpecList, InvalidSpecConstraintError
@@ -922,7 +923,7 @@ def remove(self, query_spec, list_name=user_speclist_name, force=False):
                 del self.concretized_order[i]
                 del self.specs_by_hash[dag_hash]
 
-    def concretize(self, force=False):
+    def concretize(self, force=False, jobs=None):
         """Concretize user_specs in this environment.
 
         Only concretizes specs that haven't been concretized yet unless
@@ -934,6 +935,8 @@ def concretize(self, force=False):
         Arguments:
             force (bool): re-concretize ALL specs, even those that were
                already concretized
+            jobs (int): number of processes concretizing user specs at
+               once, when they are concretized separately (default: 1)
 
         Returns:
             List of specs that have been concretized. Each entry is a tuple of
@@ -949,7 +952,7 @@ def concretize(self, force=False):
         if self.concretization == 'together':
             return self._concretize_together()
         if self.concretization == 'separately':
-            return self._concretize_separately()
+            return self._concretize_separately(jobs)
 
         msg = 'concretization strategy not implemented [{0}]'
         raise SpackEnvironmentError(msg.format(self.concretization))
@@ -994,9 +997,12 @@ def _concretize_together(self):
             self._add_concrete_spec(abstract, concrete)
         return concretized_specs
 
-    def _concretize_separately(self):
+    def _concretize_separately(self, jobs=None):
         """Concretization strategy that concretizes separately one
         user spec after the other.
+
+        With ``jobs`` greater than one, new user specs are concretized in
+        a pool of processes.
         """
         # keep any concretized specs whose user specs are still in the manifest
         old_concretized_user_specs = self.concretized_user_specs
@@ -1013,13 +1019,17 @@ def _concretize_separately(self):
                 self._add_concrete_spec(s, concrete, new=False)
 
         # Concretize any new user specs that we haven't concretized yet
+        new_user_specs = [
+            (uspec, uspec_constraints) for uspec, uspec_constraints in zip(
+                self.user_specs, self.user_specs.specs_as_constraints)
+            if uspec not in old_concretized_user_specs]
+        concrete_specs = _concretize_all_from_constraints(
+            [constraints for _, constraints in new_user_specs], jobs)
+
         concretized_specs = []
-        for uspec, uspec_constraints in zip(
-                self.user_specs, self.user_specs.specs_as_constraints):
-            if uspec not in old_concretized_user_specs:
-                concrete = _concretize_from_constraints(uspec_constraints)
-                self._add_concrete_spec(uspec, concrete)
-                concretized_specs.append((uspec, concrete))
+        for (uspec, _), concrete in zip(new_user_specs, concrete_specs):
+            self._add_concrete_spec(uspec, concrete)
+            concretized_specs.append((uspec, concrete))
         return concretized_specs
 
     def concretize_and_add(self, user_spec, concrete_spec=None):
@@ -1585,6 +1595,40 @@ def _concretize_from_constraints(spec_constraints):
             invalid_constraints.extend(inv_variant_constraints)
 
 
+def _concretize_task(constraints):
+    """Concretize a list of constraints in a worker process.
+
+    Returns the concrete spec as JSON, or None if concretization failed.
+    """
+    try:
+        concrete = _concretize_from_constraints(constraints)
+        return concrete.to_json(hash=ht.build_hash)
+    except Exception as e:
+        tty.debug(e)
+        return None
+
+
+def _concretize_all_from_constraints(constraints_list, jobs=None):
+    """Concretize each list of constraints in ``constraints_list``, using
+    up to ``jobs`` processes, and return the concrete specs in order."""
+    jobs = min(jobs or 1, len(constraints_list))
+    if jobs < 2:
+        return [_concretize_from_constraints(constraints)
+                for constraints in constraints_list]
+
+    results = spack.util.parallel.parallel_map(
+        _concretize_task, constraints_list, jobs)
+
+    concrete_specs = []
+    for constraints, result in zip(constraints_list, results):
+        if result is None:
+            # Concretize again in this process to report the error
+            concrete_specs.append(_concretize_from_constraints(constraints))
+        else:
+            concrete_specs.append(Spec.from_json(result))
+    return concrete_specs
+
+
 def make_repo_path(root):
     """Make a RepoPath from the repo subdirectories in an environment."""
     path = spack.repo.RepoPath()
@@ -24,6 +24,7 @@
 """
 import copy
 import functools
+import hashlib
 import os
 import os.path
 import re
@@ -36,6 +37,8 @@
 import spack.config
 import spack.error
 import spack.util.crypto as crypto
+import spack.util.download as download
+import spack.util.lock
 import spack.util.pattern as pattern
 import spack.util.url as url_util
 import spack.util.web as web_util
@@ -228,6 +231,16 @@ def source_id(self):
             return component_ids
 
 
+#: Curl exit codes meaning that the server could not be reached: proxy and
+#: host name resolution failures, failure to connect, timeout, SSL
+#: handshake failure, empty reply and connection reset
+_curl_connection_errors = (5, 6, 7, 28, 35, 52, 56)
+
+#: Label of the line curl writes after the headers with the time in seconds
+#: until the first byte of the response arrived
+_curl_response_time_label = 'spack-response-time: '
+
+
 @fetcher
 class URLFetchStrategy(FetchStrategy):
     """URLFetchStrategy pulls source code from a URL for an archive, check the
@@ -261,6 +274,13 @@ def __init__(self, url=None, checksum=None, **kwargs):
 
         self.extension = kwargs.get('extension', None)
 
+        # Checksum computed while downloading the archive, if any
+        self._streamed_checksum = None
+
+        # Seconds until the server started sending the archive, in the last
+        # fetch, if known
+        self.response_time = None
+
         if not self.url:
             raise ValueError("URLFetchStrategy requires a url for fetching.")
 
@@ -292,6 +312,7 @@ def fetch(self):
             tty.msg("Already downloaded %s" % self.archive_file)
             return
 
+        errors = []
         for url in self.candidate_urls:
             try:
                 partial_file, save_file = self._fetch_from_url(url)
@@ -300,12 +321,21 @@ def fetch(self):
                 break
             except FetchError as e:
                 tty.msg(str(e))
-                pass
+                errors.append(e)
 
         if not self.archive_file:
+            if errors and all(isinstance(e, FetchConnectionError)
+                              for e in errors):
+                raise FetchConnectionError(self.url)
             raise FailedDownloadError(self.url)
 
     def _fetch_from_url(self, url):
+        self._streamed_checksum = None
+        self.response_time = None
+        if (spack.config.get('config:url_fetch_method', 'curl') == 'urllib'
+                and self.stage.save_filename and download.supported(url)):
+            return self._fetch_urllib(url)
+
         save_file = None
         partial_file = None
         if self.stage.save_filename:
@@ -325,6 +355,8 @@ def _fetch_from_url(self, url):
             '-D',
             '-',  # print out HTML headers
             '-L',  # resolve 3xx redirects
+            '-w',
+            '\n%s%%{time_starttransfer}\n' % _curl_response_time_label,
             url,
         ]
 
@@ -382,6 +414,12 @@ def _fetch_from_url(self, url):
                     "which will not check SSL certificates."
                     "Use this at your own risk.")
 
+            elif curl.returncode in _curl_connection_errors:
+                raise FetchConnectionError(
+                    self.url,
+                    "Curl could not reach the server (error %d)" %
+                    curl.returncode)
+
             else:
                 # This is some other curl error.  Curl will print the
                 # error, but print a spack message too
@@ -389,6 +427,11 @@ def _fetch_from_url(self, url):
                     self.url,
                     "Curl failed with error %d" % curl.returncode)
 
+        times = re.findall(
+            '^%s([0-9.]+)' % _curl_response_time_label, headers, re.M)
+        if times:
+            self.response_time = float(times[-1])
+
         # Check if we somehow got an HTML file rather than the archive we
         # asked for.  We only look at the last content type, to handle
         # redirects properly.
@@ -398,6 +441,69 @@ def _fetch_from_url(self, url):
             warn_content_type_mismatch(self.archive_file or "the archive")
         return partial_file, save_file
 
+    def _fetch_urllib(self, url):
+        save_file = self.stage.save_filename
+        partial_file = save_file + '.part'
+        tty.msg("Fetching %s" % url)
+
+        headers = {}
+        timeout = spack.config.get('config:connect_timeout', 10)
+        if self.extra_options:
+            cookie = self.extra_options.get('cookie')
+            if cookie:
+                headers['Cookie'] = cookie
+
+            extra_timeout = self.extra_options.get('timeout')
+            if extra_timeout:
+                timeout = max(timeout, int(extra_timeout))
+
+        # Compute the checksum with the algorithm of the digest, if known
+        algorithm = 'sha256'
+        if self.digest:
+            try:
+                algorithm = crypto.hash_algo_for_digest(self.digest)
+            except ValueError:
+                pass
+
+        try:
+            response_headers, checksum, response_time = download.download(
+                url, partial_file, algorithm, headers=headers,
+                timeout=timeout or None)
+        except download.ConnectionFailedError as e:
+            # Keep the partial download: the next attempt resumes it
+            raise FetchConnectionError(self.url, str(e))
+        except download.DownloadError as e:
+            if os.path.exists(partial_file):
+                os.remove(partial_file)
+            raise FailedDownloadError(self.url, str(e))
+
+        self.response_time = response_time
+
+        # The checksum can be used as long as the file doesn't change
+        st = os.stat(partial_file)
+        self._streamed_checksum = (
+            (st.st_ino, st.st_size, st.st_mtime), algorithm, checksum)
+
+        content_type = response_headers.get('Content-Type')
+        if content_type and 'text/html' in content_type:
+            warn_content_type_mismatch(self.archive_file or "the archive")
+        return partial_file, save_file
+
+    def _checksum_of_download(self, algorithm):
+        """Return the checksum computed while downloading the archive, if
+        it used ``algorithm`` and the archive didn't change since."""
+        if not self._streamed_checksum:
+            return None
+        file_id, streamed_algorithm, checksum = self._streamed_checksum
+        try:
+            st = os.stat(self.archive_file)
+        except (OSError, TypeError):
+            return None
+        if (streamed_algorithm != algorithm or
+                file_id != (st.st_ino, st.st_size, st.st_mtime)):
+            return None
+        return checksum
+
     @property
     @_needs_stage
     def archive_file(self):
@@ -497,7 +603,11 @@ def check(self):
                 "Attempt to check URLFetchStrategy with no digest.")
 
         checker = crypto.Checker(self.digest)
-        if not checker.check(self.archive_file):
+        checker.sum = self._checksum_of_download(
+            crypto.hash_algo_for_digest(self.digest))
+        if checker.sum is None:
+            checker.check(self.archive_file)
+        if checker.sum != checker.hexdigest:
             raise ChecksumError(
                 "%s checksum failed for %s" %
                 (checker.hash_name, self.archive_file),
@@ -793,7 +903,10 @@ def fetch(self):
         tty.msg("Cloning git repository: {0}".format(self._repo_info()))
 
         git = self.git
-        if self.commit:
+        if spack.config.get('config:git_cache', False):
+            self._clone_from_cache()
+
+        elif self.commit:
             # Need to do a regular clone and check out everything if
             # they asked for a particular commit.
             debug = spack.config.get('config:debug')
@@ -881,6 +994,85 @@ def fetch(self):
                     args.insert(1, '--quiet')
                 git(*args)
 
+    def _clone_from_cache(self):
+        """Update the cached repository of ``self.url`` and clone the stage
+        from it, instead of cloning the remote repository."""
+        import spack.caches  # avoid circular import
+        cache_path = spack.caches.fetch_cache.git_repository(self.url)
+        mkdirp(os.path.dirname(cache_path))
+
+        lock = spack.util.lock.Lock(cache_path + '.lock', desc=self.url)
+        lock.acquire_write()
+        try:
+            self._update_cache(cache_path)
+            self._clone_cache(cache_path)
+        finally:
+            lock.release_write()
+
+    def _cache_has(self, cache_path, obj):
+        """Return True if the object named ``obj`` is in the cache."""
+        with working_dir(cache_path):
+            self.git('cat-file', '-e', obj, fail_on_error=False,
+                     output=os.devnull, error=os.devnull)
+        return self.git.returncode == 0
+
+    def _update_cache(self, cache_path):
+        """Download the objects missing from the cached repository."""
+        git = self.git
+        quiet = [] if spack.config.get('config:debug') else ['--quiet']
+        if not os.path.exists(cache_path):
+            tty.debug('Creating git cache {0}'.format(cache_path))
+            git(*(['clone', '--bare'] + quiet + [self.url, cache_path]))
+            return
+
+        # Commits never change, and tags seldom do: only fetch branches
+        if self.commit and self._cache_has(
+                cache_path, self.commit + '^{commit}'):
+            return
+        if (self.tag and not self.commit and
+                self._cache_has(cache_path, 'refs/tags/' + self.tag)):
+            return
+
+        tty.debug('Updating git cache {0}'.format(cache_path))
+        with working_dir(cache_path):
+            git(*(['fetch'] + quiet + [
+                self.url, '+refs/heads/*:refs/heads/*',
+                '+refs/tags/*:refs/tags/*']))
+
+            # Commits that are on no branch nor tag must be asked for
+            # explicitly, which not all servers allow
+            if self.commit and not self._cache_has(
+                    cache_path, self.commit + '^{commit}'):
+                git(*(['fetch'] + quiet + [self.url, self.commit]),
+                    fail_on_error=False)
+
+    def _clone_cache(self, cache_path):
+        """Clone the cached repository into the stage."""
+        git = self.git
+        quiet = [] if spack.config.get('config:debug') else ['--quiet']
+        args = ['clone'] + quiet
+        if self.branch:
+            args.extend(['--branch', self.branch])
+        elif self.tag and self.git_version >= ver('1.8.5.2'):
+            args.extend(['--branch', self.tag])
+
+        with temp_cwd():
+            # Local clones hard link the objects of the cache when they
+            # can, so this neither downloads nor copies the history
+            repo_name = _git_repository_name(self.url)
+            git(*(args + [cache_path, repo_name]))
+            self.stage.srcdir = repo_name
+            shutil.move(repo_name, self.stage.source_path)
+
+        with working_dir(self.stage.source_path):
+            # Point at the remote, so that submodules with relative URLs
+            # are found there
+            git('remote', 'set-url', 'origin', self.url)
+            if self.commit:
+                git(*(['checkout'] + quiet + [self.commit]))
+            elif self.tag and self.git_version < ver('1.8.5.2'):
+                git(*(['checkout'] + quiet + [self.tag]))
+
     def archive(self, destination):
         super(GitFetchStrategy, self).archive(destination, exclude='.git')
 
@@ -907,6 +1099,14 @@ def __str__(self):
         return '[git] {0}'.format(self._repo_info())
 
 
+def _git_repository_name(url):
+    """Return the name of the directory git would clone ``url`` into."""
+    name = os.path.basename(url.rstrip('/'))
+    if name.endswith('.git'):
+        name = name[:-len('.git')]
+    return name or 'repository'
+
+
 @fetcher
 class SvnFetchStrategy(VCSFetchStrategy):
 
@@ -1408,6 +1608,13 @@ def fetcher(self, target_path, digest, **kwargs):
         path = os.path.join(self.root, target_path)
         return CacheURLFetchStrategy(path, digest, **kwargs)
 
+    def git_repository(self, url):
+        """Return the path of the bare repository caching the objects of
+        the git repository at ``url``."""
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]
+        name = '{0}-{1}.git'.format(_git_repository_name(url), key)
+        return os.path.join(self.root, 'git-repositories', name)
+
     def destroy(self):
         shutil.rmtree(self.root, ignore_errors=True)
 
@@ -1428,6 +1635,10 @@ def __init__(self, url, msg=""):
         self.url = url
 
 
+class FetchConnectionError(FailedDownloadError):
+    """Raised when a download fails because the server can't be reached."""
+
+
 class NoArchiveFileError(FetchError):
     """"Raised when an archive file is expected but none exists."""
 
@@ -30,12 +30,17 @@
 import glob
 import heapq
 import itertools
+import multiprocessing.pool
 import os
+import random
 import shutil
 import six
 import sys
+import threading
 import time
 
+from six.moves import queue
+
 import llnl.util.filesystem as fs
 import llnl.util.lock as lk
 import llnl.util.tty as tty
@@ -43,6 +48,7 @@
 import spack.compilers
 import spack.error
 import spack.hooks
+import spack.mirror
 import spack.package
 import spack.package_prefs as prefs
 import spack.repo
@@ -79,6 +85,11 @@
 #: queue invariants).
 STATUS_REMOVED = 'removed'
 
+#: Initial and maximum delays, in seconds, before retrying a build task
+#: locked by another process in cooperative mode.
+_min_retry_delay = 1
+_max_retry_delay = 60
+
 
 def _handle_external_and_upstream(pkg, explicit):
     """
@@ -343,15 +354,98 @@ def _try_install_from_binary_cache(pkg, explicit, unsigned=False):
         unsigned (bool): ``True`` if binary package signatures to be checked,
             otherwise, ``False``
     """
+    binary_spec = _find_binary_spec(pkg)
+    if binary_spec is None:
+        return False
+
+    return _process_binary_cache_tarball(pkg, binary_spec, explicit, unsigned)
+
+
+def _find_binary_spec(pkg):
+    """
+    Look for the binary of the package in the build caches.
+
+    Args:
+        pkg (PackageBase): the package to be installed from binary cache
+
+    Return:
+        (Spec) the spec of the binary, or None if it is not in a build cache
+    """
     pkg_id = package_id(pkg)
     tty.debug('Searching for binary cache of {0}'.format(pkg_id))
     specs = binary_distribution.get_spec(pkg.spec, force=False)
     binary_spec = spack.spec.Spec.from_dict(pkg.spec.to_dict())
     binary_spec._mark_concrete()
-    if binary_spec not in specs:
-        return False
+    return binary_spec if binary_spec in specs else None
 
-    return _process_binary_cache_tarball(pkg, binary_spec, explicit, unsigned)
+
+def _install_binary(binary_spec, unsigned):
+    """
+    Download and extract the binary of a package, without registering it
+    in the database.
+
+    Runs in a process of its own since fetching changes the working
+    directory. Exits with a non-zero status if the binary was not
+    installed.
+
+    Args:
+        binary_spec (Spec): the spec whose cache has been confirmed
+        unsigned (bool): ``True`` if binary package signatures to be checked,
+            otherwise, ``False``
+    """
+    try:
+        tarball = binary_distribution.download_tarball(binary_spec)
+        if tarball is None:
+            tty.msg('{0} exists in binary cache but with different hash'
+                    .format(binary_spec.name))
+            sys.exit(1)
+
+        tty.msg('Installing {0} from binary cache'.format(binary_spec.name))
+        binary_distribution.extract_tarball(
+            binary_spec, tarball, allow_root=False, unsigned=unsigned,
+            force=False)
+    except Exception as exc:
+        tty.error('Failed to install {0} from binary cache due to {1}: {2}'
+                  .format(binary_spec.name, exc.__class__.__name__,
+                          str(exc)))
+        sys.exit(1)
+
+
+def _run_install_binary(args):
+    """Run ``_install_binary`` in a child process and return True if it
+    succeeded, False otherwise."""
+    process = multiprocessing.Process(target=_install_binary, args=args)
+    process.start()
+    process.join()
+    return process.exitcode == 0
+
+
+def _stage_package(pkg, restage):
+    """
+    Fetch and stage the sources of a package ahead of its build. This is the
+    target of the processes started by the installer to prefetch sources.
+
+    Args:
+        pkg (PackageBase): the package whose sources are staged
+        restage (bool): ``True`` if an existing stage is to be replaced,
+            otherwise ``False``
+    """
+    try:
+        # Don't remove the stage when leaving the context: it is only
+        # entered to lock the stage directory
+        pkg.stage.keep = True
+        with pkg.stage:
+            try:
+                if restage and pkg.stage.managed_by_spack:
+                    pkg.stage.destroy()
+                pkg.do_stage()
+            except BaseException:
+                pkg.stage.destroy()
+                raise
+    except Exception as exc:
+        tty.debug('Failed to prefetch {0} due to {1}: {2}'.format(
+            package_id(pkg), exc.__class__.__name__, str(exc)))
+        sys.exit(1)
 
 
 def _update_explicit_entry_in_db(pkg, rec, explicit):
@@ -560,6 +654,12 @@ def package_id(pkg):
             keep_stage (bool): By default, stage is destroyed only if there
                 are no exceptions during build. Set to True to keep the stage
                 even with exceptions.
+            cooperative (bool): Expect other processes, possibly on other
+                nodes, to install the same specs: skip packages locked by
+                other processes and retry them later, with increasing delays,
+                and report the overall progress.
+            package_jobs (int): Maximum number of packages built at once.
+                The ``build_jobs`` of each build are divided accordingly.
             restage (bool): Force spack to restage the package source.
             skip_patch (bool): Skip patch stage of build if True.
             stop_before (InstallPhase): stop execution before this
@@ -629,11 +729,40 @@ def __init__(self, pkg):
         # Locks on specs being built, keyed on the package's unique id
         self.locks = {}
 
+        # Build tasks whose build process is running, keyed on the package's
+        # unique id, when building several packages at once
+        self.building = {}
+
+        # Queue of (task, verbose, exc_info) tuples for the builds that are
+        # done, where exc_info is None if the build succeeded
+        self.builds_done = queue.Queue()
+
+        # Whether other processes are expected to install the same specs
+        self.cooperative = False
+
+        # Build tasks locked by other processes, set aside until they are
+        # retried, keyed on the package's unique id: (retry time, task)
+        self.deferred = {}
+
+        # Number of times the tasks were found locked by other processes
+        self.lock_failures = {}
+
+        # Unique ids of the packages queued initially, to report progress
+        self.queued = set()
+
+        # Packages whose sources are to be staged in the background, keyed
+        # on the package's unique id: (lock held while staging, package)
+        self.prefetches = {}
+
+        # Unique ids of the packages whose sources were staged in the
+        # background
+        self.prefetched = set()
+
     def __repr__(self):
         """Returns a formal representation of the package installer."""
         rep = '{0}('.format(self.__class__.__name__)
         for attr, value in self.__dict__.items():
-            rep += '{0}={1}, '.format(attr, value.__repr__())
+            rep += '{0}={1}, '.format(attr, repr(value))
         return '{0})'.format(rep.strip(', '))
 
     def __str__(self):
@@ -760,7 +889,9 @@ def _prepare_for_install(self, task, keep_prefix, keep_stage,
                 partial = True
 
         # Destroy the stage for a locally installed, non-DIYStage, package
-        if restage and task.pkg.stage.managed_by_spack:
+        # unless it was just staged in the background
+        if restage and task.pkg.stage.managed_by_spack and \
+                task.pkg_id not in self.prefetched:
             task.pkg.stage.destroy()
 
         if not partial and self.layout.check_installed(task.pkg.spec):
@@ -913,9 +1044,14 @@ def _ensure_locked(self, lock_type, pkg):
         if lock_type == 'read':
             # Wait until the other process finishes if there are no more
             # build tasks with priority 0 (i.e., with no uninstalled
-            # dependencies).
+            # dependencies) nor builds of our own to wait for.
             no_p0 = len(self.build_tasks) == 0 or not self._next_is_pri0()
+            no_p0 = no_p0 and not self.building
             timeout = None if no_p0 else 3
+
+            # Never wait for other processes when cooperating with them
+            if self.cooperative:
+                timeout = 1e-9
         else:
             timeout = 1e-9  # Near 0 to iterate through install specs quickly
 
@@ -1011,6 +1147,8 @@ def _init_queue(self, install_deps, install_package):
             # Now add the package itself, if appropriate
             self._push_task(self.pkg, False, 0, 0, STATUS_ADDED)
 
+        self.queued = set(self.build_tasks)
+
     def _install_task(self, task, **kwargs):
         """
         Perform the installation of the requested spec and/or dependency
@@ -1019,6 +1157,26 @@ def _install_task(self, task, **kwargs):
         Args:
             task (BuildTask): the installation build task for a package"""
 
+        build = self._start_task(task, **kwargs)
+        if build is not None:
+            self._finish_task(task, build)
+
+    _install_task.__doc__ += install_args_docstring
+
+    def _start_task(self, task, **kwargs):
+        """
+        Start the installation of the package of the build task, installing
+        it from a binary cache if possible.
+
+        Args:
+            task (BuildTask): the installation build task for a package
+
+        Return:
+            None if there is nothing left to do, otherwise a callable that
+                runs the build in a separate process and returns the
+                verbosity to keep for the following builds
+        """
+
         cache_only = kwargs.get('cache_only', False)
         dirty = kwargs.get('dirty', False)
         fake = kwargs.get('fake', False)
@@ -1029,6 +1187,7 @@ def _install_task(self, task, **kwargs):
         unsigned = kwargs.get('unsigned', False)
         use_cache = kwargs.get('use_cache', True)
         verbose = kwargs.get('verbose', False)
+        package_jobs = kwargs.get('package_jobs', 1)
 
         pkg = task.pkg
         pkg_id = package_id(pkg)
@@ -1042,6 +1201,8 @@ def _install_task(self, task, **kwargs):
         if use_cache and \
                 _install_from_cache(pkg, cache_only, explicit, unsigned):
             self._update_installed(task)
+            if pkg_id in self.prefetched:
+                pkg.stage.destroy()
             return
 
         pkg.run_tests = (tests is True or tests and pkg.name in tests)
@@ -1154,18 +1315,42 @@ def build_process():
         if not pkg.unit_test_check():
             return
 
-        try:
-            self._setup_install_dir(pkg)
+        self._setup_install_dir(pkg)
 
+        # Share the cores among the packages built at once
+        jobs = None
+        if package_jobs > 1:
+            jobs = min(spack.config.get('config:build_jobs', 16),
+                       multiprocessing.cpu_count())
+            jobs = max(1, jobs // package_jobs)
+
+        def build():
             # Fork a child to do the actual installation.
+            return spack.build_environment.fork(
+                pkg, build_process, dirty=dirty, fake=fake, jobs=jobs)
+
+        return build
+
+    _start_task.__doc__ += install_args_docstring
+
+    def _finish_task(self, task, build):
+        """
+        Run the build of the package of the build task and add the package
+        to the database.
+
+        Args:
+            task (BuildTask): the installation build task for a package
+            build (callable): the build returned by ``_start_task``
+        """
+        pkg = task.pkg
+        try:
             # Preserve verbosity settings across installs.
-            spack.package.PackageBase._verbose = spack.build_environment.fork(
-                pkg, build_process, dirty=dirty, fake=fake)
+            spack.package.PackageBase._verbose = build()
 
             # Note: PARENT of the build process adds the new package to
             # the database, so that we don't need to re-read from file.
             spack.store.db.add(pkg.spec, spack.store.layout,
-                               explicit=explicit)
+                               explicit=task.pkg_id == self.pkg_id)
 
             # If a compiler, ensure it is added to the configuration
             if task.compiler:
@@ -1178,8 +1363,6 @@ def build_process():
             tty.debug('Package stage directory : {0}'
                       .format(pkg.stage.source_path))
 
-    _install_task.__doc__ += install_args_docstring
-
     def _next_is_pri0(self):
         """
         Determine if the next build task has priority 0
@@ -1192,6 +1375,18 @@ def _next_is_pri0(self):
         task = self.build_pq[0][1]
         return task.priority == 0
 
+    def _next_is_ready(self):
+        """
+        Determine if the next build task, if any, has priority 0, skipping
+        the tasks that were removed
+
+        Return:
+            True if it does, False otherwise
+        """
+        while self.build_pq and self.build_pq[0][1].status == STATUS_REMOVED:
+            heapq.heappop(self.build_pq)
+        return bool(self.build_pq) and self._next_is_pri0()
+
     def _pop_task(self):
         """
         Remove and return the lowest priority build task.
@@ -1279,6 +1474,9 @@ def _requeue_task(self, task):
         """
         Requeues a task that appears to be in progress by another process.
 
+        In cooperative mode the task is set aside instead, and queued again
+        after a delay that doubles every time it is found locked.
+
         Args:
             task (BuildTask): the installation build task for a package
         """
@@ -1286,10 +1484,63 @@ def _requeue_task(self, task):
             tty.msg('{0} {1}'.format(install_msg(task.pkg_id, self.pid),
                                      'in progress by another process'))
 
-        start = task.start or time.time()
-        self._push_task(task.pkg, task.compiler, start, task.attempts,
+        task.start = task.start or time.time()
+        if self.cooperative:
+            failures = self.lock_failures.get(task.pkg_id, 0)
+            self.lock_failures[task.pkg_id] = failures + 1
+
+            # Randomize the delays so that the processes don't all retry
+            # at the same time
+            delay = min(_min_retry_delay * 2 ** failures, _max_retry_delay)
+            delay *= random.uniform(0.5, 1)
+            tty.debug('Retrying {0} in {1:.1f}s'.format(task.pkg_id, delay))
+
+            # Don't keep a read lock while waiting: it would prevent the
+            # other process from upgrading its own lock to build the spec
+            self._release_lock(task.pkg_id)
+            self.locks.pop(task.pkg_id, None)
+
+            task.status = STATUS_INSTALLING
+            self.deferred[task.pkg_id] = (time.time() + delay, task)
+            return
+
+        self._push_task(task.pkg, task.compiler, task.start, task.attempts,
                         STATUS_INSTALLING)
 
+    def _requeue_deferred(self):
+        """Queue again the deferred build tasks that are due for a retry."""
+        now = time.time()
+        for pkg_id, (retry, task) in list(self.deferred.items()):
+            if retry <= now:
+                del self.deferred[pkg_id]
+                self._push_task(task.pkg, task.compiler, task.start,
+                                task.attempts, task.status)
+
+    def _next_retry(self):
+        """
+        Return the number of seconds until the next deferred build task is
+        due for a retry, or None if there is no deferred task.
+        """
+        if not self.deferred:
+            return None
+        retry = min(r for r, _ in self.deferred.values())
+        return max(0, retry - time.time())
+
+    def _report_progress(self, task):
+        """
+        Report the overall progress of the installation in cooperative mode,
+        including the packages installed by other processes.
+
+        Args:
+            task (BuildTask): the build task whose status just changed
+        """
+        if not self.cooperative or task.pkg_id not in self.queued:
+            return
+
+        done = self.queued & (self.installed | set(self.failed))
+        tty.msg('[{0}/{1}] {2} {3}'.format(len(done), len(self.queued),
+                                           task.pkg_id, task.status))
+
     def _setup_install_dir(self, pkg):
         """
         Create and ensure proper access controls for the install directory.
@@ -1337,6 +1588,7 @@ def _update_failed(self, task, mark=False, exc=None):
         else:
             self.failed[pkg_id] = None
         task.status = STATUS_FAILED
+        self._report_progress(task)
 
         for dep_id in task.dependents:
             if dep_id in self.build_tasks:
@@ -1364,6 +1616,7 @@ def _update_installed(self, task):
 
         self.installed.add(pkg_id)
         task.status = STATUS_INSTALLED
+        self._report_progress(task)
         for dep_id in task.dependents:
             tty.debug('Removing {0} from {1}\'s uninstalled dependencies.'
                       .format(pkg_id, dep_id))
@@ -1387,8 +1640,8 @@ def install(self, **kwargs):
 
         install_deps = kwargs.get('install_deps', True)
         keep_prefix = kwargs.get('keep_prefix', False)
-        keep_stage = kwargs.get('keep_stage', False)
-        restage = kwargs.get('restage', False)
+        package_jobs = kwargs.get('package_jobs', 1)
+        self.cooperative = kwargs.get('cooperative', False)
 
         # install_package defaults True and is popped so that dependencies are
         # always installed regardless of whether the root was installed
@@ -1407,8 +1660,78 @@ def install(self, **kwargs):
         # Initialize the build task queue
         self._init_queue(install_deps, install_package)
 
-        # Proceed with the installation
-        while self.build_pq:
+        # Install everything the build caches have at once
+        self._install_from_caches(**kwargs)
+
+        # Fetch and stage sources in the background while building
+        prefetch_pool = self._start_prefetch(**kwargs)
+
+        pool = None
+        if package_jobs > 1:
+            pool = multiprocessing.pool.ThreadPool(package_jobs)
+
+        try:
+            keep_prefix = self._install_tasks(pool, **kwargs)
+        finally:
+            # Wait for the builds that are still running if we're leaving
+            # on an error
+            while self.building:
+                try:
+                    keep_prefix = self._wait_for_build(keep_prefix)
+                except Exception as exc:
+                    tty.debug('Ignoring {0}: {1}'.format(
+                        exc.__class__.__name__, str(exc)))
+            if pool is not None:
+                pool.close()
+                pool.join()
+            self._stop_prefetch(prefetch_pool, kwargs.get('keep_stage', False))
+
+        # Cleanup, which includes releasing all of the read locks
+        self._cleanup_all_tasks()
+
+        # Ensure we properly report if the original/explicit pkg is failed
+        if self.pkg_id in self.failed:
+            msg = ('Installation of {0} failed.  Review log for details'
+                   .format(self.pkg_id))
+            raise InstallError(msg)
+
+    install.__doc__ += install_args_docstring
+
+    def _install_tasks(self, pool, **kwargs):
+        """
+        Install the packages of the build tasks in the queue, bottom-up.
+
+        If ``pool`` is not None, up to ``package_jobs`` packages whose
+        dependencies are all installed are built at once, each build process
+        being waited for by a thread of ``pool``.
+
+        Args:
+            pool (ThreadPool): the pool of threads running the builds, or
+                None to build one package at a time
+
+        Return:
+            (bool) the updated ``keep_prefix``
+        """
+        keep_prefix = kwargs.get('keep_prefix', False)
+        keep_stage = kwargs.get('keep_stage', False)
+        restage = kwargs.get('restage', False)
+        package_jobs = kwargs.get('package_jobs', 1)
+
+        while self.build_pq or self.building or self.deferred:
+            self._requeue_deferred()
+
+            # Collect a build if nothing else can start until it is done
+            if self.building and (len(self.building) >= package_jobs or
+                                  not self._next_is_ready()):
+                keep_prefix = self._wait_for_build(keep_prefix,
+                                                   self._next_retry())
+                continue
+
+            # Wait for other processes if all we can do is retry their tasks
+            if self.deferred and not self._next_is_ready():
+                time.sleep(self._next_retry())
+                continue
+
             task = self._pop_task()
             if task is None:
                 continue
@@ -1469,6 +1792,10 @@ def install(self, **kwargs):
                 self._requeue_task(task)
                 continue
 
+            # Let the background staging of the sources complete, if it
+            # started, before looking at the stage
+            self._wait_for_prefetch(task)
+
             # Determine state of installation artifacts and adjust accordingly.
             self._prepare_for_install(task, keep_prefix, keep_stage,
                                       restage)
@@ -1515,57 +1842,380 @@ def install(self, **kwargs):
 
             # Proceed with the installation since we have an exclusive write
             # lock on the package.
-            try:
-                self._install_task(task, **kwargs)
-                self._update_installed(task)
-
-                # If we installed then we should keep the prefix
-                stop_before_phase = getattr(pkg, 'stop_before_phase', None)
-                last_phase = getattr(pkg, 'last_phase', None)
-                keep_prefix = keep_prefix or \
-                    (stop_before_phase is None and last_phase is None)
-
-            except spack.directory_layout.InstallDirectoryAlreadyExistsError:
-                tty.debug("Keeping existing install prefix in place.")
-                self._update_installed(task)
+            if pool is not None:
+                keep_prefix = self._start_build(pool, task, keep_prefix,
+                                                **kwargs)
+            else:
+                keep_prefix = self._complete_task(
+                    task, keep_prefix,
+                    lambda: self._install_task(task, **kwargs))
+
+        return keep_prefix
+
+    def _complete_task(self, task, keep_prefix, install):
+        """
+        Run what is left of the installation of the package of the build
+        task and update the tasks according to the outcome.
+
+        Failures are recorded, and only raised for the explicit package.
+
+        Args:
+            task (BuildTask): the installation build task for a package
+            keep_prefix (bool): ``True`` if the prefix is to be kept on
+                failure, otherwise ``False``
+            install (callable): argless function installing the package
+
+        Return:
+            (bool) the updated ``keep_prefix``
+        """
+        pkg = task.pkg
+        pkg_id = task.pkg_id
+        try:
+            install()
+            self._update_installed(task)
+
+            # If we installed then we should keep the prefix
+            stop_before_phase = getattr(pkg, 'stop_before_phase', None)
+            last_phase = getattr(pkg, 'last_phase', None)
+            keep_prefix = keep_prefix or \
+                (stop_before_phase is None and last_phase is None)
+
+        except spack.directory_layout.InstallDirectoryAlreadyExistsError:
+            tty.debug("Keeping existing install prefix in place.")
+            self._update_installed(task)
+            raise
+
+        except (Exception, KeyboardInterrupt, SystemExit) as exc:
+            # Assuming best effort installs so suppress the exception and
+            # mark as a failure UNLESS this is the explicit package.
+            err = 'Failed to install {0} due to {1}: {2}'
+            tty.error(err.format(pkg.name, exc.__class__.__name__,
+                      str(exc)))
+            self._update_failed(task, True, exc)
+
+            if pkg_id == self.pkg_id:
                 raise
 
-            except (Exception, KeyboardInterrupt, SystemExit) as exc:
-                # Assuming best effort installs so suppress the exception and
-                # mark as a failure UNLESS this is the explicit package.
-                err = 'Failed to install {0} due to {1}: {2}'
-                tty.error(err.format(pkg.name, exc.__class__.__name__,
-                          str(exc)))
-                self._update_failed(task, True, exc)
+        finally:
+            # Remove the install prefix if anything went wrong during
+            # install.
+            if not keep_prefix:
+                pkg.remove_prefix()
+
+            # The subprocess *may* have removed the build stage. Mark it
+            # not created so that the next time pkg.stage is invoked, we
+            # check the filesystem for it.
+            pkg.stage.created = False
+
+        # Perform basic task cleanup for the installed spec to
+        # include downgrading the write to a read lock
+        self._cleanup_task(pkg)
+        return keep_prefix
+
+    def _start_build(self, pool, task, keep_prefix, **kwargs):
+        """
+        Start the installation of the package of the build task and run its
+        build process in ``pool``, without waiting for it.
 
-                if pkg_id == self.pkg_id:
-                    raise
+        Args:
+            pool (ThreadPool): the pool of threads running the builds
+            task (BuildTask): the installation build task for a package
+            keep_prefix (bool): ``True`` if the prefix is to be kept on
+                failure, otherwise ``False``
 
-            finally:
-                # Remove the install prefix if anything went wrong during
-                # install.
-                if not keep_prefix:
-                    pkg.remove_prefix()
+        Return:
+            (bool) the updated ``keep_prefix``
+        """
+        try:
+            build = self._start_task(task, **kwargs)
+        except (Exception, KeyboardInterrupt, SystemExit):
+            exc_info = sys.exc_info()
+            return self._complete_task(task, keep_prefix,
+                                       lambda: six.reraise(*exc_info))
 
-                # The subprocess *may* have removed the build stage. Mark it
-                # not created so that the next time pkg.stage is invoked, we
-                # check the filesystem for it.
-                pkg.stage.created = False
+        if build is None:
+            # Installed from a binary cache, or skipped
+            return self._complete_task(task, keep_prefix, lambda: None)
+
+        def run():
+            try:
+                self.builds_done.put((task, build(), None))
+            except BaseException:
+                self.builds_done.put((task, None, sys.exc_info()))
 
-            # Perform basic task cleanup for the installed spec to
-            # include downgrading the write to a read lock
+        self.building[task.pkg_id] = task
+        pool.apply_async(run)
+        return keep_prefix
+
+    def _install_from_caches(self, **kwargs):
+        """
+        Install the queued packages whose binaries are in a build cache, and
+        whose dependencies are installed or in a build cache as well, before
+        building anything.
+
+        The binaries are downloaded and extracted concurrently, on up to
+        ``config:binary_install_jobs`` processes, since extracting a binary
+        does not need its dependencies to be installed. The packages are
+        then registered in the database in a single transaction, in
+        dependency order. A package is only registered if its dependencies
+        were, otherwise its prefix is removed. Packages that are not
+        installed are left to the regular, one package at a time,
+        installation.
+        """
+        jobs = spack.config.get('config:binary_install_jobs', 0)
+        fake = kwargs.get('fake', False)
+        keep_prefix = kwargs.get('keep_prefix', False)
+        unsigned = kwargs.get('unsigned', False)
+        use_cache = kwargs.get('use_cache', True)
+        if not jobs or fake or not use_cache or \
+                not spack.mirror.MirrorCollection():
+            return
+
+        # Find the binaries, dependencies first, and lock their prefixes
+        available, binary_specs, order = {}, {}, []
+
+        def check(pkg_id):
+            if pkg_id not in available:
+                available[pkg_id] = False
+                available[pkg_id] = self._check_binary(
+                    pkg_id, check, binary_specs, keep_prefix)
+                if pkg_id in binary_specs:
+                    order.append(self.build_tasks[pkg_id])
+            return available[pkg_id]
+
+        for pkg_id in sorted(self.build_tasks):
+            check(pkg_id)
+        if not order:
+            return
+
+        tty.msg('Installing {0} packages from binary caches'
+                .format(len(order)))
+        pool = multiprocessing.pool.ThreadPool(jobs)
+        try:
+            extracted = pool.map(
+                _run_install_binary,
+                [(binary_specs[task.pkg_id], unsigned) for task in order])
+        finally:
+            pool.close()
+            pool.join()
+
+        registered = []
+        with spack.store.db.write_transaction():
+            for task, ok in zip(order, extracted):
+                deps_ok = all(dep_id not in binary_specs or
+                              dep_id in registered
+                              for dep_id in task.uninstalled_deps)
+                if not ok:
+                    continue
+                if not deps_ok:
+                    task.pkg.remove_prefix()
+                    continue
+
+                task.pkg.installed_from_binary_cache = True
+                spack.store.db.add(task.pkg.spec, spack.store.layout,
+                                   explicit=task.pkg_id == self.pkg_id)
+                registered.append(task.pkg_id)
+
+        for pkg_id in registered:
+            # Tasks are replaced as their dependencies get installed
+            task = self.build_tasks[pkg_id]
+            pkg = task.pkg
+            _print_installed_pkg(pkg.spec.prefix)
+            spack.hooks.post_install(pkg.spec)
+
+            # If a compiler, ensure it is added to the configuration
+            if task.compiler:
+                spack.compilers.add_compilers_to_config(
+                    spack.compilers.find_compilers([pkg.spec.prefix]))
+
+            self._update_installed(task)
             self._cleanup_task(pkg)
 
-        # Cleanup, which includes releasing all of the read locks
-        self._cleanup_all_tasks()
+    def _check_binary(self, pkg_id, check, binary_specs, keep_prefix):
+        """
+        Determine if the package of a build task can be installed from a
+        build cache along with its dependencies, and if so lock its prefix
+        for writing and record its binary in ``binary_specs``.
 
-        # Ensure we properly report if the original/explicit pkg is failed
-        if self.pkg_id in self.failed:
-            msg = ('Installation of {0} failed.  Review log for details'
-                   .format(self.pkg_id))
-            raise InstallError(msg)
+        Args:
+            pkg_id (str): identifier of the package being checked
+            check (callable): function checking a dependency the same way
+            binary_specs (dict): binaries found so far, by package identifier
+            keep_prefix (bool): ``True`` if the prefix is to be kept on
+                failure, otherwise ``False``
 
-    install.__doc__ += install_args_docstring
+        Return:
+            (bool) ``True`` if the package is installed, not to be installed
+                locally, or installable from a build cache, else ``False``
+        """
+        task = self.build_tasks.get(pkg_id)
+        if task is None or pkg_id in self.installed:
+            return pkg_id in self.installed
+
+        pkg = task.pkg
+        if pkg.spec.external or pkg.installed_upstream or \
+                self._check_db(pkg.spec)[1]:
+            return True
+        if pkg_id in self.failed or spack.store.db.prefix_failed(pkg.spec):
+            return False
+        if not all(check(dep_id) for dep_id in task.uninstalled_deps):
+            return False
+
+        binary_spec = _find_binary_spec(pkg)
+        if binary_spec is None:
+            return False
+
+        ltype, lock = self._ensure_locked('write', pkg)
+        if lock is None or ltype != 'write':
+            return False
+
+        # Clean up what is left of previous attempts
+        self._prepare_for_install(task, keep_prefix, True)
+        if pkg_id in self.installed:
+            return True
+        if os.path.exists(pkg.spec.prefix):
+            return False
+
+        binary_specs[pkg_id] = binary_spec
+        return True
+
+    def _start_prefetch(self, **kwargs):
+        """
+        Start fetching and staging the sources of the queued packages in the
+        background, in the order in which they are expected to be built, on
+        up to ``config:prefetch_jobs`` threads.
+
+        Packages that don't need their sources, or whose binaries are
+        listed in the spec index of a build cache, are not prefetched.
+
+        Return:
+            (ThreadPool) the pool of threads staging the sources, or None if
+                nothing is prefetched
+        """
+        jobs = spack.config.get('config:prefetch_jobs', 0)
+        fake = kwargs.get('fake', False)
+        cache_only = kwargs.get('cache_only', False)
+        if not jobs or fake or cache_only:
+            return None
+
+        binaries = set()
+        if kwargs.get('use_cache', True):
+            binaries = binary_distribution.indexed_specfile_names()
+
+        checksum = spack.config.get('config:checksum')
+        pool = None
+        for task in sorted(self.build_tasks.values(), key=lambda t: t.key):
+            pkg = task.pkg
+            if not pkg.has_code or pkg.spec.external or \
+                    pkg.installed_upstream:
+                continue
+            # Fetching without a checksum may need to ask the user first
+            if checksum and pkg.version not in pkg.versions:
+                continue
+            specfile = binary_distribution.tarball_name(
+                pkg.spec, '.spec.yaml')
+            if specfile in binaries or self._check_db(pkg.spec)[1]:
+                continue
+
+            if pool is None:
+                pool = multiprocessing.pool.ThreadPool(jobs)
+            lock = threading.Lock()
+            self.prefetches[task.pkg_id] = (lock, pkg)
+            pool.apply_async(self._prefetch, (pkg, lock,
+                                              kwargs.get('restage', False)))
+        return pool
+
+    def _prefetch(self, pkg, lock, restage):
+        """
+        Fetch and stage the sources of the package in a separate process,
+        unless its installation already started, while holding ``lock``.
+
+        Failures are ignored: the sources are staged again by the build.
+
+        Args:
+            pkg (PackageBase): the package whose sources are staged
+            lock (threading.Lock): lock held by the installer once the
+                installation of the package starts
+            restage (bool): ``True`` if an existing stage is to be replaced,
+                otherwise ``False``
+        """
+        if not lock.acquire(False):
+            return
+
+        try:
+            # Staging changes the working directory, which is shared by
+            # the threads of a process
+            process = multiprocessing.Process(
+                target=_stage_package, args=(pkg, restage))
+            process.start()
+            process.join()
+            if process.exitcode == 0:
+                self.prefetched.add(package_id(pkg))
+        finally:
+            lock.release()
+
+    def _wait_for_prefetch(self, task):
+        """
+        Wait for the background staging of the sources of the task's
+        package to be done, or prevent it from starting.
+
+        Args:
+            task (BuildTask): the build task for the package being installed
+        """
+        lock, _ = self.prefetches.pop(task.pkg_id, (None, None))
+        if lock is not None:
+            lock.acquire()
+
+    def _stop_prefetch(self, pool, keep_stage):
+        """
+        Cancel the background staging that did not start, wait for the rest
+        and remove the stages of the packages that were not installed.
+
+        Args:
+            pool (ThreadPool): the pool returned by ``_start_prefetch``
+            keep_stage (bool): ``True`` if the stages are to be kept,
+                otherwise ``False``
+        """
+        if pool is None:
+            return
+
+        for lock, _ in self.prefetches.values():
+            lock.acquire(False)
+        pool.close()
+        pool.join()
+
+        for pkg_id, (_, pkg) in self.prefetches.items():
+            if pkg_id in self.prefetched and not keep_stage:
+                pkg.stage.destroy()
+        self.prefetches.clear()
+
+    def _wait_for_build(self, keep_prefix, timeout=None):
+        """
+        Wait for one of the running builds to be done and complete the
+        installation of its package.
+
+        Args:
+            keep_prefix (bool): ``True`` if the prefix is to be kept on
+                failure, otherwise ``False``
+            timeout (float): maximum number of seconds to wait for, or None
+                to wait until a build is done
+
+        Return:
+            (bool) the updated ``keep_prefix``
+        """
+        try:
+            task, verbose, exc_info = self.builds_done.get(timeout=timeout)
+        except queue.Empty:
+            return keep_prefix
+        del self.building[task.pkg_id]
+
+        def build():
+            if exc_info is not None:
+                six.reraise(*exc_info)
+            return verbose
+
+        return self._complete_task(task, keep_prefix,
+                                   lambda: self._finish_task(task, build))
 
     # Helper method to "smooth" the transition from the
     # spack.package.PackageBase class
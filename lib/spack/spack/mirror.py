@@ -16,8 +16,10 @@
 import traceback
 import os.path
 import operator
+import threading
 
 import six
+from six.moves.urllib.parse import urlparse
 
 import ruamel.yaml.error as yaml_error
 
@@ -28,13 +30,17 @@
 except ImportError:
     from collections import Mapping
 
+import llnl.util.lock
 import llnl.util.tty as tty
 from llnl.util.filesystem import mkdirp
 
+import spack.caches
 import spack.config
 import spack.error
 import spack.url as url
 import spack.fetch_strategy as fs
+import spack.util.crypto as crypto
+import spack.util.parallel
 import spack.util.spack_json as sjson
 import spack.util.spack_yaml as syaml
 import spack.util.url as url_util
@@ -236,6 +242,110 @@ def __len__(self):
         return len(self._mirrors)
 
 
+class MirrorHealth(object):
+    """Response times and connection failures of mirrors.
+
+    The response time of a mirror is the time until it starts sending an
+    archive, so that it doesn't depend on the size of the archive.
+
+    The statistics are kept in the misc cache across sessions, and are used
+    to try the mirrors that respond quickly first, and the ones that could
+    not be reached last. Mirrors that could not be reached
+    ``config:mirror_failure_limit`` times in a session are skipped for the
+    rest of it.
+    """
+    #: Key of the statistics in the misc cache
+    cache_key = os.path.join('mirrors', 'health.json')
+
+    #: Weight of the last response time in the average response time
+    smoothing = 0.3
+
+    def __init__(self):
+        self.session_failures = {}
+        self._lock = threading.Lock()
+
+    def _read(self):
+        misc_cache = spack.caches.misc_cache
+        try:
+            if not misc_cache.init_entry(self.cache_key):
+                return {}
+            with misc_cache.read_transaction(self.cache_key) as f:
+                return sjson.load(f)
+        except (IOError, OSError, ValueError, spack.error.SpackError,
+                llnl.util.lock.LockError) as e:
+            tty.debug('Cannot read mirror statistics: {0}'.format(str(e)))
+            return {}
+
+    def sort(self, items, key=None):
+        """Return ``items`` sorted from the healthiest mirror to the least
+        healthy one. ``key`` maps each item to the URL of its mirror.
+
+        Mirrors without statistics come first, so that they get some, and
+        the order of mirrors with the same statistics is preserved.
+        """
+        stats = self._read()
+
+        def rank(item):
+            entry = stats.get(key(item) if key else item, {})
+            return entry.get('failures', 0), entry.get('latency') or 0
+
+        return sorted(items, key=rank)
+
+    def skip(self, url):
+        """Return True if the mirror at ``url`` should not be tried again in
+        this session."""
+        limit = spack.config.get('config:mirror_failure_limit', 3)
+        return bool(limit) and self.session_failures.get(url, 0) >= limit
+
+    def record(self, url, elapsed=None, failed=False):
+        """Record that the mirror at ``url`` could not be reached, if
+        ``failed``, or that it responded, in ``elapsed`` seconds if the
+        response time is known."""
+        with self._lock:
+            if failed:
+                self.session_failures[url] = \
+                    self.session_failures.get(url, 0) + 1
+                if self.session_failures[url] == spack.config.get(
+                        'config:mirror_failure_limit', 3):
+                    tty.warn('Mirror {0} could not be reached {1} times, '
+                             'skipping it from now on'.format(
+                                 url, self.session_failures[url]))
+            self._update(url, elapsed, failed)
+
+    def _update(self, url, elapsed, failed):
+        misc_cache = spack.caches.misc_cache
+        try:
+            misc_cache.init_entry(self.cache_key)
+            with misc_cache.write_transaction(self.cache_key) as (old, new):
+                stats = {}
+                if old:
+                    try:
+                        stats = sjson.load(old)
+                    except ValueError:
+                        pass
+                entry = stats.setdefault(url, {})
+                if failed:
+                    entry['failures'] = entry.get('failures', 0) + 1
+                else:
+                    entry['failures'] = 0
+                    latency = entry.get('latency')
+                    if elapsed is None:
+                        pass
+                    elif latency is None:
+                        entry['latency'] = elapsed
+                    else:
+                        entry['latency'] = (
+                            latency + self.smoothing * (elapsed - latency))
+                sjson.dump(stats, new)
+        except (IOError, OSError, spack.error.SpackError,
+                llnl.util.lock.LockError) as e:
+            tty.debug('Cannot write mirror statistics: {0}'.format(str(e)))
+
+
+#: Health of the mirrors used by this process
+health = MirrorHealth()
+
+
 def _determine_extension(fetcher):
     if isinstance(fetcher, fs.URLFetchStrategy):
         if fetcher.expand_archive:
@@ -401,7 +511,8 @@ def get_matching_versions(specs, num_versions=1):
     return matching
 
 
-def create(path, specs, skip_unstable_versions=False):
+def create(path, specs, skip_unstable_versions=False, jobs=None,
+           connections_per_host=None):
     """Create a directory to be used as a spack mirror, and fill it with
     package archives.
 
@@ -412,6 +523,11 @@ def create(path, specs, skip_unstable_versions=False):
         skip_unstable_versions: if true, this skips adding resources when
             they do not have a stable archive checksum (as determined by
             ``fetch_strategy.stable_target``)
+        jobs (int): number of specs whose resources are fetched at once
+            (default: one at a time)
+        connections_per_host (int): maximum number of specs fetching
+            resources from the same upstream host at once (default: no
+            limit other than ``jobs``). Configured mirrors are not limited.
 
     Return Value:
         Returns a tuple of lists: (present, mirrored, error)
@@ -447,10 +563,15 @@ def create(path, specs, skip_unstable_versions=False):
         mirror_root, skip_unstable_versions=skip_unstable_versions)
     mirror_stats = MirrorStats()
 
-    # Iterate through packages and download all safe tarballs for each
-    for spec in specs:
-        mirror_stats.next_spec(spec)
-        _add_single_spec(spec, mirror_cache, mirror_stats)
+    jobs = min(jobs or 1, len(specs))
+    if jobs < 2:
+        # Iterate through packages and download all safe tarballs for each
+        for spec in specs:
+            mirror_stats.next_spec(spec)
+            _add_single_spec(spec, mirror_cache, mirror_stats)
+    else:
+        _add_specs_in_parallel(
+            specs, mirror_cache, mirror_stats, jobs, connections_per_host)
 
     return mirror_stats.stats()
 
@@ -496,34 +617,158 @@ def error(self):
         self.errors.add(self.current_spec)
 
 
-def _add_single_spec(spec, mirror, mirror_stats):
+def archive_is_valid(fetcher, path):
+    """Return True if ``path`` is an archive of the resource of ``fetcher``.
+
+    The archive must exist and, if checksums are enabled and the fetcher
+    knows the checksum of its resource, match it.
+    """
+    if not os.path.isfile(path):
+        return False
+    digest = getattr(fetcher, 'digest', None)
+    if not digest or not spack.config.get('config:checksum'):
+        return True
+    return crypto.Checker(digest).check(path)
+
+
+def _spec_stages(spec):
+    """Return the stages of the package of ``spec`` and of its patches,
+    without creating them."""
+    stages = list(spec.package.stage)
+    stages.extend(patch.stage for patch in spec.package.all_patches()
+                  if patch.stage)
+    return stages
+
+
+def _spec_hosts(spec):
+    """Return the upstream hosts of the URLs of the resources of ``spec``.
+
+    Configured mirrors are tried first when fetching, so these are the
+    hosts contacted when the resources are not on any mirror.
+    """
+    hosts = set()
+    for stage in _spec_stages(spec):
+        url = getattr(stage.default_fetcher, 'url', None)
+        host = urlparse(url).netloc if url else None
+        if host:
+            hosts.add(host)
+    return hosts
+
+
+def _use_cached_archives(spec, mirror, mirror_stats):
+    """Record the archives of ``spec`` in ``mirror`` as already present and
+    return True if they are all there and valid. Otherwise, return False
+    without recording anything, and without creating any stage."""
+    archives = []
+    for stage in _spec_stages(spec):
+        path = stage.mirror_archive(mirror)
+        if path is None:
+            continue
+        if not archive_is_valid(stage.default_fetcher, path):
+            return False
+        archives.append((stage, path))
+
+    for stage, path in archives:
+        mirror_stats.already_existed(path)
+        mirror.symlink(stage.mirror_paths)
+    return True
+
+
+def _fetch_single_spec(spec, mirror, mirror_stats):
+    """Cache the resources of ``spec`` in ``mirror``, retrying on errors.
+
+    Returns None on success, or a tuple with the message and the traceback
+    of the last error.
+    """
     tty.msg("Adding package {pkg} to mirror".format(
         pkg=spec.format("{name}{@version}")
     ))
     num_retries = 3
     while num_retries > 0:
         try:
-            with spec.package.stage as pkg_stage:
-                pkg_stage.cache_mirror(mirror, mirror_stats)
-                for patch in spec.package.all_patches():
-                    if patch.stage:
-                        patch.stage.cache_mirror(mirror, mirror_stats)
-                    patch.clean()
-            exception = None
-            break
+            if not _use_cached_archives(spec, mirror, mirror_stats):
+                with spec.package.stage as pkg_stage:
+                    pkg_stage.cache_mirror(mirror, mirror_stats)
+                    for patch in spec.package.all_patches():
+                        if patch.stage:
+                            patch.stage.cache_mirror(mirror, mirror_stats)
+                        patch.clean()
+            return None
         except Exception as e:
             exc_tuple = sys.exc_info()
             exception = e
         num_retries -= 1
 
-    if exception:
-        if spack.config.get('config:debug'):
-            traceback.print_exception(file=sys.stderr, *exc_tuple)
-        else:
-            tty.warn(
-                "Error while fetching %s" % spec.cformat('{name}{@version}'),
-                getattr(exception, 'message', exception))
-        mirror_stats.error()
+    return (str(getattr(exception, 'message', exception)),
+            ''.join(traceback.format_exception(*exc_tuple)))
+
+
+def _report_error(spec, error, mirror_stats):
+    message, trace = error
+    if spack.config.get('config:debug'):
+        sys.stderr.write(trace)
+    else:
+        tty.warn(
+            "Error while fetching %s" % spec.cformat('{name}{@version}'),
+            message)
+    mirror_stats.error()
+
+
+def _add_single_spec(spec, mirror, mirror_stats):
+    error = _fetch_single_spec(spec, mirror, mirror_stats)
+    if error:
+        _report_error(spec, error, mirror_stats)
+
+
+def _mirror_task(spec, mirror):
+    """Cache the resources of one spec in a worker process.
+
+    Returns the resources added and already present, and the error if the
+    spec could not be mirrored.
+    """
+    mirror_stats = MirrorStats()
+    mirror_stats.next_spec(spec)
+    error = _fetch_single_spec(spec, mirror, mirror_stats)
+    return (sorted(mirror_stats.added_resources),
+            sorted(mirror_stats.existing_resources), error)
+
+
+def _add_specs_in_parallel(specs, mirror, mirror_stats, jobs,
+                           connections_per_host=None):
+    """Cache the resources of ``specs`` in ``mirror`` using ``jobs``
+    processes, and aggregate the results in ``mirror_stats``.
+
+    Fetching and staging change the working directory, so each spec is
+    handled in a separate process. Results and errors are reported in the
+    order of ``specs``, as if they were mirrored one at a time.
+
+    With ``connections_per_host``, specs whose upstream hosts are already
+    used by that many specs wait in this process, and the next specs
+    fetched from other hosts start in their place.
+    """
+    hosts = None
+    if connections_per_host:
+        hosts = []
+        for spec in specs:
+            try:
+                hosts.append(_spec_hosts(spec))
+            except Exception as e:
+                # The error is reported when the spec is mirrored
+                tty.debug(e)
+                hosts.append(set())
+
+    results = spack.util.parallel.parallel_map(
+        _mirror_task, specs, jobs, (mirror,),
+        keys=hosts, max_per_key=connections_per_host)
+
+    for spec, (added, existing, error) in zip(specs, results):
+        mirror_stats.next_spec(spec)
+        for resource in existing:
+            mirror_stats.already_existed(resource)
+        for resource in added:
+            mirror_stats.added(resource)
+        if error:
+            _report_error(spec, error, mirror_stats)
 
 
 class MirrorError(spack.error.SpackError):
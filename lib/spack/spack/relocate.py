@@ -2,10 +2,15 @@
 # Spack Project Developers. See the top-level COPYRIGHT file for details.
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
+import itertools
+import mmap
+import multiprocessing.pool
 import os
 import platform
 import re
 import shutil
+import struct
+import threading
 
 import llnl.util.lang
 import llnl.util.tty as tty
@@ -70,6 +75,14 @@ def __init__(self, old_path, new_path):
         super(BinaryTextReplaceError, self).__init__(msg, err_msg)
 
 
+#: Minimum number of files for which relocation is spread over a pool of
+#: processes, rather than done serially
+_min_files_per_pool = 16
+
+#: Lock serializing the search for patchelf
+_patchelf_lock = threading.Lock()
+
+
 def _patchelf():
     """Return the full path to the patchelf binary, if available, else None.
 
@@ -78,6 +91,13 @@ def _patchelf():
 
     Return None on Darwin or if patchelf cannot be found.
     """
+    # Files may be checked by many threads at once: make sure that patchelf
+    # is searched for, or installed, by only one of them at a time
+    with _patchelf_lock:
+        return _search_patchelf()
+
+
+def _search_patchelf():
     # Check if patchelf is already in the PATH
     patchelf = spack.util.executable.which('patchelf')
     if patchelf is not None:
@@ -124,6 +144,102 @@ def _elf_rpaths_for(path):
     return output.split(':') if output else []
 
 
+def elf_rpaths(path):
+    """Return the RPATHs of an ELF object reading its dynamic section,
+    without running ``patchelf``.
+
+    As ``patchelf --print-rpath`` does, DT_RUNPATH takes precedence over
+    DT_RPATH.
+
+    Args:
+        path (str): full path to the executable or library
+
+    Return:
+        RPATHs as a list of strings, or None if the file is not a
+        dynamically linked ELF object that could be parsed.
+    """
+    try:
+        with open(path, 'rb') as f:
+            return _read_elf_rpaths(f)
+    except (IOError, OSError, struct.error):
+        return None
+
+
+def _read_elf_rpaths(f):
+    ident = f.read(16)
+    if not ident.startswith(b'\x7fELF') or len(ident) < 16:
+        return None
+    is_64 = ident[4:5] == b'\x02'
+    order = '<' if ident[5:6] == b'\x01' else '>'
+    if is_64:
+        phdr, dyn = 'IIQQQQQQ', 'qQ'
+        phoff_at, phnum_at = 32, 54
+    else:
+        phdr, dyn = 'IIIIIIII', 'iI'
+        phoff_at, phnum_at = 28, 42
+
+    def read_struct(fmt, offset):
+        s = struct.Struct(order + fmt)
+        f.seek(offset)
+        return s.unpack(f.read(s.size))
+
+    phoff = read_struct('Q' if is_64 else 'I', phoff_at)[0]
+    phentsize, phnum = read_struct('HH', phnum_at)
+
+    # (vaddr, offset, filesz) of the loadable segments, and the location
+    # of the dynamic section
+    loads, dynamic = [], None
+    for i in range(phnum):
+        fields = read_struct(phdr, phoff + i * phentsize)
+        if is_64:
+            p_type, _, p_offset, p_vaddr, _, p_filesz = fields[:6]
+        else:
+            p_type, p_offset, p_vaddr, _, p_filesz = fields[:5]
+        if p_type == 1:
+            loads.append((p_vaddr, p_offset, p_filesz))
+        elif p_type == 2:
+            dynamic = (p_offset, p_filesz)
+    if dynamic is None:
+        return None
+
+    strtab, rpath, runpath = None, None, None
+    entry_size = struct.calcsize(order + dyn)
+    for offset in range(dynamic[0], sum(dynamic), entry_size):
+        tag, value = read_struct(dyn, offset)
+        if tag == 0:
+            break
+        elif tag == 5:
+            strtab = value
+        elif tag == 15:
+            rpath = value
+        elif tag == 29:
+            runpath = value
+
+    string = runpath if runpath is not None else rpath
+    if string is None:
+        return []
+    if strtab is None:
+        return None
+
+    # The string table is addressed by its virtual address
+    for vaddr, offset, filesz in loads:
+        if vaddr <= strtab < vaddr + filesz:
+            f.seek(offset + strtab - vaddr + string)
+            break
+    else:
+        return None
+    value = b''
+    while b'\x00' not in value:
+        chunk = f.read(256)
+        if not chunk:
+            return None
+        value += chunk
+    value = value[:value.index(b'\x00')]
+    if not isinstance(value, str):
+        value = value.decode('utf-8')
+    return value.split(':') if value else []
+
+
 def _make_relative(reference_file, path_root, paths):
     """Return a list where any path in ``paths`` that starts with
     ``path_root`` is made relative to the directory in which the
@@ -449,6 +565,289 @@ def needs_text_relocation(m_type, m_subtype):
     return m_type == 'text'
 
 
+def _prefix_map(*pairs):
+    """Merge sequences of (old, new) prefix pairs into a dictionary of utf-8
+    encoded byte strings.
+
+    When an old prefix appears more than once the first pair wins, as it
+    would if the substitutions were applied one after the other. Pairs that
+    would not change anything are dropped.
+    """
+    prefix_map = {}
+    for old, new in itertools.chain(*pairs):
+        if not old or new is None or old == new:
+            continue
+        prefix_map.setdefault(old.encode('utf-8'), new.encode('utf-8'))
+    return prefix_map
+
+
+def _prefix_regex(old_prefixes, text):
+    """Returns a regular expression (as bytes) matching any of the old
+    prefixes, trying the longest ones first so that nested prefixes are
+    handled correctly.
+
+    In text mode a prefix only matches at the beginning of a path: it must
+    be preceeded either by characters not legal in a path, or by characters
+    legal in a compiler flag (as in ``-I/prefix/include``). The prefix is
+    always the second group of a match.
+    """
+    alternatives = b'|'.join(
+        re.escape(p) for p in sorted(old_prefixes, key=len, reverse=True))
+    if text:
+        return (b'(?<![\\w\\-_/])([\\w\\-_]*?)(' + alternatives +
+                b')([\\w\\-_/]*)')
+    return b'()(' + alternatives + b')'
+
+
+def _find_prefixes(data, pattern):
+    """Returns the (offset, prefix) pairs of the old prefixes in ``data``"""
+    return [(m.start(2), m.group(2)) for m in re.finditer(pattern, data)]
+
+
+def _splice_prefixes(data, hits, prefix_map):
+    """Returns ``data`` with the old prefixes found at the offsets in
+    ``hits`` replaced by the new ones."""
+    chunks, last = [], 0
+    for offset, old in hits:
+        chunks.append(data[last:offset])
+        chunks.append(prefix_map[old])
+        last = offset + len(old)
+    chunks.append(data[last:])
+    return b''.join(chunks)
+
+
+def _binary_growth(hits, prefix_map):
+    """Returns by how many bytes replacing ``hits`` would grow a binary"""
+    return sum(len(prefix_map[old]) - len(old) for _, old in hits
+               if len(prefix_map[old]) > len(old))
+
+
+def _padded(old, new):
+    """Returns ``new`` padded on the left with ``os.sep`` to the length of
+    ``old``"""
+    return os.sep.encode('utf-8') * (len(old) - len(new)) + new
+
+
+def _relocate_text_file(filename, pattern, prefix_map):
+    """Replace, in a single pass, all the old prefixes in a text file with
+    the new ones. Returns True if the file was modified.
+    """
+    with open(filename, 'rb+') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return False
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            hits = _find_prefixes(data, pattern)
+            if not hits:
+                return False
+            # Only the prefix itself changes, the rest of the match is
+            # copied verbatim
+            content = _splice_prefixes(data, hits, prefix_map)
+        finally:
+            data.close()
+        f.seek(0)
+        f.write(content)
+        f.truncate()
+    return True
+
+
+def _relocate_binary_file(filename, pattern, prefix_map):
+    """Replace in place all the old prefixes in a binary file with the new
+    ones, padded on the left with ``os.sep`` so that the size of the file
+    doesn't change.
+
+    Returns a tuple whose first item is True if the file was modified. If
+    a new prefix is longer than the old one the file is left untouched, and
+    the second item holds the sizes to be reported in a
+    BinaryStringReplacementError.
+    """
+    with open(filename, 'rb+') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return False, None
+        data = mmap.mmap(f.fileno(), 0)
+        try:
+            hits = _find_prefixes(data, pattern)
+            growth = _binary_growth(hits, prefix_map)
+            if growth:
+                return False, (size, size + growth)
+            for start, old in hits:
+                data[start:start + len(old)] = _padded(old, prefix_map[old])
+            if hits:
+                data.flush()
+        finally:
+            data.close()
+    return bool(hits), None
+
+
+def _relocate_file(args):
+    filename, pattern, prefix_map, text = args
+    if text:
+        return _relocate_text_file(filename, pattern, prefix_map), None
+    return _relocate_binary_file(filename, pattern, prefix_map)
+
+
+def _relocate_file_at_offsets(args):
+    """Same as ``_relocate_file``, but the old prefixes are only looked
+    for at the offsets recorded in an index computed by ``prefix_offsets``.
+
+    Returns None if the file doesn't match the index anymore, in which case
+    it has to be scanned.
+    """
+    filename, entry, prefixes, prefix_map, text = args
+    hits = [(offset, prefixes[i]) for offset, i in entry['offsets']]
+    with open(filename, 'rb+') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size != entry['size']:
+            return None
+        for offset, old in hits:
+            f.seek(offset)
+            if f.read(len(old)) != old:
+                return None
+
+        if text:
+            f.seek(0)
+            content = _splice_prefixes(f.read(), hits, prefix_map)
+            f.seek(0)
+            f.write(content)
+            f.truncate()
+            return True, None
+
+        growth = _binary_growth(hits, prefix_map)
+        if growth:
+            return False, (size, size + growth)
+        for offset, old in hits:
+            f.seek(offset)
+            f.write(_padded(old, prefix_map[old]))
+    return bool(hits), None
+
+
+def _relocate_files(files, prefix_map, text, jobs=None, index=None):
+    """Replace the prefixes in ``prefix_map`` in many files.
+
+    All the prefixes are combined in a single regular expression, so each
+    file is scanned only once, and files that contain none of them are not
+    rewritten. Large batches of files are processed by a pool of processes.
+
+    If ``index`` was computed by ``prefix_offsets`` for the same old
+    prefixes the files are not scanned at all: files that had no prefix are
+    skipped, and the others are patched at the recorded offsets. Files that
+    changed since the index was computed are scanned as usual.
+
+    Args:
+        files (list): files to be relocated
+        prefix_map (dict): maps the old prefixes to the new ones, as
+            returned by ``_prefix_map``
+        text (bool): whether the files are text or binaries
+        jobs (int): number of processes (default: number of cores)
+        index (dict): offsets of the old prefixes in the files
+
+    Returns:
+        List of the files that were modified
+
+    Raises:
+        BinaryStringReplacementError: if a binary would change size
+    """
+    files = list(files)
+    if not files or not prefix_map:
+        return []
+
+    results = {}
+    if index and _index_matches(index, prefix_map):
+        prefixes = [p.encode('utf-8') for p in index['prefixes']]
+        indexed = [f for f in files if f in index['files']]
+        args = [(f, index['files'][f], prefixes, prefix_map, text)
+                for f in indexed]
+        for f, result in zip(indexed, _parallel_map(
+                _relocate_file_at_offsets, args, jobs)):
+            if result is not None:
+                results[f] = result
+        # Files that didn't contain any prefix are left alone
+        results.update((f, (False, None)) for f in files
+                       if f not in index['files'])
+
+    to_scan = [f for f in files if f not in results]
+    if to_scan:
+        pattern = _prefix_regex(prefix_map, text)
+        args = [(f, pattern, prefix_map, text) for f in to_scan]
+        processes = len(to_scan) >= _min_files_per_pool
+        results.update(zip(to_scan, _parallel_map(
+            _relocate_file, args, jobs, processes=processes)))
+
+    modified = []
+    for filename in files:
+        changed, error = results[filename]
+        if error:
+            raise BinaryStringReplacementError(filename, *error)
+        if changed:
+            modified.append(filename)
+    return modified
+
+
+def _index_matches(index, prefix_map):
+    """Returns True if ``index`` records the offsets of the old prefixes in
+    ``prefix_map``, and nothing else.
+
+    A different set of prefixes might lead to different matches, since the
+    longest prefix is matched first.
+    """
+    recorded = set(p.encode('utf-8') for p in index['prefixes'])
+    return recorded == set(prefix_map)
+
+
+def _offsets_in_file(args):
+    filename, pattern, index_of = args
+    with open(filename, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return size, []
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            hits = _find_prefixes(data, pattern)
+        finally:
+            data.close()
+    return size, [[offset, index_of[old]] for offset, old in hits]
+
+
+def prefix_offsets(files, prefixes, text, jobs=None):
+    """Returns an index of the offsets at which some prefixes occur in many
+    files, which can be passed to ``relocate_text`` and
+    ``relocate_text_bin`` to avoid scanning the files again.
+
+    The occurrences are the ones that relocation would replace, so the
+    index is valid only for the same set of old prefixes.
+
+    Args:
+        files (list): files to be searched
+        prefixes (list): prefixes to be searched for
+        text (bool): whether the files are text or binaries
+        jobs (int): number of processes (default: number of cores)
+
+    Returns:
+        Dictionary with two keys: ``prefixes`` holds the list of the
+        prefixes, and ``files`` maps each file containing at least one of
+        them to a dictionary with its ``size`` and the list of
+        ``[offset, i]`` pairs of its ``offsets``, where ``i`` is the
+        position in ``prefixes`` of the prefix found at ``offset``.
+    """
+    prefixes = sorted(set(p for p in prefixes if p))
+    index = {'prefixes': prefixes, 'files': {}}
+    files = list(files)
+    if not files or not prefixes:
+        return index
+
+    encoded = [p.encode('utf-8') for p in prefixes]
+    index_of = dict((p, i) for i, p in enumerate(encoded))
+    args = [(f, _prefix_regex(encoded, text), index_of) for f in files]
+    processes = len(files) >= _min_files_per_pool
+    results = _parallel_map(_offsets_in_file, args, jobs,
+                            processes=processes)
+    for filename, (size, offsets) in zip(files, results):
+        if offsets:
+            index['files'][filename] = {'size': size, 'offsets': offsets}
+    return index
+
+
 def _replace_prefix_text(filename, old_dir, new_dir):
     """Replace all the occurrences of the old install prefix with a
     new install prefix in text files that are utf-8 encoded.
@@ -458,24 +857,7 @@ def _replace_prefix_text(filename, old_dir, new_dir):
         old_dir (str): directory to be searched in the file
         new_dir (str): substitute for the old directory
     """
-    # TODO: cache regexes globally to speedup computation
-    with open(filename, 'rb+') as f:
-        data = f.read()
-        f.seek(0)
-        # Replace old_dir with new_dir if it appears at the beginning of a path
-        # Negative lookbehind for a character legal in a path
-        # Then a match group for any characters legal in a compiler flag
-        # Then old_dir
-        # Then characters legal in a path
-        # Ensures we only match the old_dir if it's precedeed by a flag or by
-        # characters not legal in a path, but not if it's preceeded by other
-        # components of a path.
-        old_bytes = old_dir.encode('utf-8')
-        pat = b'(?<![\\w\\-_/])([\\w\\-_]*?)%s([\\w\\-_/]*)' % old_bytes
-        repl = b'\\1%s\\2' % new_dir.encode('utf-8')
-        ndata = re.sub(pat, repl, data)
-        f.write(ndata)
-        f.truncate()
+    _relocate_files([filename], _prefix_map([(old_dir, new_dir)]), text=True)
 
 
 def _replace_prefix_bin(filename, old_dir, new_dir):
@@ -490,31 +872,7 @@ def _replace_prefix_bin(filename, old_dir, new_dir):
         old_dir (str): directory to be searched in the file
         new_dir (str): substitute for the old directory
     """
-    def replace(match):
-        occurances = match.group().count(old_dir.encode('utf-8'))
-        olen = len(old_dir.encode('utf-8'))
-        nlen = len(new_dir.encode('utf-8'))
-        padding = (olen - nlen) * occurances
-        if padding < 0:
-            return data
-        return match.group().replace(
-            old_dir.encode('utf-8'),
-            os.sep.encode('utf-8') * padding + new_dir.encode('utf-8')
-        )
-
-    with open(filename, 'rb+') as f:
-        data = f.read()
-        f.seek(0)
-        original_data_len = len(data)
-        pat = re.compile(old_dir.encode('utf-8'))
-        if not pat.search(data):
-            return
-        ndata = pat.sub(replace, data)
-        if not len(ndata) == original_data_len:
-            raise BinaryStringReplacementError(
-                filename, original_data_len, len(ndata))
-        f.write(ndata)
-        f.truncate()
+    _relocate_files([filename], _prefix_map([(old_dir, new_dir)]), text=False)
 
 
 def relocate_macho_binaries(path_names, old_layout_root, new_layout_root,
@@ -625,7 +983,8 @@ def _transform_rpaths(orig_rpaths, orig_root, new_prefixes):
 
 
 def relocate_elf_binaries(binaries, orig_root, new_root,
-                          new_prefixes, rel, orig_prefix, new_prefix):
+                          new_prefixes, rel, orig_prefix, new_prefix,
+                          rpaths=None):
     """Relocate the binaries passed as arguments by changing their RPATHs.
 
     Use patchelf to get the original RPATHs and then replace them with
@@ -645,9 +1004,13 @@ def relocate_elf_binaries(binaries, orig_root, new_root,
         rel (bool): True if the RPATHs are relative, False if they are absolute
         orig_prefix (str): prefix where the executable was originally located
         new_prefix (str): prefix where we want to relocate the executable
+        rpaths (dict): original RPATHs of the binaries, if already known
     """
+    rpaths = rpaths or {}
     for new_binary in binaries:
-        orig_rpaths = _elf_rpaths_for(new_binary)
+        orig_rpaths = rpaths.get(new_binary)
+        if orig_rpaths is None:
+            orig_rpaths = _elf_rpaths_for(new_binary)
         # TODO: Can we deduce `rel` from the original RPATHs?
         if rel:
             # Get the file path in the original prefix
@@ -785,7 +1148,8 @@ def relocate_links(links, orig_layout_root,
 
 def relocate_text(
         files, orig_layout_root, new_layout_root, orig_install_prefix,
-        new_install_prefix, orig_spack, new_spack, new_prefixes
+        new_install_prefix, orig_spack, new_spack, new_prefixes,
+        offsets=None
 ):
     """Relocate text file from the original installation prefix to the
     new prefix.
@@ -802,22 +1166,24 @@ def relocate_text(
         new_spack (str): path to the new Spack
         new_prefixes (dict): dictionary that maps the original prefixes to
             where they should be relocated
+        offsets (dict): offsets of the original prefixes in the files, as
+            returned by ``prefix_offsets``
     """
     # TODO: reduce the number of arguments (8 seems too much)
-    sbang_regex = r'#!/bin/bash {0}/bin/sbang'.format(orig_spack)
-    new_sbang = r'#!/bin/bash {0}/bin/sbang'.format(new_spack)
+    sbang_line = '#!/bin/bash {0}/bin/sbang'.format(orig_spack)
+    new_sbang = '#!/bin/bash {0}/bin/sbang'.format(new_spack)
 
-    for file in files:
-        _replace_prefix_text(file, orig_install_prefix, new_install_prefix)
-        for orig_dep_prefix, new_dep_prefix in new_prefixes.items():
-            _replace_prefix_text(file, orig_dep_prefix, new_dep_prefix)
-        _replace_prefix_text(file, orig_layout_root, new_layout_root)
-        _replace_prefix_text(file, sbang_regex, new_sbang)
+    prefix_map = _prefix_map(
+        [(orig_install_prefix, new_install_prefix)],
+        new_prefixes.items(),
+        [(orig_layout_root, new_layout_root), (sbang_line, new_sbang)]
+    )
+    _relocate_files(files, prefix_map, text=True, index=offsets)
 
 
 def relocate_text_bin(
         binaries, orig_install_prefix, new_install_prefix,
-        orig_spack, new_spack, new_prefixes
+        orig_spack, new_spack, new_prefixes, offsets=None
 ):
     """Replace null terminated path strings hard coded into binaries.
 
@@ -831,6 +1197,8 @@ def relocate_text_bin(
         new_spack (str): path to the new Spack
         new_prefixes (dict): dictionary that maps the original prefixes to
             where they should be relocated
+        offsets (dict): offsets of the original prefixes in the binaries, as
+            returned by ``prefix_offsets``
 
     Raises:
       BinaryTextReplaceError: when the new path in longer than the old path
@@ -842,11 +1210,12 @@ def relocate_text_bin(
     if not new_prefix_is_shorter and len(binaries) > 0:
         raise BinaryTextReplaceError(orig_install_prefix, new_install_prefix)
 
-    for binary in binaries:
-        for old_dep_prefix, new_dep_prefix in new_prefixes.items():
-            if len(new_dep_prefix) <= len(old_dep_prefix):
-                _replace_prefix_bin(binary, old_dep_prefix, new_dep_prefix)
-        _replace_prefix_bin(binary, orig_spack, new_spack)
+    # Dependencies whose new prefix is longer are skipped, since they
+    # can't be relocated by a string substitution
+    dep_prefixes = [(old, new) for old, new in (new_prefixes or {}).items()
+                    if new is not None and len(new) <= len(old)]
+    prefix_map = _prefix_map(dep_prefixes, [(orig_spack, new_spack)])
+    _relocate_files(binaries, prefix_map, text=False, index=offsets)
 
 
 def is_relocatable(spec):
@@ -871,15 +1240,16 @@ def is_relocatable(spec):
         return False
 
     # Explore the installation prefix of the spec
+    abs_files = []
     for root, dirs, files in os.walk(spec.prefix, topdown=True):
         dirs[:] = [d for d in dirs if d not in ('.spack', 'man')]
-        abs_files = [os.path.join(root, f) for f in files]
-        if not all(file_is_relocatable(f) for f in abs_files if is_binary(f)):
-            # If any of the file is not relocatable, the entire
-            # package is not relocatable
-            return False
+        abs_files.extend(os.path.join(root, f) for f in files)
 
-    return True
+    # If any of the binaries is not relocatable, the entire
+    # package is not relocatable
+    types = mime_types(abs_files)
+    binaries = [f for f in abs_files if types[f][0] == 'application']
+    return all(files_are_relocatable(binaries).values())
 
 
 def file_is_relocatable(file, paths_to_relocate=None):
@@ -909,29 +1279,35 @@ def file_is_relocatable(file, paths_to_relocate=None):
     if not os.path.isabs(file):
         raise ValueError('{0} is not an absolute path'.format(file))
 
-    strings = executable.Executable('strings')
+    # Strings in the binary containing any of the paths, as `strings`
+    # would report them. Most binaries don't contain any of the paths, in
+    # which case no string needs to be extracted.
+    strings_to_check = set()
+    for path_to_relocate in paths_to_relocate:
+        strings_to_check.update(_strings_containing(file, path_to_relocate))
 
-    # Remove the RPATHS from the strings in the executable
-    set_of_strings = set(strings(file, output=str).split())
+    if not strings_to_check:
+        return True
 
     m_type, m_subtype = mime_type(file)
     if m_type == 'application':
         tty.debug('{0},{1}'.format(m_type, m_subtype))
 
+    # Remove the RPATHS from the strings in the executable
     if platform.system().lower() == 'linux':
         if m_subtype == 'x-executable' or m_subtype == 'x-sharedlib':
             rpaths = ':'.join(_elf_rpaths_for(file))
-            set_of_strings.discard(rpaths)
+            strings_to_check.discard(rpaths)
     if platform.system().lower() == 'darwin':
         if m_subtype == 'x-mach-binary':
             rpaths, deps, idpath = macholib_get_paths(file)
-            set_of_strings.discard(set(rpaths))
-            set_of_strings.discard(set(deps))
+            strings_to_check.discard(set(rpaths))
+            strings_to_check.discard(set(deps))
             if idpath is not None:
-                set_of_strings.discard(idpath)
+                strings_to_check.discard(idpath)
 
     for path_to_relocate in paths_to_relocate:
-        if any(path_to_relocate in x for x in set_of_strings):
+        if any(path_to_relocate in x for x in strings_to_check):
             # One binary has the root folder not in the RPATH,
             # meaning that this spec is not relocatable
             msg = 'Found "{0}" in {1} strings'
@@ -941,6 +1317,73 @@ def file_is_relocatable(file, paths_to_relocate=None):
     return True
 
 
+def files_are_relocatable(files, paths_to_relocate=None, jobs=None):
+    """Check with :func:`file_is_relocatable` a batch of files using a pool
+    of threads.
+
+    Args:
+        files (list): absolute paths of the files to be analyzed
+        paths_to_relocate (list): paths that must not appear in the files
+        jobs (int): number of threads (default: number of cores)
+
+    Returns:
+        Dictionary mapping each file to True if it is relocatable and
+        False otherwise
+    """
+    def _is_relocatable(file):
+        return file_is_relocatable(file, paths_to_relocate=paths_to_relocate)
+
+    return dict(zip(files, _parallel_map(_is_relocatable, files, jobs)))
+
+
+#: Printable characters, according to ``strings``
+_printable_bytes = b'[\x20-\x7e\t]'
+_printable_run = re.compile(_printable_bytes + b'*')
+
+
+def _strings_containing(file, substring):
+    """Returns the set of strings in a file that contain a substring.
+
+    The strings are the whitespace separated words within the sequences of
+    printable characters in the file, as reported by ``strings``. Instead
+    of extracting every string, only the sequences around the occurrences
+    of the substring are examined.
+
+    Args:
+        file (str): path of the file to be searched
+        substring (str): text to be searched
+
+    Returns:
+        Set of strings containing the substring
+    """
+    result = set()
+    needle = substring.encode('utf-8')
+    if not needle or os.path.getsize(file) == 0:
+        return result
+
+    with open(file, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            offset = data.find(needle)
+            while offset != -1:
+                # Extend the match to the surrounding printable characters
+                start = offset
+                while start > 0:
+                    window = data[max(0, start - 4096):start][::-1]
+                    leading = _printable_run.match(window).end()
+                    start -= leading
+                    if leading < len(window):
+                        break
+                end = _printable_run.match(data, offset).end()
+                text = data[start:end].decode('utf-8', 'replace')
+                result.update(w for w in text.split() if substring in w)
+                offset = data.find(needle, end)
+        finally:
+            data.close()
+
+    return result
+
+
 def is_binary(file):
     """Returns true if a file is binary, False otherwise
 
@@ -961,22 +1404,123 @@ def is_binary(file):
     return False
 
 
+#: Number of bytes read from the beginning of a file to guess its type
+_mime_sniff_size = 4096
+
+#: ELF object file types as reported by ``file --mime-type``
+_elf_subtypes = {1: 'x-object', 2: 'x-executable', 3: 'x-sharedlib',
+                 4: 'x-coredump'}
+
+#: Magic numbers of Mach-O objects (32 and 64 bits, both endiannesses)
+_macho_magic = (b'\xfe\xed\xfa\xce', b'\xce\xfa\xed\xfe',
+                b'\xfe\xed\xfa\xcf', b'\xcf\xfa\xed\xfe')
+
+#: Magic numbers of other common binary formats
+_binary_magic = (
+    (b'!<arch>\n', 'x-archive'),
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'x-bzip2'),
+    (b'\xfd7zXZ\x00', 'x-xz'),
+    (b'PK\x03\x04', 'zip'),
+)
+
+#: Control characters that do not appear in text files
+_non_text_bytes = re.compile(b'[\x00-\x06\x0e-\x1a\x1c-\x1f\x7f]')
+
+
+def _sniff_mime_type(header):
+    """Returns the mime type and subtype of a file from its first bytes.
+
+    The classification is coarser than the one of ``file``, but agrees with
+    it on what matters for relocation: ELF and Mach-O objects, other
+    binary files (``application``) and text files.
+    """
+    if not header:
+        return 'inode', 'x-empty'
+
+    if header.startswith(b'\x7fELF') and len(header) >= 18:
+        # EI_DATA tells the endianness of the e_type field
+        byte_order = '<' if header[5:6] == b'\x01' else '>'
+        e_type = struct.unpack(byte_order + 'H', header[16:18])[0]
+        return 'application', _elf_subtypes.get(e_type, 'octet-stream')
+
+    if header[:4] in _macho_magic:
+        return 'application', 'x-mach-binary'
+
+    if header.startswith(b'\xca\xfe\xba\xbe') and len(header) >= 8:
+        # Fat Mach-O binaries share their magic number with Java classes,
+        # which have a much larger version number in the same place
+        nfat_arch = struct.unpack('>I', header[4:8])[0]
+        if nfat_arch < 20:
+            return 'application', 'x-mach-binary'
+        return 'application', 'x-java-applet'
+
+    for magic, subtype in _binary_magic:
+        if header.startswith(magic):
+            return 'application', subtype
+
+    if _non_text_bytes.search(header):
+        return 'application', 'octet-stream'
+
+    if header.startswith(b'#!'):
+        return 'text', 'x-shellscript'
+
+    return 'text', 'plain'
+
+
 @llnl.util.lang.memoized
 def mime_type(file):
     """Returns the mime type and subtype of a file.
 
+    The type is guessed in-process from the first bytes of the file,
+    without following symbolic links (like ``file -b -h --mime-type``).
+
     Args:
         file: file to be analyzed
 
     Returns:
         Tuple containing the MIME type and subtype
     """
-    file_cmd = executable.Executable('file')
-    output = file_cmd('-b', '-h', '--mime-type', file, output=str, error=str)
-    tty.debug('[MIME_TYPE] {0} -> {1}'.format(file, output.strip()))
-    # In corner cases the output does not contain a subtype prefixed with a /
-    # In those cases add the / so the tuple can be formed.
-    if '/' not in output:
-        output += '/'
-    split_by_slash = output.strip().split('/')
-    return split_by_slash[0], "/".join(split_by_slash[1:])
+    if os.path.islink(file):
+        result = ('inode', 'symlink')
+    elif not os.path.isfile(file):
+        result = ('inode', 'x-special')
+    else:
+        with open(file, 'rb') as f:
+            result = _sniff_mime_type(f.read(_mime_sniff_size))
+    tty.debug('[MIME_TYPE] {0} -> {1}/{2}'.format(file, *result))
+    return result
+
+
+def mime_types(files, jobs=None):
+    """Returns the mime type and subtype of many files, using a pool of
+    threads.
+
+    Args:
+        files (list): files to be analyzed
+        jobs (int): number of threads (default: number of cores)
+
+    Returns:
+        Dictionary mapping each file to a tuple containing its MIME type
+        and subtype
+    """
+    return dict(zip(files, _parallel_map(mime_type, files, jobs)))
+
+
+def _parallel_map(func, items, jobs=None, processes=False):
+    """Map ``func`` over ``items`` with a pool of threads, or of processes
+    if ``processes`` is True. With a single job, ``func`` is called in the
+    current thread."""
+    items = list(items)
+    if len(items) < 2 or jobs == 1:
+        return [func(x) for x in items]
+
+    if processes:
+        tp = multiprocessing.Pool(processes=jobs)
+    else:
+        tp = multiprocessing.pool.ThreadPool(processes=jobs)
+    try:
+        return tp.map(func, items)
+    finally:
+        tp.close()
+        tp.join()
@@ -56,6 +56,13 @@
             'source_cache': {'type': 'string'},
             'misc_cache': {'type': 'string'},
             'connect_timeout': {'type': 'integer', 'minimum': 0},
+            'url_fetch_method': {
+                'type': 'string',
+                'enum': ['curl', 'urllib']
+            },
+            'mirror_race': {'type': 'integer', 'minimum': 0},
+            'mirror_failure_limit': {'type': 'integer', 'minimum': 0},
+            'git_cache': {'type': 'boolean'},
             'verify_ssl': {'type': 'boolean'},
             'suppress_gpg_warnings': {'type': 'boolean'},
             'install_missing_compilers': {'type': 'boolean'},
@@ -65,8 +72,14 @@
             'dirty': {'type': 'boolean'},
             'build_language': {'type': 'string'},
             'build_jobs': {'type': 'integer', 'minimum': 1},
+            'prefetch_jobs': {'type': 'integer', 'minimum': 0},
+            'binary_install_jobs': {'type': 'integer', 'minimum': 0},
             'ccache': {'type': 'boolean'},
             'db_lock_timeout': {'type': 'integer', 'minimum': 1},
+            'db_format': {
+                'type': 'string',
+                'enum': ['json', 'sqlite']
+            },
             'package_lock_timeout': {
                 'anyOf': [
                     {'type': 'integer', 'minimum': 1},
@@ -74,6 +87,11 @@
                 ],
             },
             'allow_sgid': {'type': 'boolean'},
+            'buildcache_compression': {
+                'type': 'string',
+                'enum': ['gzip', 'parallel-gzip']
+            },
+            'buildcache_index_ttl': {'type': 'integer', 'minimum': 0},
         },
     },
 }
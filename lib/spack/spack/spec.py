@@ -984,10 +984,12 @@ def __init__(self, spec_like=None,
         self.compiler_flags = FlagMap(self)
         self._dependents = DependencyMap()
         self._dependencies = DependencyMap()
+        self._dependents_reader = None
         self.namespace = None
 
         self._hash = None
         self._build_hash = None
+        self._hash_memo = {}
         self._cmp_key_cache = None
         self._package = None
 
@@ -1036,6 +1038,7 @@ def dependencies(self, deptype='all'):
                 for d in self._find_deps(self._dependencies, deptype)]
 
     def dependents(self, deptype='all'):
+        self._read_dependents()
         return [d.parent
                 for d in self._find_deps(self._dependents, deptype)]
 
@@ -1044,9 +1047,20 @@ def dependencies_dict(self, deptype='all'):
                     for d in self._find_deps(self._dependencies, deptype))
 
     def dependents_dict(self, deptype='all'):
+        self._read_dependents()
         return dict((d.parent.name, d)
                     for d in self._find_deps(self._dependents, deptype))
 
+    def _read_dependents(self):
+        """Make sure that all the dependents of this spec are known.
+
+        Specs read from the database are constructed lazily, and only know
+        the dependents that were already constructed.  Their
+        ``_dependents_reader`` constructs the others.
+        """
+        if self._dependents_reader is not None:
+            self._dependents_reader()
+
     #
     # Private routines here are called by the parser when building a spec.
     #
@@ -1306,6 +1320,7 @@ def return_val(dspec):
                 where = self._dependencies
                 succ = lambda dspec: dspec.spec
             elif direction == 'parents':
+                self._read_dependents()
                 where = self._dependents
                 succ = lambda dspec: dspec.parent
             else:
@@ -1360,13 +1375,36 @@ def prefix(self, value):
     def _spec_hash(self, hash):
         """Utility method for computing different types of Spec hashes.
 
+        Arguments:
+            hash (SpecHashDescriptor): type of hash to generate.
+        """
+        if self.concrete:
+            return self._node_hash(hash)
+
+        # Abstract specs don't cache their hashes, so hash the abstract
+        # nodes of the DAG bottom-up and keep their hashes until this node
+        # is hashed. Each node is then hashed once, instead of once for
+        # each path leading to it.
+        nodes = [s for s in self.traverse(order='post', deptype=hash.deptype)
+                 if not s.concrete]
+        try:
+            for node in nodes:
+                node._hash_memo[hash] = node._node_hash(hash)
+            return self._hash_memo[hash]
+        finally:
+            for node in nodes:
+                node._hash_memo.pop(hash, None)
+
+    def _node_hash(self, hash):
+        """Hash the node dictionary of this spec, given the hashes of its
+        dependencies.
+
         Arguments:
             hash (SpecHashDescriptor): type of hash to generate.
         """
         # TODO: curently we strip build dependencies by default.  Rethink
         # this when we move to using package hashing on all specs.
-        yaml_text = syaml.dump(
-            self.to_node_dict(hash=hash), default_flow_style=True)
+        yaml_text = syaml.dump_flow(self.to_node_dict(hash=hash))
         sha = hashlib.sha1(yaml_text.encode('utf-8'))
         b32_hash = base64.b32encode(sha.digest()).lower()
 
@@ -1385,6 +1423,9 @@ def _cached_hash(self, hash, length=None):
         Arguments:
             hash (SpecHashDescriptor): type of hash to generate.
         """
+        if hash in self._hash_memo:
+            return self._hash_memo[hash][:length]
+
         if not hash.attr:
             return self._spec_hash(hash)[:length]
 
@@ -3034,6 +3075,7 @@ def _dup(self, other, deps=True, cleardeps=True, caches=None):
                        self.compiler_flags != other.compiler_flags)
 
         self._package = None
+        self._dependents_reader = None
 
         # Local node attributes get copied first.
         self.name = other.name
@@ -3077,6 +3119,7 @@ def _dup(self, other, deps=True, cleardeps=True, caches=None):
             self._dup_deps(other, deptypes, caches)
 
         self._concrete = other._concrete
+        self._hash_memo = {}
 
         if caches:
             self._hash = other._hash
@@ -12,6 +12,9 @@
 import hashlib
 import tempfile
 import getpass
+import socket
+import threading
+import time
 from six import string_types
 from six import iteritems
 
@@ -26,10 +29,13 @@
 import spack.error
 import spack.mirror
 import spack.util.lock
+import spack.util.parallel
 import spack.fetch_strategy as fs
 import spack.util.pattern as pattern
 import spack.util.path as sup
 import spack.util.url as url_util
+import spack.util.web as web_util
+import spack.util.crypto as crypto
 
 from spack.util.crypto import prefix_bits, bit_length
 
@@ -402,9 +408,10 @@ def source_path(self):
 
     def fetch(self, mirror_only=False):
         """Downloads an archive or checks out code from a repository."""
-        fetchers = []
+        # Each candidate is a fetcher and the URL of its mirror, if any
+        candidates = []
         if not mirror_only:
-            fetchers.append(self.default_fetcher)
+            candidates.append((self.default_fetcher, None))
 
         # TODO: move mirror logic out of here and clean it up!
         # TODO: Or @alalazo may have some ideas about how to use a
@@ -417,7 +424,8 @@ def fetch(self, mirror_only=False):
             urls = []
             for mirror in spack.mirror.MirrorCollection().values():
                 for rel_path in self.mirror_paths:
-                    urls.append(url_util.join(mirror.fetch_url, rel_path))
+                    urls.append((url_util.join(mirror.fetch_url, rel_path),
+                                 mirror.fetch_url))
 
             # If this archive is normally fetched from a tarball URL,
             # then use the same digest.  `spack mirror` ensures that
@@ -434,34 +442,61 @@ def fetch(self, mirror_only=False):
             # repositories.  How can this be made safer?
             self.skip_checksum_for_mirror = not bool(digest)
 
-            # Add URL strategies for all the mirrors with the digest
-            for url in urls:
-                fetchers.insert(
-                    0, fs.from_url_scheme(
-                        url, digest, expand=expand, extension=extension))
+            # Add URL strategies for all the mirrors with the digest, the
+            # healthiest mirrors first. Mirrors configured last used to be
+            # tried first, which is still the case when they're as healthy.
+            mirror_candidates = [
+                (fs.from_url_scheme(
+                    url, digest, expand=expand, extension=extension),
+                 mirror_url)
+                for url, mirror_url in reversed(urls)]
+            candidates[0:0] = spack.mirror.health.sort(
+                mirror_candidates, key=lambda c: c[1])
 
             if self.default_fetcher.cachable:
                 for rel_path in reversed(list(self.mirror_paths)):
                     cache_fetcher = spack.caches.fetch_cache.fetcher(
                         rel_path, digest, expand=expand,
                         extension=extension)
-                    fetchers.insert(0, cache_fetcher)
+                    candidates.insert(0, (cache_fetcher, None))
+
+        # Skip the mirrors that failed too many times in this session
+        candidates = [(fetcher, mirror_url)
+                      for fetcher, mirror_url in candidates
+                      if not (mirror_url and
+                              spack.mirror.health.skip(mirror_url))]
+
+        # Race the first remote candidates, if requested
+        race = spack.config.get('config:mirror_race', 0)
+        racers = [c for c in candidates if _can_race(c[0])][:race]
+        if len(racers) < 2 or not self.save_filename:
+            racers = []
 
         def generate_fetchers():
-            for fetcher in fetchers:
-                yield fetcher
+            for fetcher, mirror_url in candidates:
+                if racers and fetcher is racers[0][0]:
+                    winner = self._race(racers)
+                    if winner:
+                        yield winner, None
+                        return
+                if any(fetcher is racer for racer, _ in racers):
+                    continue
+                yield fetcher, mirror_url
             # The search function may be expensive, so wait until now to
             # call it so the user can stop if a prior fetcher succeeded
             if self.search_fn and not mirror_only:
                 dynamic_fetchers = self.search_fn()
                 for fetcher in dynamic_fetchers:
-                    yield fetcher
+                    yield fetcher, None
 
-        for fetcher in generate_fetchers():
+        for fetcher, mirror_url in generate_fetchers():
             try:
                 fetcher.stage = self
                 self.fetcher = fetcher
                 self.fetcher.fetch()
+                if mirror_url:
+                    spack.mirror.health.record(
+                        mirror_url, elapsed=_response_time(fetcher))
                 break
             except spack.fetch_strategy.NoCacheError:
                 # Don't bother reporting when something is not cached.
@@ -469,12 +504,74 @@ def generate_fetchers():
             except spack.error.SpackError as e:
                 tty.msg("Fetching from %s failed." % fetcher)
                 tty.debug(e)
+                if mirror_url:
+                    spack.mirror.health.record(
+                        mirror_url, elapsed=_response_time(fetcher),
+                        failed=isinstance(e, fs.FetchConnectionError))
                 continue
         else:
             err_msg = "All fetchers failed for %s" % self.name
             self.fetcher = self.default_fetcher
             raise fs.FetchError(err_msg, None)
 
+    def _race(self, racers):
+        """Download the archive from all the ``racers`` at once.
+
+        Arguments:
+            racers (list): pairs of a fetcher and the URL of its mirror, or
+                None if it doesn't fetch from a mirror
+
+        Returns the fetcher of the first complete download that matches
+        the checksum, or None if all of them failed. The downloads that
+        lose the race are abandoned.
+        """
+        tty.msg("Fetching %s from %d locations at once" % (
+            os.path.basename(self.save_filename), len(racers)))
+        finished = threading.Event()
+        lock = threading.Lock()
+        winner = []
+
+        def run(index, fetcher, mirror_url):
+            partial_file = '%s.race%d.part' % (self.save_filename, index)
+            response_time = []
+            failed = False
+            try:
+                complete = _download(fetcher.url, partial_file,
+                                     fetcher.digest, finished, response_time)
+                with lock:
+                    if complete and not winner:
+                        os.rename(partial_file, self.save_filename)
+                        winner.append(fetcher)
+                        finished.set()
+            except Exception as e:
+                tty.debug('Fetching from %s failed: %s' % (fetcher, e))
+                failed = isinstance(e, (web_util.NoNetworkConnectionError,
+                                        socket.error, socket.timeout))
+            finally:
+                if os.path.exists(partial_file):
+                    os.remove(partial_file)
+                if mirror_url:
+                    spack.mirror.health.record(
+                        mirror_url, elapsed=(response_time or [None])[0],
+                        failed=failed)
+
+        threads = []
+        for index, (fetcher, mirror_url) in enumerate(racers):
+            thread = threading.Thread(
+                target=run, args=(index, fetcher, mirror_url))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        while not finished.is_set() and any(t.is_alive() for t in threads):
+            finished.wait(0.1)
+
+        if not winner:
+            return None
+        tty.msg("Fetched %s from %s" % (
+            os.path.basename(self.save_filename), winner[0]))
+        return winner[0]
+
     def check(self):
         """Check the downloaded archive against a checksum digest.
            No-op if this stage checks code out of a repository."""
@@ -493,13 +590,13 @@ def cache_local(self):
         spack.caches.fetch_cache.store(
             self.fetcher, self.mirror_paths.storage_path)
 
-    def cache_mirror(self, mirror, stats):
-        """Perform a fetch if the resource is not already cached
+    def mirror_archive(self, mirror):
+        """Return the absolute path of the archive of this Stage's resource
+        in ``mirror``, or None if the resource is not cached in it. This
+        does not require the stage to be created.
 
         Arguments:
             mirror (MirrorCache): the mirror to cache this Stage's resource in
-            stats (MirrorStats): this is updated depending on whether the
-                caching operation succeeded or failed
         """
         if isinstance(self.default_fetcher, fs.BundleFetchStrategy):
             # BundleFetchStrategy has no source to fetch. The associated
@@ -509,16 +606,28 @@ def cache_mirror(self, mirror, stats):
             # refers to a resource with a fixed ID, which is not the same
             # concept as whether there is anything to fetch at all) so we
             # must examine the type of the fetcher.
-            return
+            return None
 
         if (mirror.skip_unstable_versions and
             not fs.stable_target(self.default_fetcher)):
-            return
+            return None
 
-        absolute_storage_path = os.path.join(
-            mirror.root, self.mirror_paths.storage_path)
+        return os.path.join(mirror.root, self.mirror_paths.storage_path)
+
+    def cache_mirror(self, mirror, stats):
+        """Perform a fetch if the resource is not already cached
+
+        Arguments:
+            mirror (MirrorCache): the mirror to cache this Stage's resource in
+            stats (MirrorStats): this is updated depending on whether the
+                caching operation succeeded or failed
+        """
+        absolute_storage_path = self.mirror_archive(mirror)
+        if absolute_storage_path is None:
+            return
 
-        if os.path.exists(absolute_storage_path):
+        if spack.mirror.archive_is_valid(
+                self.default_fetcher, absolute_storage_path):
             stats.already_existed(absolute_storage_path)
         else:
             self.fetch()
@@ -637,6 +746,61 @@ def _add_to_root_stage(self):
                     install(src, destination_path)
 
 
+def _can_race(fetcher):
+    """Return True if ``fetcher`` can take part in a download race."""
+    # Races download with urllib, which doesn't know about the options
+    # passed to curl
+    return (type(fetcher) is fs.URLFetchStrategy and
+            not fetcher.extra_options)
+
+
+def _download(url, path, digest, stop, response_time):
+    """Download ``url`` to ``path``, unless ``stop`` is set first.
+
+    The time in seconds until the server responded is appended to the
+    ``response_time`` list, so that it is known even if the download fails
+    later.
+
+    Returns True if the download completed and matches ``digest``, and
+    False if it was stopped or doesn't match.
+    """
+    hasher = None
+    if digest and spack.config.get('config:checksum'):
+        hasher = crypto.hash_fun_for_digest(digest)()
+
+    start = time.time()
+    _, _, response = web_util.read_from_url(url)
+    response_time.append(time.time() - start)
+    try:
+        with open(path, 'wb') as f:
+            while not stop.is_set():
+                chunk = response.read(_race_chunk_size)
+                if not chunk:
+                    break
+                if hasher:
+                    hasher.update(chunk)
+                f.write(chunk)
+            else:
+                return False
+    finally:
+        response.close()
+
+    if hasher and hasher.hexdigest() != digest:
+        tty.debug('Checksum of %s does not match' % url)
+        return False
+    return True
+
+
+def _response_time(fetcher):
+    """Time in seconds until the server started sending the archive, in the
+    last fetch of ``fetcher``, or None if it is not known."""
+    return getattr(fetcher, 'response_time', None)
+
+
+#: Size of the chunks read by download races
+_race_chunk_size = 64 * 1024
+
+
 @pattern.composite(method_list=[
     'fetch', 'create', 'created', 'check', 'expand_archive', 'restage',
     'destroy', 'cache_local', 'cache_mirror', 'managed_by_spack'])
@@ -753,7 +917,7 @@ def purge():
 
 def get_checksums_for_versions(
         url_dict, name, first_stage_function=None, keep_stage=False,
-        fetch_options=None, batch=False):
+        fetch_options=None, batch=False, jobs=None):
     """Fetches and checksums archives from URLs.
 
     This function is called by both ``spack checksum`` and ``spack
@@ -771,6 +935,8 @@ def get_checksums_for_versions(
             or fetch all versions (true)
         fetch_options (dict): Options used for the fetcher (such as timeout
             or cookies)
+        jobs (int): number of archives fetched at once (default:
+            ``checksum_jobs``)
 
     Returns:
         (str): A multi-line string containing versions and corresponding hashes
@@ -804,31 +970,34 @@ def get_checksums_for_versions(
 
     tty.msg("Downloading...")
     version_hashes = []
-    i = 0
-    for url, version in zip(urls, versions):
-        try:
-            if fetch_options:
-                url_or_fs = fs.URLFetchStrategy(
-                    url, fetch_options=fetch_options)
+    remaining = list(zip(versions, urls))
+    if first_stage_function:
+        # Only run first_stage_function on the first archive fetched, so
+        # fetch one at a time until that succeeds
+        while remaining and not version_hashes:
+            version, url = remaining.pop(0)
+            checksum, error = _checksum_archive(
+                url, keep_stage, fetch_options, first_stage_function)
+            if error:
+                tty.msg(*error)
             else:
-                url_or_fs = url
-            with Stage(url_or_fs, keep=keep_stage) as stage:
-                # Fetch the archive
-                stage.fetch()
-                if i == 0 and first_stage_function:
-                    # Only run first_stage_function the first time,
-                    # no need to run it every time
-                    first_stage_function(stage, url)
-
-                # Checksum the archive and add it to the list
-                version_hashes.append((version, spack.util.crypto.checksum(
-                    hashlib.sha256, stage.archive_file)))
-                i += 1
-        except FailedDownloadError:
-            tty.msg("Failed to fetch {0}".format(url))
-        except Exception as e:
-            tty.msg("Something failed on {0}, skipping.".format(url),
-                    "  ({0})".format(e))
+                version_hashes.append((version, checksum))
+
+    jobs = min(jobs or checksum_jobs, len(remaining))
+    if jobs < 2:
+        results = [_checksum_archive(url, keep_stage, fetch_options)
+                   for _, url in remaining]
+    else:
+        results = _checksum_archives_in_parallel(
+            [url for _, url in remaining], keep_stage, fetch_options, jobs)
+
+    # Results come in the order of the versions, whatever the order in
+    # which the downloads finished
+    for (version, url), (checksum, error) in zip(remaining, results):
+        if error:
+            tty.msg(*error)
+        else:
+            version_hashes.append((version, checksum))
 
     if not version_hashes:
         tty.die("Could not fetch any versions for {0}".format(name))
@@ -849,6 +1018,77 @@ def get_checksums_for_versions(
     return version_lines
 
 
+#: Default number of archives fetched at once by get_checksums_for_versions()
+checksum_jobs = 8
+
+#: Size of the chunks hashed while an archive is downloaded
+_checksum_chunk_size = 64 * 1024
+
+
+def _can_stream(keep_stage, fetch_options, stage_function=None):
+    """Return True if archives can be checksummed without staging them."""
+    # Options like cookies and timeouts are only known to curl
+    return not (keep_stage or fetch_options or stage_function)
+
+
+def _checksum_archive(url, keep_stage=False, fetch_options=None,
+                      stage_function=None):
+    """Return the sha256 checksum of the archive at ``url``.
+
+    The archive is hashed as it is downloaded, unless it must be kept in a
+    stage or passed to ``stage_function``.
+
+    Returns:
+        tuple: the checksum, or None on failure, and the arguments of a
+        message describing the failure, or None on success
+    """
+    try:
+        if _can_stream(keep_stage, fetch_options, stage_function):
+            hasher = hashlib.sha256()
+            _, headers, response = web_util.read_from_url(url)
+            try:
+                for chunk in iter(
+                        lambda: response.read(_checksum_chunk_size), b''):
+                    hasher.update(chunk)
+            finally:
+                response.close()
+
+            # Warn if we got an HTML page rather than the archive, as when
+            # the archive is fetched into a stage
+            content_type = headers.get('Content-Type')
+            if content_type and 'text/html' in content_type:
+                fs.warn_content_type_mismatch(url)
+            return hasher.hexdigest(), None
+
+        if fetch_options:
+            url_or_fs = fs.URLFetchStrategy(url, fetch_options=fetch_options)
+        else:
+            url_or_fs = url
+        with Stage(url_or_fs, keep=keep_stage) as stage:
+            stage.fetch()
+            if stage_function:
+                stage_function(stage, url)
+            return crypto.checksum(hashlib.sha256, stage.archive_file), None
+    except (FailedDownloadError, web_util.SpackWebError):
+        return None, ("Failed to fetch {0}".format(url),)
+    except Exception as e:
+        return None, ("Something failed on {0}, skipping.".format(url),
+                      "  ({0})".format(e))
+
+
+def _checksum_archives_in_parallel(urls, keep_stage, fetch_options, jobs):
+    """Checksum the archives at ``urls`` using ``jobs`` workers, and return
+    the results of :func:`_checksum_archive` in the order of ``urls``.
+
+    Archives that are only hashed are downloaded by threads. Fetching into
+    a stage changes the working directory, so stages are fetched in
+    separate processes.
+    """
+    return spack.util.parallel.parallel_map(
+        _checksum_archive, urls, jobs, (keep_stage, fetch_options),
+        threads=_can_stream(keep_stage, fetch_options))
+
+
 class StageError(spack.error.SpackError):
     """"Superclass for all errors encountered during staging."""
 
@@ -5,11 +5,24 @@
 
 import pytest
 
+import hashlib
+import io
+import json
 import os
 import os.path
+import shutil
+import tarfile
 
+from contextlib import closing
+
+import spack.caches
+import spack.config
 import spack.spec
 import spack.binary_distribution
+import spack.util.file_cache
+import spack.util.spack_yaml as syaml
+import spack.util.web
+from spack.util.pattern import Bunch
 
 install = spack.main.SpackCommand('install')
 
@@ -39,3 +52,271 @@ def test_build_tarball_overwrite(
 
         with pytest.raises(spack.binary_distribution.NoOverwriteException):
             spack.binary_distribution.build_tarball(spec, '.', unsigned=True)
+
+
+@pytest.mark.parametrize('compression', ['gzip', 'parallel-gzip'])
+def test_build_tarball_single_pass_archive(
+        compression, install_mockery, mock_fetch, monkeypatch, tmpdir):
+
+    with tmpdir.as_cwd():
+        spec = spack.spec.Spec('trivial-install-test-package').concretized()
+        install(str(spec))
+
+        with spack.config.override('config:buildcache_compression',
+                                   compression):
+            spack.binary_distribution.build_tarball(spec, '.', unsigned=True)
+
+        spackfile_path = os.path.join(
+            spack.binary_distribution.build_cache_prefix('.'),
+            spack.binary_distribution.tarball_path_name(spec, '.spack'))
+        tarfile_name = spack.binary_distribution.tarball_name(
+            spec, '.tar.gz')
+        specfile_name = spack.binary_distribution.tarball_name(
+            spec, '.spec.yaml')
+
+        with closing(tarfile.open(spackfile_path, 'r')) as spackfile:
+            assert spackfile.getnames() == [tarfile_name, specfile_name]
+            spec_dict = syaml.load(
+                spackfile.extractfile(specfile_name).read())
+            payload = spackfile.extractfile(tarfile_name).read()
+
+        # The checksum computed while streaming matches the payload
+        checksum = spec_dict['binary_cache_checksum']['hash']
+        assert hashlib.sha256(payload).hexdigest() == checksum
+
+        # The payload contains the prefix and the relocation information
+        top = os.path.basename(spec.prefix)
+        fileobj = io.BytesIO(payload)
+        with closing(tarfile.open(fileobj=fileobj, mode='r:gz')) as tar:
+            names = tar.getnames()
+        assert top in names
+        assert os.path.join(top, '.spack', 'binary_distribution') in names
+        assert os.path.join(top, '.spack', 'spec.yaml') in names
+
+
+@pytest.mark.parametrize('compression', ['gzip', 'parallel-gzip'])
+def test_extract_tarball_verifies_checksum(
+        compression, install_mockery, mock_fetch, monkeypatch, tmpdir):
+
+    with tmpdir.as_cwd():
+        spec = spack.spec.Spec('trivial-install-test-package').concretized()
+        install(str(spec))
+
+        with spack.config.override('config:buildcache_compression',
+                                   compression):
+            spack.binary_distribution.build_tarball(spec, '.', unsigned=True)
+
+        spackfile_path = os.path.join(
+            spack.binary_distribution.build_cache_prefix('.'),
+            spack.binary_distribution.tarball_path_name(spec, '.spack'))
+        tarfile_name = spack.binary_distribution.tarball_name(
+            spec, '.tar.gz')
+        specfile_name = spack.binary_distribution.tarball_name(
+            spec, '.spec.yaml')
+        shutil.rmtree(spec.prefix)
+        parent = os.path.dirname(spec.prefix)
+
+        # A payload that doesn't match the checksum is not installed
+        tampered_path = str(tmpdir.join('tampered', os.path.basename(
+            spackfile_path)))
+        os.makedirs(os.path.dirname(tampered_path))
+        top = os.path.basename(spec.prefix)
+        with closing(tarfile.open(spackfile_path, 'r')) as spackfile:
+            with closing(tarfile.open(tampered_path, 'w')) as tampered:
+                payload = _payload(
+                    (tarfile.TarInfo(top + '/evil'), b'evil'))
+                info = tarfile.TarInfo(tarfile_name)
+                info.size = len(payload)
+                tampered.addfile(info, io.BytesIO(payload))
+                info = spackfile.getmember(specfile_name)
+                tampered.addfile(info, spackfile.extractfile(info))
+
+        with pytest.raises(spack.binary_distribution.NoChecksumException):
+            spack.binary_distribution.extract_tarball(
+                spec, tampered_path, unsigned=True)
+        assert not os.path.exists(spec.prefix)
+        assert os.listdir(parent) == []
+
+        # The right one is extracted in place, without temporary copies
+        spack.binary_distribution.extract_tarball(
+            spec, spackfile_path, unsigned=True)
+        assert os.path.exists(os.path.join(spec.prefix, 'dummy_file'))
+        assert os.listdir(parent) == [os.path.basename(spec.prefix)]
+        assert not os.path.exists(spackfile_path)
+
+
+def _payload(*members):
+    """Return a gzipped tarball of ``members``, pairs of a TarInfo and the
+    content of the member."""
+    data = io.BytesIO()
+    with closing(tarfile.open(fileobj=data, mode='w:gz')) as tar:
+        for info, content in members:
+            if content is not None:
+                info.size = len(content)
+                content = io.BytesIO(content)
+            tar.addfile(info, content)
+    return data.getvalue()
+
+
+def _link(name, target, type=tarfile.SYMTYPE):
+    info = tarfile.TarInfo(name)
+    info.type, info.linkname = type, target
+    return info, None
+
+
+@pytest.mark.parametrize('members', [
+    [(tarfile.TarInfo('/tmp/evil'), b'evil')],
+    [(tarfile.TarInfo('prefix/../../evil'), b'evil')],
+    [_link('prefix/passwd', '/etc/passwd', tarfile.LNKTYPE)],
+    [_link('prefix/lib', '/tmp'), (tarfile.TarInfo('prefix/lib/evil'), b'')],
+    [_link('prefix/evil', '/tmp/evil'), (tarfile.TarInfo('prefix/evil'), b'')],
+    [_link('prefix/null', '', tarfile.CHRTYPE)],
+])
+def test_extract_payload_rejects_unsafe_members(members, tmpdir):
+    spec = Bunch(prefix=str(tmpdir.join('install', 'prefix')))
+    data = _payload(*members)
+    payload = spack.binary_distribution._HashingReader(io.BytesIO(data))
+
+    with pytest.raises(spack.binary_distribution.InvalidTarballException):
+        spack.binary_distribution._extract_payload(
+            spec, payload, hashlib.sha256(data).hexdigest())
+    assert os.listdir(str(tmpdir)) == ['install']
+    assert os.listdir(str(tmpdir.join('install'))) == []
+
+
+class _CountingReader(io.BytesIO):
+    def __init__(self, data):
+        super(_CountingReader, self).__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = super(_CountingReader, self).read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+@pytest.mark.parametrize('valid', [True, False])
+def test_extract_payload_reads_once(valid, tmpdir):
+    spec = Bunch(prefix=str(tmpdir.join('install', 'prefix')))
+    data = _payload(
+        (tarfile.TarInfo('top/.spack/binary_distribution'), b''),
+        (tarfile.TarInfo('top/file'), b'content'))
+    checksum = hashlib.sha256(data if valid else b'').hexdigest()
+    stream = _CountingReader(data)
+    payload = spack.binary_distribution._HashingReader(stream)
+
+    if valid:
+        spack.binary_distribution._extract_payload(spec, payload, checksum)
+        assert sorted(os.listdir(spec.prefix)) == ['.spack', 'file']
+    else:
+        with pytest.raises(spack.binary_distribution.NoChecksumException):
+            spack.binary_distribution._extract_payload(
+                spec, payload, checksum)
+        assert os.listdir(str(tmpdir.join('install'))) == []
+    assert stream.bytes_read == len(data)
+
+
+def test_extract_tarball_without_payload(install_mockery, tmpdir):
+    spec = spack.spec.Spec('a').concretized()
+    spackfile_path = str(tmpdir.join(
+        spack.binary_distribution.tarball_name(spec, '.spack')))
+    specfile = spack.binary_distribution.tarball_name(spec, '.spec.yaml')
+    content = b'binary_cache_checksum: {hash: abc}\n'
+    with closing(tarfile.open(spackfile_path, 'w')) as tar:
+        info = tarfile.TarInfo(specfile)
+        info.size = len(content)
+        tar.addfile(info, io.BytesIO(content))
+
+    with pytest.raises(spack.binary_distribution.InvalidTarballException):
+        spack.binary_distribution.extract_tarball(
+            spec, spackfile_path, unsigned=True)
+
+
+def test_spec_index(install_mockery, mock_fetch, monkeypatch, tmpdir):
+    misc_cache = spack.util.file_cache.FileCache(str(tmpdir.join('cache')))
+    monkeypatch.setattr(spack.caches, 'misc_cache', misc_cache)
+    mirror_dir = str(tmpdir.join('mirror'))
+
+    spec = spack.spec.Spec('trivial-install-test-package').concretized()
+    install(str(spec))
+    spack.binary_distribution.build_tarball(
+        spec, mirror_dir, unsigned=True, regenerate_index=True)
+
+    cache_prefix = spack.binary_distribution.build_cache_prefix(mirror_dir)
+    specfile_name = spack.binary_distribution.tarball_name(
+        spec, '.spec.yaml')
+    index = spack.binary_distribution.get_spec_index(cache_prefix)
+    assert list(index) == [specfile_name]
+    index_spec = spack.spec.Spec.from_dict(index[specfile_name])
+    assert index_spec.dag_hash() == spec.dag_hash()
+
+    # The local copy is used as long as the index doesn't change
+    downloads = []
+    read_from_url = spack.binary_distribution._read_from_url
+
+    def _read_from_url(url):
+        downloads.append(os.path.basename(url))
+        return read_from_url(url)
+
+    monkeypatch.setattr(
+        spack.binary_distribution, '_read_from_url', _read_from_url)
+    assert spack.binary_distribution.get_spec_index(cache_prefix) == index
+    assert downloads == []
+
+    # Once the TTL expired, only the checksum is downloaded
+    with spack.config.override('config:buildcache_index_ttl', 0):
+        assert spack.binary_distribution.get_spec_index(cache_prefix) == index
+        assert downloads == ['index.json.gz.hash']
+
+        # A corrupted index is ignored
+        with open(os.path.join(cache_prefix, 'index.json.gz.hash'), 'w') as f:
+            f.write('0' * 64)
+        assert spack.binary_distribution.get_spec_index(cache_prefix) is None
+
+
+def test_needs_rebuild_uses_spec_index(
+        install_mockery, mock_fetch, monkeypatch, tmpdir):
+    misc_cache = spack.util.file_cache.FileCache(str(tmpdir.join('cache')))
+    monkeypatch.setattr(spack.caches, 'misc_cache', misc_cache)
+    mirror_dir = str(tmpdir.join('mirror'))
+
+    spec = spack.spec.Spec('trivial-install-test-package').concretized()
+    install(str(spec))
+    spack.binary_distribution.build_tarball(
+        spec, mirror_dir, unsigned=True, regenerate_index=True)
+    # Prime the local copy of the index
+    spack.binary_distribution.get_spec_index(
+        spack.binary_distribution.build_cache_prefix(mirror_dir))
+
+    def _fail(*args, **kwargs):
+        raise AssertionError('the mirror should not be read')
+
+    monkeypatch.setattr(spack.util.web, 'read_from_url', _fail)
+    monkeypatch.setattr(spack.binary_distribution, '_read_from_url', _fail)
+    assert not spack.binary_distribution.needs_rebuild(spec, mirror_dir)
+
+
+def test_check_specs_against_mirrors(
+        install_mockery, mock_fetch, monkeypatch, tmpdir):
+    misc_cache = spack.util.file_cache.FileCache(str(tmpdir.join('cache')))
+    monkeypatch.setattr(spack.caches, 'misc_cache', misc_cache)
+    mirror_dir = str(tmpdir.join('mirror'))
+
+    built = spack.spec.Spec('trivial-install-test-package').concretized()
+    install(str(built))
+    spack.binary_distribution.build_tarball(
+        built, mirror_dir, unsigned=True, regenerate_index=True)
+    missing = spack.spec.Spec('a').concretized()
+
+    rebuilds = spack.binary_distribution.needs_rebuilds(
+        [built, missing], [mirror_dir, mirror_dir], rebuild_on_errors=True)
+    assert rebuilds == {mirror_dir: [missing]}
+
+    output_file = str(tmpdir.join('rebuilds.json'))
+    mirrors = {'test': mirror_dir}
+    assert spack.binary_distribution.check_specs_against_mirrors(
+        mirrors, [built, missing], output_file, rebuild_on_errors=True) == 1
+    with open(output_file) as f:
+        output = json.load(f)
+    assert [s['hash'] for s in output[mirror_dir]['rebuildSpecs']] == [
+        missing.dag_hash()]
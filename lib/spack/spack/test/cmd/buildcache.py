@@ -4,7 +4,10 @@
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
 import errno
+import multiprocessing
+import os
 import platform
+import sys
 
 import pytest
 
@@ -56,3 +59,72 @@ def test_buildcache_create_fail_on_perm_denied(
                    '--unsigned', 'trivial-install-test-package')
     assert error.value.errno == errno.EACCES
     tmpdir.chmod(0o700)
+
+
+def test_buildcache_create_parallel(
+        install_mockery, mock_fetch, monkeypatch, tmpdir):
+    """Ensure that many packages are written at once, and the index is
+    regenerated only at the end."""
+    install('libdwarf')
+
+    indexes = []
+    generate_package_index = spack.binary_distribution.generate_package_index
+
+    def _generate_package_index(cache_prefix):
+        indexes.append(cache_prefix)
+        generate_package_index(cache_prefix)
+
+    monkeypatch.setattr(spack.binary_distribution, 'generate_package_index',
+                        _generate_package_index)
+
+    output = buildcache('create', '-d', str(tmpdir), '-j', '2',
+                        '--unsigned', 'libdwarf')
+
+    assert len(indexes) == 1
+    assert 'Created 2 buildcache entries' in output
+    files = os.listdir(str(tmpdir.join('build_cache')))
+    assert len([f for f in files if f.endswith('.spec.yaml')]) == 2
+    assert 'index.json.gz' in files
+
+
+def test_buildcache_create_parallel_fails(
+        install_mockery, mock_fetch, monkeypatch, tmpdir):
+    """Ensure that a package exiting with an error doesn't hang the
+    parallel creation, and that the error is reported."""
+    install('libdwarf')
+
+    def _build_tarball(spec, *args, **kwargs):
+        if spec.name == 'libelf':
+            sys.exit(1)
+        return 0
+
+    monkeypatch.setattr(spack.binary_distribution, 'build_tarball',
+                        _build_tarball)
+    monkeypatch.setattr(spack.binary_distribution, 'generate_package_index',
+                        lambda cache_prefix: None)
+
+    buildcache('create', '-d', str(tmpdir), '-j', '2',
+               '--unsigned', 'libdwarf', fail_on_error=False)
+    assert buildcache.returncode == 1
+
+
+@pytest.mark.parametrize('jobs,inner_jobs', [('1', None), ('2', 1)])
+def test_buildcache_create_inner_jobs(
+        jobs, inner_jobs, install_mockery, mock_fetch, monkeypatch, tmpdir):
+    """Tarballs built by concurrent threads scan their prefixes serially."""
+    install('libdwarf')
+    calls = []
+
+    def _build_tarball(spec, *args, **kwargs):
+        calls.append(kwargs['jobs'])
+        return 0
+
+    monkeypatch.setattr(spack.binary_distribution, 'build_tarball',
+                        _build_tarball)
+    monkeypatch.setattr(spack.binary_distribution, 'generate_package_index',
+                        lambda cache_prefix: None)
+    monkeypatch.setattr(multiprocessing, 'cpu_count', lambda: 4)
+
+    buildcache('create', '-d', str(tmpdir), '-j', jobs,
+               '--unsigned', 'libdwarf')
+    assert calls == [inner_jobs] * 2
@@ -139,6 +139,33 @@ def test_concretize():
     assert any(x.name == 'mpileaks' for x in env_specs)
 
 
+def test_concretize_parallel():
+    serial = ev.create('serial')
+    parallel = ev.create('parallel')
+    for e in (serial, parallel):
+        for spec in ('mpileaks', 'libelf@0.8.12', 'dyninst', 'callpath'):
+            e.add(spec)
+
+    serial.concretize()
+    concretized = parallel.concretize(jobs=2)
+
+    assert [str(u) for u, _ in concretized] == [
+        'mpileaks', 'libelf@0.8.12', 'dyninst', 'callpath']
+    assert parallel.concretized_order == serial.concretized_order
+    for h in parallel.concretized_order:
+        assert parallel.specs_by_hash[h].concrete
+        assert parallel.specs_by_hash[h].dag_hash() == \
+            serial.specs_by_hash[h].dag_hash()
+
+
+def test_concretize_parallel_error():
+    e = ev.create('test')
+    e.add('mpileaks')
+    e.add('conflict%clang+foo')
+    with pytest.raises(spack.spec.ConflictsInSpecError):
+        e.concretize(jobs=2)
+
+
 def test_env_install_all(install_mockery, mock_fetch):
     e = ev.create('test')
     e.add('cmake-client')
@@ -89,6 +89,38 @@ def test_mirror_skip_unstable(tmpdir_factory, mock_packages, config,
             set(['trivial-pkg-with-valid-hash']))
 
 
+@pytest.mark.disable_clean_stage_check
+def test_mirror_create_parallel(tmpdir_factory, mock_packages, config,
+                                source_for_pkg_with_hash, monkeypatch):
+    mirror_dir = str(tmpdir_factory.mktemp('mirror-dir'))
+
+    # The archive of trivial-install-test-package doesn't exist
+    pkg = spack.repo.get('trivial-install-test-package')
+    monkeypatch.setitem(pkg.versions[spack.version.Version('1.0')], 'url',
+                        'file:///no/such/trivial_install-1.0.tar.gz')
+    specs = [spack.spec.Spec(x).concretized() for x in
+             ['trivial-pkg-with-valid-hash', 'trivial-install-test-package']]
+    present, mirrored, error = spack.mirror.create(
+        mirror_dir, specs, jobs=2, connections_per_host=1)
+    assert (present, mirrored, error) == ([], specs[:1], specs[1:])
+
+    # Valid archives are found without creating any stage
+    def fail_create(stage):
+        raise AssertionError('stage created for ' + stage.name)
+    monkeypatch.setattr(spack.stage.Stage, 'create', fail_create)
+    present, mirrored, error = spack.mirror.create(mirror_dir, specs[:1])
+    assert (present, mirrored, error) == (specs[:1], [], [])
+    monkeypatch.undo()
+
+    # Archives that don't match their checksum are fetched again
+    archive = specs[0].package.stage[0].mirror_archive(
+        spack.caches.MirrorCache(mirror_dir, False))
+    with open(archive, 'w') as f:
+        f.write('corrupted')
+    present, mirrored, error = spack.mirror.create(mirror_dir, specs[:1])
+    assert (present, mirrored, error) == ([], specs[:1], [])
+
+
 class MockMirrorArgs(object):
     def __init__(self, specs=None, all=False, file=None,
                  versions_per_spec=None, dependencies=False,
@@ -4,6 +4,7 @@
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 import os
 from spack.main import SpackCommand
+import spack.directory_layout
 import spack.store
 
 install = SpackCommand('install')
@@ -51,3 +52,50 @@ def test_reindex_with_deprecated_packages(mock_packages, mock_archive,
 
     assert spack.store.db.query(installed=any) == all_installed
     assert spack.store.db.query(installed=True) == non_deprecated
+
+
+def test_reindex_parallel(mock_packages, mock_archive, mock_fetch,
+                          install_mockery):
+    install('libelf@0.8.13')
+    install('libelf@0.8.12')
+
+    all_installed = spack.store.db.query()
+
+    os.remove(spack.store.db._index_path)
+    reindex('-j', '2')
+
+    assert spack.store.db.query() == all_installed
+
+
+def test_reindex_incremental(mock_packages, mock_archive, mock_fetch,
+                             install_mockery, monkeypatch):
+    install('libelf@0.8.13')
+    install('libelf@0.8.12')
+
+    all_installed = spack.store.db.query()
+    reindex()
+
+    read_files = []
+    read_specs = spack.directory_layout.YamlDirectoryLayout.read_specs
+
+    def _read_specs(layout, paths, jobs=None):
+        read_files.extend(paths)
+        return read_specs(layout, paths, jobs)
+
+    monkeypatch.setattr(spack.directory_layout.YamlDirectoryLayout,
+                        'read_specs', _read_specs)
+
+    # Nothing changed since the last reindex
+    reindex('--incremental')
+    assert not read_files
+    assert spack.store.db.query() == all_installed
+
+    # Only the modified spec file is read again
+    spec = spack.store.db.query_one('libelf@0.8.12')
+    spec_file = spack.store.layout.spec_file_path(spec)
+    mtime = os.stat(spec_file).st_mtime
+    os.utime(spec_file, (mtime + 10, mtime + 10))
+
+    reindex('--incremental')
+    assert read_files == [spec_file]
+    assert spack.store.db.query() == all_installed
@@ -110,6 +110,32 @@ def test_installed_upstream(upstream_and_downstream_db):
         downstream_db._check_ref_counts()
 
 
+@pytest.mark.usefixtures('config')
+def test_query_concrete_upstream(upstream_and_downstream_db):
+    upstream_write_db, upstream_db, upstream_layout,\
+        downstream_db, downstream_layout = (upstream_and_downstream_db)
+
+    mock_repo = MockPackageMultiRepo()
+    mock_repo.add_package('x', [], [])
+    mock_repo.add_package('y', [], [])
+
+    with spack.repo.swap(mock_repo):
+        spec = spack.spec.Spec('x')
+        spec.concretize()
+
+        # A spec installed only upstream is found by hash
+        upstream_write_db.add(spec, upstream_layout)
+        upstream_db._read()
+        assert downstream_db.query_local(spec) == []
+        assert downstream_db.query(spec) == [spec]
+        assert downstream_db.query_one(spec) == spec
+
+        # Concrete specs installed nowhere are not found
+        other = spack.spec.Spec('y')
+        other.concretize()
+        assert downstream_db.query(other) == []
+
+
 @pytest.mark.usefixtures('config')
 def test_removed_upstream_dep(upstream_and_downstream_db):
     upstream_write_db, upstream_db, upstream_layout,\
@@ -888,3 +914,173 @@ def _raise(db, spec):
     with pytest.raises(Exception):
         with spack.store.db.prefix_write_lock(s):
             assert False
+
+
+@pytest.mark.skipif(not spack.database._use_sqlite,
+                    reason='sqlite3 is not available')
+def test_sqlite_index_migration(mutable_database):
+    """Test migrating the index between JSON and SQLite."""
+    root = mutable_database.root
+    hashes = set(s.dag_hash() for s in mutable_database.query(installed=any))
+
+    with spack.config.override('config:db_format', 'sqlite'):
+        db = spack.database.Database(root)
+        assert set(s.dag_hash() for s in db.query(installed=any)) == hashes
+    assert os.path.exists(db._sqlite_path)
+
+    with spack.config.override('config:db_format', 'json'):
+        db = spack.database.Database(root)
+        assert set(s.dag_hash() for s in db.query(installed=any)) == hashes
+    assert os.path.exists(db._index_path)
+
+
+@pytest.mark.skipif(not spack.database._use_sqlite,
+                    reason='sqlite3 is not available')
+def test_mixed_index_formats(mutable_database):
+    """Test that processes configured with different formats see each
+    other's changes, without removing each other's index."""
+    root = mutable_database.root
+    with spack.config.override('config:db_format', 'sqlite'):
+        sqlite_db = spack.database.Database(root)
+    with spack.config.override('config:db_format', 'json'):
+        json_db = spack.database.Database(root)
+
+    with sqlite_db.read_transaction():
+        assert sqlite_db.query('mpileaks ^mpich', installed=any)
+    json_db.remove('mpileaks ^mpich')
+    with sqlite_db.read_transaction():
+        assert not sqlite_db.query('mpileaks ^mpich', installed=any)
+
+    sqlite_db.remove('mpileaks ^mpich2')
+    with json_db.read_transaction():
+        assert not json_db.query('mpileaks ^mpich2', installed=any)
+
+    assert os.path.exists(sqlite_db._sqlite_path)
+    assert os.path.exists(json_db._index_path)
+
+    # The index written last is read, whatever the times of the files
+    json_db.remove('mpileaks ^zmpi')
+    mtime = os.stat(json_db._index_path).st_mtime
+    os.utime(sqlite_db._sqlite_path, (mtime + 10, mtime + 10))
+    with sqlite_db.read_transaction():
+        assert not sqlite_db.query('mpileaks ^zmpi', installed=any)
+
+
+@pytest.mark.skipif(not spack.database._use_sqlite,
+                    reason='sqlite3 is not available')
+def test_sqlite_index_recreated(mutable_database):
+    """Test that readers notice when the SQLite index is created again,
+    even if its generation catches up with the one they read."""
+    with spack.config.override('config:db_format', 'sqlite'):
+        reader = spack.database.Database(mutable_database.root)
+        writer = spack.database.Database(mutable_database.root)
+        writer.remove('mpileaks ^mpich')
+        with reader.read_transaction():
+            assert not reader.query('mpileaks ^mpich', installed=any)
+
+        # The new index is migrated from the older JSON one
+        os.remove(reader._sqlite_path)
+        writer = spack.database.Database(mutable_database.root)
+        writer.remove('mpileaks ^mpich2')
+        assert writer._sqlite_generation == reader._sqlite_generation
+
+        with reader.read_transaction():
+            assert reader.query('mpileaks ^mpich', installed=any)
+            assert not reader.query('mpileaks ^mpich2', installed=any)
+
+
+@pytest.mark.skipif(not spack.database._use_sqlite,
+                    reason='sqlite3 is not available')
+def test_sqlite_index_incremental(mutable_database):
+    """Test that only the records that changed are read and written."""
+    with spack.config.override('config:db_format', 'sqlite'):
+        writer = spack.database.Database(mutable_database.root)
+        reader = spack.database.Database(mutable_database.root)
+
+        with reader.read_transaction():
+            mpich = reader.get_record('mpich')
+            callpath = reader.get_record('callpath ^mpich')
+
+        writer.remove('mpileaks ^mpich')
+        with reader.read_transaction():
+            assert not reader.query('mpileaks ^mpich', installed=any)
+            reader._check_ref_counts()
+
+            # Unchanged specs are not read again
+            assert reader.get_record('mpich').spec is mpich.spec
+            assert reader.get_record('mpich').ref_count == 1
+            assert reader.get_record('callpath ^mpich').spec is callpath.spec
+            assert reader.get_record('callpath ^mpich').ref_count == 0
+
+
+def test_specs_read_lazily(database):
+    """Test that the database only constructs the specs it needs."""
+    mpileaks = database.query_one('mpileaks ^mpich')
+    callpath = database.query_one('callpath ^mpich')
+    dependents = database.installed_relatives(callpath, 'parents')
+
+    db = spack.database.Database(database.root)
+    with db.read_transaction():
+        spec = db.get_by_hash(mpileaks.dag_hash())[0]
+        read = set(k for k, rec in db._data.items()
+                   if isinstance(rec._spec, spack.spec.Spec))
+    assert spec == mpileaks
+    assert read == set(s.dag_hash() for s in spec.traverse())
+
+    # Dependents are found even if their specs were not read yet
+    assert db.installed_relatives(callpath, 'parents') == dependents
+
+
+def test_dependents_of_lazy_specs(database):
+    """Test that specs read from the database know all their dependents,
+    even those whose specs were not read yet."""
+    callpath = database.query_one('callpath ^mpich')
+    dependents = set(s.dag_hash() for s in callpath.dependents())
+    parents = set(s.dag_hash()
+                  for s in callpath.traverse(direction='parents'))
+    assert dependents
+
+    for accessor in ('dependents', 'dependents_dict', 'traverse'):
+        db = spack.database.Database(database.root)
+        with db.read_transaction():
+            spec = db.get_by_hash(callpath.dag_hash())[0]
+        if accessor == 'dependents':
+            found = set(s.dag_hash() for s in spec.dependents())
+            assert found == dependents
+        elif accessor == 'dependents_dict':
+            found = set(d.parent.dag_hash()
+                        for d in spec.dependents_dict().values())
+            assert found == dependents
+        else:
+            found = set(s.dag_hash()
+                        for s in spec.traverse(direction='parents'))
+            assert found == parents
+
+    # Copies only know the dependents they are given
+    assert not spec.copy().dependents()
+
+
+def test_query_candidates(mutable_database):
+    """Test that queries only look at the records that may match."""
+    def candidates(query):
+        with mutable_database.read_transaction():
+            keys = mutable_database._query_candidates(spack.spec.Spec(query))
+            return sorted(mutable_database._data[k].name for k in keys)
+
+    assert candidates('mpileaks') == ['mpileaks'] * 3
+    assert candidates('mpi@:10') == ['mpich', 'mpich2', 'zmpi']
+    assert len(candidates('^mpich')) == len(mutable_database._data)
+
+    # The index is maintained when records are removed and added
+    rec = mutable_database.get_record('mpileaks ^mpich')
+    mutable_database.remove('mpileaks ^mpich')
+    assert candidates('mpileaks') == ['mpileaks'] * 2
+    mutable_database.add(rec.spec, spack.store.layout)
+    assert candidates('mpileaks') == ['mpileaks'] * 3
+
+
+def test_query_virtual(database):
+    """Test that virtual queries match the installed providers."""
+    providers = database.query('mpi')
+    assert sorted(s.name for s in providers) == ['mpich', 'mpich2', 'zmpi']
+    assert all(s.package.provides('mpi') for s in providers)
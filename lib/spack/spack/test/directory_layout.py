@@ -13,6 +13,7 @@
 import spack.repo
 from spack.directory_layout import YamlDirectoryLayout
 from spack.directory_layout import InvalidDirectoryLayoutParametersError
+from spack.directory_layout import SpecReadError
 from spack.spec import Spec
 
 # number of packages to test (to reduce test time)
@@ -230,6 +231,24 @@ def test_find(layout_and_dir, config, mock_packages):
         assert found_specs[name].eq_dag(spec)
 
 
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_read_spec_rejects_python_tags(tmpdir, config, jobs):
+    """Spec files are parsed without constructing arbitrary objects."""
+    layout = YamlDirectoryLayout(str(tmpdir))
+    marker = tmpdir.join('marker')
+    paths = []
+    for name in ('a', 'b'):
+        spec_file = tmpdir.join(name, 'spec.yaml')
+        spec_file.write(
+            "spec: !!python/object/apply:os.system ['touch %s']\n" % marker,
+            ensure=True)
+        paths.append(str(spec_file))
+
+    with pytest.raises(SpecReadError):
+        layout.read_specs(paths, jobs=jobs)
+    assert not marker.exists()
+
+
 def test_yaml_directory_layout_build_path(tmpdir, config):
     """This tests build path method."""
     spec = Spec('python')
@@ -11,6 +11,8 @@
 
 from llnl.util.filesystem import working_dir, touch, mkdirp
 
+import spack.caches
+import spack.fetch_strategy
 import spack.repo
 import spack.config
 from spack.spec import Spec
@@ -272,3 +274,65 @@ def test_gitsubmodules_delete(mock_git_repository, config, mutable_mock_repo):
         file_path = os.path.join(pkg.stage.source_path,
                                  'third_party/submodule1')
         assert not os.path.isdir(file_path)
+
+
+@pytest.fixture
+def git_cache(tmpdir, monkeypatch, config):
+    """Enable the git cache, in a temporary directory."""
+    cache = spack.fetch_strategy.FsCache(str(tmpdir.join('cache')))
+    monkeypatch.setattr(spack.caches.fetch_cache, 'git_repository',
+                        cache.git_repository, raising=False)
+    with spack.config.override('config:git_cache', True):
+        yield cache
+
+
+@pytest.mark.parametrize("type_of_test", ['master', 'branch', 'tag', 'commit'])
+def test_fetch_from_git_cache(type_of_test, git_cache, git_version,
+                              mock_git_repository, config, mutable_mock_repo):
+    """Stage the repo twice through the cache, and check that stages look
+    like clones of the remote repository."""
+    t = mock_git_repository.checks[type_of_test]
+    h = mock_git_repository.hash
+    git = mock_git_repository.git_exe
+
+    spec = Spec('git-test')
+    spec.concretize()
+    pkg = spack.repo.get(spec)
+    pkg.versions[ver('git')] = t.args
+
+    for _ in range(2):
+        with pkg.stage:
+            pkg.do_stage()
+            with working_dir(pkg.stage.source_path):
+                assert h('HEAD') == h(t.revision)
+                assert os.path.isfile(t.file)
+                remote = git('config', 'remote.origin.url', output=str)
+                assert remote.strip() == mock_git_repository.url
+
+    assert os.path.isdir(git_cache.git_repository(mock_git_repository.url))
+
+
+def test_git_cache_skips_fetch(git_cache, mock_git_repository, config,
+                               mutable_mock_repo):
+    """A commit already in the cache is staged without contacting the
+    remote repository."""
+    t = mock_git_repository.checks['commit']
+    spec = Spec('git-test')
+    spec.concretize()
+    pkg = spack.repo.get(spec)
+    pkg.versions[ver('git')] = t.args
+    with pkg.stage:
+        pkg.do_stage()
+
+    # Pretend an unreachable repository has the same cache
+    url = 'file:///no/such/mock-git-repo'
+    shutil.copytree(git_cache.git_repository(mock_git_repository.url),
+                    git_cache.git_repository(url))
+
+    pkg = spack.repo.get(spec)
+    pkg.versions[ver('git')] = {'git': url, 'commit': t.revision}
+    with pkg.stage:
+        pkg.do_stage()
+        with working_dir(pkg.stage.source_path):
+            assert mock_git_repository.hash('HEAD') == t.revision
+            assert os.path.isfile(t.file)
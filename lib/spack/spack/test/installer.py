@@ -3,6 +3,7 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+import multiprocessing
 import os
 import py
 import pytest
@@ -12,7 +13,9 @@
 import llnl.util.lock as ulk
 
 import spack.binary_distribution
+import spack.build_environment
 import spack.compilers
+import spack.config
 import spack.directory_layout as dl
 import spack.installer as inst
 import spack.package_prefs as prefs
@@ -843,3 +846,135 @@ def test_install_skip_patch(install_mockery, mock_fetch):
     installer.install(fake=False, skip_patch=True)
 
     assert 'b' in installer.installed
+
+
+def test_install_package_jobs(install_mockery, mock_fetch, monkeypatch):
+    """Test building several packages at once."""
+    fork = spack.build_environment.fork
+    builds = {}
+
+    def _fork(pkg, function, dirty, fake, jobs=None):
+        builds[pkg.name] = jobs
+        return fork(pkg, function, dirty, fake, jobs)
+
+    monkeypatch.setattr(spack.build_environment, 'fork', _fork)
+
+    spec, installer = create_installer('mpileaks')
+    with spack.config.override('config:build_jobs', 4):
+        installer.install(fake=True, package_jobs=2)
+
+    assert not installer.building
+    assert spec.package.installed
+    assert set(builds) == set(s.name for s in spec.traverse())
+    jobs = max(1, min(4, multiprocessing.cpu_count()) // 2)
+    assert all(j == jobs for j in builds.values())
+
+
+def test_install_cooperative(install_mockery, mock_fetch, monkeypatch,
+                             capfd):
+    """Test retrying tasks locked by another process in cooperative mode."""
+    orig_fn = inst.PackageInstaller._ensure_locked
+    locked = {'dependency-install': 2}
+
+    def _locked(installer, lock_type, pkg):
+        if locked.get(pkg.name):
+            if lock_type == 'read':
+                locked[pkg.name] -= 1
+            return lock_type, None
+        return orig_fn(installer, lock_type, pkg)
+
+    monkeypatch.setattr(inst.PackageInstaller, '_ensure_locked', _locked)
+    monkeypatch.setattr(inst, '_min_retry_delay', 0.01)
+
+    spec, installer = create_installer('dependent-install')
+    installer.install(cooperative=True)
+
+    assert spec.package.installed
+    dep_id = inst.package_id(spec['dependency-install'].package)
+    assert installer.lock_failures == {dep_id: 2}
+    assert not installer.deferred
+
+    out = capfd.readouterr()[0]
+    assert 'in progress by another process' in out
+    assert '[1/2] {0} installed'.format(dep_id) in out
+    assert '[2/2]' in out
+
+
+def test_install_prefetch(install_mockery, mock_fetch, capfd):
+    """Test staging sources in the background while installing."""
+    spec, installer = create_installer('dependent-install')
+    with spack.config.override('config:prefetch_jobs', 2):
+        installer.install(restage=True)
+
+    # The first package may be needed before its sources are prefetched,
+    # the second one is built only after it
+    assert spec.package.installed
+    assert inst.package_id(spec.package) in installer.prefetched
+    assert not installer.prefetches
+
+    # The build found the sources staged
+    out = capfd.readouterr()[0]
+    assert 'Already staged' in out
+
+
+@pytest.mark.disable_clean_stage_check
+def test_install_prefetch_failed_dependency(install_mockery, mock_fetch,
+                                            monkeypatch):
+    """Test the background staging of packages that are not installed."""
+    def _install(installer, task, **kwargs):
+        raise inst.InstallError('mock failure')
+
+    monkeypatch.setattr(inst.PackageInstaller, '_install_task', _install)
+
+    spec, installer = create_installer('dependent-install')
+    with spack.config.override('config:prefetch_jobs', 2):
+        with pytest.raises(inst.InstallError):
+            installer.install()
+
+    # The stage prefetched for the package that was skipped is removed
+    assert not installer.prefetches
+    assert not os.path.exists(spec.package.stage.path)
+
+
+def _install_binary(binary_spec, unsigned):
+    """Mock the extraction of a binary in a child process."""
+    if binary_spec.name == 'dependency-install':
+        raise SystemExit(1)
+    spack.store.layout.create_install_directory(binary_spec)
+
+
+@pytest.mark.parametrize('failed', [False, True])
+def test_install_from_caches(install_mockery, monkeypatch, failed):
+    """Test installing a DAG from build caches in bulk."""
+    installed = []
+
+    def _install_from_cache(pkg, cache_only, explicit, unsigned=False):
+        installed.append(pkg.name)
+        spack.store.layout.create_install_directory(pkg.spec)
+        spack.store.db.add(pkg.spec, spack.store.layout, explicit=explicit)
+        return True
+
+    monkeypatch.setattr(inst, '_find_binary_spec', lambda pkg: pkg.spec)
+    monkeypatch.setattr(inst, '_install_from_cache', _install_from_cache)
+    if failed:
+        monkeypatch.setattr(inst, '_install_binary', _install_binary)
+    else:
+        monkeypatch.setattr(inst, '_install_binary',
+                            lambda s, u: spack.store.layout
+                            .create_install_directory(s))
+
+    spec, installer = create_installer('dependent-install')
+    dep = spec['dependency-install']
+    with spack.config.override('mirrors', {'test': 'file:///no/such/dir'}):
+        with spack.config.override('config:binary_install_jobs', 2):
+            installer.install()
+
+    # When the dependency could not be installed in bulk, neither is the
+    # dependent, and both are installed one at a time instead
+    assert spec.package.installed
+    assert dep.package.installed
+    assert spec.package.installed_from_binary_cache is not failed
+    assert dep.package.installed_from_binary_cache is not failed
+    assert installed == (['dependency-install', 'dependent-install']
+                         if failed else [])
+    assert not installer.build_tasks
@@ -3,6 +3,8 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 import collections
+import multiprocessing
+import multiprocessing.pool
 import os.path
 import platform
 import re
@@ -387,3 +389,194 @@ def test_relocate_text_bin_raise_if_new_prefix_is_longer():
         spack.relocate.relocate_text_bin(
             ['item'], short_prefix, long_prefix, None, None, None
         )
+
+
+@pytest.mark.requires_executables('/usr/bin/gcc')
+def test_mime_types(hello_world, tmpdir):
+    executable = str(hello_world(rpaths=['/usr/lib']))
+    text_file = tmpdir.join('script.sh')
+    text_file.write('#!/bin/bash\necho "Hello world!"\n')
+    empty_file = tmpdir.join('empty')
+    empty_file.write('')
+    data_file = tmpdir.join('data.bin')
+    data_file.write_binary(b'\x00\x01\x02\x03' * 100)
+    link = tmpdir.join('link')
+    link.mksymlinkto(executable)
+    files = [str(x) for x in (text_file, empty_file, data_file, link)]
+
+    types = spack.relocate.mime_types([executable] + files)
+
+    assert spack.relocate.needs_binary_relocation(*types[executable])
+    assert spack.relocate.needs_text_relocation(*types[str(text_file)])
+    assert types[str(empty_file)] == ('inode', 'x-empty')
+    assert types[str(data_file)] == ('application', 'octet-stream')
+    assert types[str(link)] == ('inode', 'symlink')
+    assert spack.relocate.is_binary(str(data_file))
+    assert not spack.relocate.is_binary(str(text_file))
+
+
+def test_strings_containing(tmpdir):
+    binary = tmpdir.join('binary')
+    binary.write_binary(
+        b'\x00\x01/usr/lib:/opt/spack/lib\x00\x02' + b'x' * 5000 +
+        b' -I/opt/spack/include\n/opt/other\x00/opt/spack'
+    )
+
+    strings = spack.relocate._strings_containing(str(binary), '/opt/spack')
+
+    assert strings == set([
+        '/usr/lib:/opt/spack/lib', '-I/opt/spack/include', '/opt/spack'
+    ])
+    assert not spack.relocate._strings_containing(str(binary), '/nowhere')
+
+
+@pytest.mark.parametrize('nfiles', [1, 20])
+def test_relocate_text_nested_prefixes(tmpdir, nfiles):
+    text = (
+        '#!/bin/bash /old/spack/bin/sbang\n'
+        'prefix=/old/spack/opt/pkg-abc\n'
+        'CFLAGS=-I/old/spack/opt/dep-xyz/include -I/old/spack/opt/other\n'
+        'unrelated=/home/old/spack/opt/pkg-abc\n'
+    )
+    files = []
+    for i in range(nfiles):
+        f = tmpdir.join('script{0}.sh'.format(i))
+        f.write(text)
+        files.append(str(f))
+    untouched = tmpdir.join('untouched.txt')
+    untouched.write('nothing to see here\n')
+    mtime = os.stat(str(untouched)).st_mtime
+
+    spack.relocate.relocate_text(
+        files + [str(untouched)],
+        '/old/spack/opt', '/new/opt',
+        '/old/spack/opt/pkg-abc', '/new/opt/pkg-abc',
+        '/old/spack', '/new/spack',
+        {'/old/spack/opt/dep-xyz': '/deps/dep-xyz'}
+    )
+
+    for f in files:
+        with open(f) as relocated:
+            assert relocated.read() == (
+                '#!/bin/bash /new/spack/bin/sbang\n'
+                'prefix=/new/opt/pkg-abc\n'
+                'CFLAGS=-I/deps/dep-xyz/include -I/new/opt/other\n'
+                'unrelated=/home/old/spack/opt/pkg-abc\n'
+            )
+    assert untouched.read() == 'nothing to see here\n'
+    assert os.stat(str(untouched)).st_mtime == mtime
+
+
+def test_relocate_text_bin_nested_prefixes(tmpdir):
+    binary = tmpdir.join('binary')
+    binary.write_binary(
+        b'\x00/old/spack/opt/dep-xyz/lib\x00/old/spack/share\x00'
+    )
+
+    spack.relocate.relocate_text_bin(
+        [str(binary)], '/old/spack/opt/pkg', '/new/opt/pkg',
+        '/old/spack', '/new/spack',
+        {'/old/spack/opt/dep-xyz': '/d/dep-xyz',
+         '/old/spack/opt/too-long': '/a/much/longer/prefix/than/before'}
+    )
+
+    padding = b'/' * (len('/old/spack/opt/dep-xyz') - len('/d/dep-xyz'))
+    assert binary.read_binary() == (
+        b'\x00' + padding + b'/d/dep-xyz/lib\x00/new/spack/share\x00'
+    )
+
+
+def test_replace_prefix_bin_size_changes(tmpdir):
+    binary = tmpdir.join('binary')
+    content = b'\x00/short/lib\x00'
+    binary.write_binary(content)
+
+    with pytest.raises(spack.relocate.BinaryStringReplacementError):
+        spack.relocate._replace_prefix_bin(
+            str(binary), '/short', '/much/longer'
+        )
+    assert binary.read_binary() == content
+
+
+def test_relocate_text_at_offsets(tmpdir):
+    script = tmpdir.join('script.sh')
+    script.write('#!/bin/bash /old/spack/bin/sbang\n'
+                 'prefix=/old/spack/opt/pkg-abc\n')
+    changed = tmpdir.join('changed.sh')
+    changed.write('prefix=/old/spack/opt/pkg-abc\n')
+    untouched = tmpdir.join('untouched.txt')
+    untouched.write('nothing to see here\n')
+    files = [str(script), str(changed), str(untouched)]
+
+    offsets = spack.relocate.prefix_offsets(
+        files, ['/old/spack/opt/pkg-abc', '/old/spack/opt',
+                '#!/bin/bash /old/spack/bin/sbang'], text=True)
+
+    assert set(offsets['files']) == set([str(script), str(changed)])
+    assert offsets['files'][str(changed)] == {'size': 30, 'offsets': [[7, 2]]}
+
+    # A file modified after computing the offsets is scanned again
+    changed.write('prefix=/old/spack/opt/pkg-abc/lib\n')
+
+    spack.relocate.relocate_text(
+        files, '/old/spack/opt', '/new/opt',
+        '/old/spack/opt/pkg-abc', '/new/opt/pkg-abc',
+        '/old/spack', '/new/spack', {}, offsets=offsets
+    )
+
+    assert script.read() == ('#!/bin/bash /new/spack/bin/sbang\n'
+                             'prefix=/new/opt/pkg-abc\n')
+    assert changed.read() == 'prefix=/new/opt/pkg-abc/lib\n'
+    assert untouched.read() == 'nothing to see here\n'
+
+
+def test_prefix_offsets_single_job(tmpdir, monkeypatch):
+    files = []
+    for i in range(spack.relocate._min_files_per_pool):
+        f = tmpdir.join('file%d' % i)
+        f.write('prefix=/old/spack/opt\n')
+        files.append(str(f))
+
+    def fail(*args, **kwargs):
+        raise AssertionError('pool created')
+    monkeypatch.setattr(multiprocessing, 'Pool', fail)
+    monkeypatch.setattr(multiprocessing.pool, 'ThreadPool', fail)
+
+    offsets = spack.relocate.prefix_offsets(
+        files, ['/old/spack/opt'], text=True, jobs=1)
+    assert sorted(offsets['files']) == sorted(files)
+
+
+def test_relocate_text_bin_at_offsets(tmpdir):
+    binary = tmpdir.join('binary')
+    binary.write_binary(b'\x00/old/spack/opt/dep/lib\x00/old/spack/share\x00')
+    offsets = spack.relocate.prefix_offsets(
+        [str(binary)], ['/old/spack/opt/dep', '/old/spack'], text=False)
+
+    # The offsets are used only if they were computed for the same prefixes
+    assert offsets['files'][str(binary)]['offsets'] == [[1, 1], [24, 0]]
+    binary.write_binary(b'\x00/old/spack/opt/dep/lib\x00/old/spack/share\x00')
+
+    spack.relocate.relocate_text_bin(
+        [str(binary)], '/old/spack/opt/pkg', '/new/opt/pkg',
+        '/old/spack', '/new/spack', {'/old/spack/opt/dep': '/d/dep'},
+        offsets=offsets
+    )
+
+    padding = b'/' * (len('/old/spack/opt/dep') - len('/d/dep'))
+    assert binary.read_binary() == (
+        b'\x00' + padding + b'/d/dep/lib\x00/new/spack/share\x00'
+    )
+
+
+@pytest.mark.requires_executables('patchelf', 'strings', 'file', 'gcc')
+def test_elf_rpaths(hello_world, tmpdir):
+    executable = hello_world(rpaths=['/usr/lib', '/usr/lib64'])
+
+    rpaths = spack.relocate.elf_rpaths(str(executable))
+
+    assert rpaths == spack.relocate._elf_rpaths_for(str(executable))
+    assert '/usr/lib' in rpaths
+    not_elf = tmpdir.join('not_elf')
+    not_elf.write('#!/bin/bash\n')
+    assert spack.relocate.elf_rpaths(str(not_elf)) is None
@@ -211,6 +211,35 @@ def test_ordered_read_not_required_for_consistent_dag_hash(
         assert spec.full_hash() == round_trip_reversed_json_spec.full_hash()
 
 
+def test_abstract_dag_hash(config, mock_packages, monkeypatch):
+    spec = Spec('mpileaks ^mpich')
+    spec.concretize()
+
+    abstract = spec.copy(caches=False)
+    nodes = list(abstract.traverse(deptype=ht.dag_hash.deptype))
+    for node in nodes:
+        node._concrete = False
+
+    hashed = []
+    node_hash = Spec._node_hash
+
+    def _node_hash(self, hash):
+        hashed.append(self.name)
+        return node_hash(self, hash)
+
+    monkeypatch.setattr(Spec, '_node_hash', _node_hash)
+
+    # Each node is hashed once, though several nodes depend on mpich
+    dag_hash = abstract.dag_hash()
+    assert sorted(hashed) == sorted(node.name for node in nodes)
+    assert not any(node._hash_memo for node in nodes)
+
+    # Hashes are the same as with the YAML dumper
+    monkeypatch.setattr(syaml, 'dump_flow',
+                        lambda data: syaml.dump(data, default_flow_style=True))
+    assert abstract.dag_hash() == dag_hash
+
+
 @pytest.mark.parametrize("module", [
     spack.spec,
     spack.architecture,
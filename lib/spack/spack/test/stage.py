@@ -11,18 +11,27 @@
 import stat
 import tempfile
 import getpass
+import glob
+import hashlib
 
 import pytest
 
 from llnl.util.filesystem import mkdirp, partition_path, touch, working_dir
 
+import spack.caches
+import spack.fetch_strategy
+import spack.mirror
 import spack.paths
 import spack.stage
+import spack.util.crypto
 import spack.util.executable
+import spack.util.file_cache
+import spack.util.spack_yaml as syaml
 
 from spack.resource import Resource
 from spack.stage import Stage, StageComposite, ResourceStage, DIYStage
 from spack.util.path import canonicalize_path
+from spack.version import Version
 
 # The following values are used for common fetch and stage mocking fixtures:
 _archive_base = 'test-files'
@@ -935,3 +944,163 @@ def test_cannot_access(capsys):
 
     captured = capsys.readouterr()
     assert 'Insufficient permissions' in str(captured)
+
+
+@pytest.fixture
+def mirror_health(tmpdir, monkeypatch):
+    """Track the health of mirrors in a temporary misc cache."""
+    misc_cache = spack.util.file_cache.FileCache(str(tmpdir.join('cache')))
+    monkeypatch.setattr(spack.caches, 'misc_cache', misc_cache)
+    health = spack.mirror.MirrorHealth()
+    monkeypatch.setattr(spack.mirror, 'health', health)
+    return health
+
+
+def test_mirror_health(mirror_health):
+    mirror_health.record('http://a', failed=True)
+    mirror_health.record('http://b', elapsed=2.0)
+    mirror_health.record('http://c', elapsed=1.0)
+
+    # Mirrors without statistics first, unreachable mirrors last
+    urls = ['http://a', 'http://b', 'http://c', 'http://d']
+    assert mirror_health.sort(urls) == [
+        'http://d', 'http://c', 'http://b', 'http://a']
+
+    # Statistics are read back by other sessions
+    assert spack.mirror.MirrorHealth().sort(urls) == [
+        'http://d', 'http://c', 'http://b', 'http://a']
+
+    with spack.config.override('config:mirror_failure_limit', 2):
+        assert not mirror_health.skip('http://a')
+        mirror_health.record('http://a', failed=True)
+        assert mirror_health.skip('http://a')
+        assert not spack.mirror.MirrorHealth().skip('http://a')
+
+
+@pytest.mark.disable_clean_stage_check
+def test_mirror_health_response_time(
+        tmp_build_stage_dir, mirror_health, monkeypatch):
+    def fetch(fetcher):
+        fetcher.response_time = 0.5
+        touch(fetcher.stage.save_filename)
+    monkeypatch.setattr(spack.fetch_strategy.URLFetchStrategy, 'fetch', fetch)
+
+    mirrors = {'fast': 'http://fast.example.com'}
+    reference = spack.mirror.MirrorReference('pkg/pkg-1.0.tar.gz')
+    with spack.config.override('mirrors', mirrors):
+        stage = Stage('http://example.com/pkg-1.0.tar.gz',
+                      name='pkg', mirror_paths=reference)
+        with stage:
+            stage.fetch()
+
+    # The time until the mirror responded is recorded, not the whole fetch
+    stats = mirror_health._read()
+    assert stats['http://fast.example.com']['latency'] == 0.5
+
+    # A response of unknown duration keeps the average
+    mirror_health.record('http://fast.example.com')
+    stats = mirror_health._read()
+    assert stats['http://fast.example.com'] == {'failures': 0, 'latency': 0.5}
+
+
+@pytest.mark.disable_clean_stage_check
+def test_skip_unreachable_mirrors(
+        tmp_build_stage_dir, mirror_health, monkeypatch):
+    fetched = []
+
+    def fetch(fetcher):
+        fetched.append(fetcher.url)
+        if 'unreachable' in fetcher.url:
+            raise spack.fetch_strategy.FetchConnectionError(fetcher.url)
+        touch(fetcher.stage.save_filename)
+    monkeypatch.setattr(spack.fetch_strategy.URLFetchStrategy, 'fetch', fetch)
+
+    mirrors = {'unreachable': 'http://unreachable.example.com'}
+    reference = spack.mirror.MirrorReference('pkg/pkg-1.0.tar.gz')
+    with spack.config.override('mirrors', mirrors):
+        with spack.config.override('config:mirror_failure_limit', 1):
+            for _ in range(2):
+                stage = Stage('http://example.com/pkg-1.0.tar.gz',
+                              name='pkg', mirror_paths=reference)
+                with stage:
+                    stage.fetch()
+
+    assert fetched == [
+        'http://unreachable.example.com/pkg/pkg-1.0.tar.gz',
+        'http://example.com/pkg-1.0.tar.gz',
+        'http://example.com/pkg-1.0.tar.gz']
+
+
+@pytest.mark.disable_clean_stage_check
+def test_race_mirrors(tmp_build_stage_dir, mirror_health):
+    tmpdir, _ = tmp_build_stage_dir
+    archive = tmpdir.join('pkg-1.0.tar.gz')
+    archive.write('archive content')
+    digest = spack.util.crypto.checksum(hashlib.sha256, str(archive))
+
+    # Only the second mirror has the archive, the first one has another file
+    tmpdir.ensure('empty', dir=True)
+    tmpdir.ensure('bad', 'pkg', dir=True)
+    tmpdir.join('bad', 'pkg', 'pkg-1.0.tar.gz').write('wrong content')
+    tmpdir.ensure('good', 'pkg', dir=True)
+    archive.copy(tmpdir.join('good', 'pkg', 'pkg-1.0.tar.gz'))
+
+    mirrors = syaml.syaml_dict(
+        (name, 'file://' + str(tmpdir.join(name)))
+        for name in ('empty', 'bad', 'good'))
+    reference = spack.mirror.MirrorReference('pkg/pkg-1.0.tar.gz')
+    fetcher = spack.fetch_strategy.URLFetchStrategy(
+        'file:///no/such/pkg-1.0.tar.gz', digest, expand=False)
+    with spack.config.override('mirrors', mirrors):
+        with spack.config.override('config:mirror_race', 4):
+            with Stage(fetcher, name='pkg', mirror_paths=reference) as stage:
+                stage.fetch()
+                stage.check()
+                assert stage.fetcher.url == 'file://' + str(
+                    tmpdir.join('good', 'pkg', 'pkg-1.0.tar.gz'))
+                assert sorted(os.listdir(stage.path)) == ['pkg-1.0.tar.gz']
+
+
+@pytest.mark.parametrize('keep_stage', [False, True])
+def test_get_checksums_for_versions(tmp_build_stage_dir, keep_stage):
+    tmpdir, stage_root = tmp_build_stage_dir
+    url_dict = {}
+    for version in ('1.0', '1.2', '1.10', '2.0'):
+        archive = tmpdir.join('pkg-%s.tar.gz' % version)
+        archive.write('archive %s' % version)
+        url_dict[Version(version)] = 'file://' + str(archive)
+    url_dict[Version('1.1')] = 'file:///no/such/pkg-1.1.tar.gz'
+
+    version_lines = spack.stage.get_checksums_for_versions(
+        url_dict, 'pkg', keep_stage=keep_stage, batch=True, jobs=3)
+
+    def line(version, padding):
+        digest = hashlib.sha256(
+            ('archive %s' % version).encode('utf-8')).hexdigest()
+        return "    version('%s', %ssha256='%s')" % (
+            version, ' ' * padding, digest)
+
+    # Versions are listed from newest to oldest, skipping failures
+    assert version_lines.split('\n') == [
+        line('2.0', 1), line('1.10', 0), line('1.2', 1), line('1.0', 1)]
+
+    # Archives are only staged when they are kept
+    staged = [os.path.basename(f) for f in
+              glob.glob(os.path.join(stage_root, '*', 'pkg-*.tar.gz'))]
+    assert sorted(staged) == (sorted(
+        'pkg-%s.tar.gz' % v for v in ('1.0', '1.2', '1.10', '2.0')
+    ) if keep_stage else [])
+
+
+def test_checksum_archive_warns_on_html(tmpdir, monkeypatch):
+    page = tmpdir.join('index.html')
+    page.write('<html></html>')
+    warnings = []
+    monkeypatch.setattr(spack.fetch_strategy, 'warn_content_type_mismatch',
+                        warnings.append)
+
+    url = 'file://' + str(page)
+    checksum, error = spack.stage._checksum_archive(url)
+    assert checksum == hashlib.sha256(b'<html></html>').hexdigest()
+    assert error is None
+    assert warnings == [url]
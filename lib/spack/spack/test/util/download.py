@@ -0,0 +1,173 @@
+# Copyright 2013-2020 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+import hashlib
+import os
+import socket
+import threading
+
+import pytest
+
+from six.moves.BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from six.moves.socketserver import ThreadingMixIn
+
+import spack.config
+import spack.fetch_strategy
+import spack.util.crypto
+import spack.util.download as download
+from spack.stage import Stage
+
+archive = os.urandom(100000)
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get('Range')))
+        if self.path == '/redirect':
+            self.send_response(302)
+            self.send_header('Location', '/archive.tar.gz')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if self.path not in ('/archive.tar.gz', '/no-range.tar.gz'):
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        data = archive
+        requested = self.headers.get('Range')
+        if requested and self.path != '/no-range.tar.gz':
+            start = int(requested[len('bytes='):-1])
+            data = archive[start:]
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (
+                start, len(archive) - 1, len(archive)))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'application/x-gzip')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture()
+def http_server():
+    server = _Server(('127.0.0.1', 0), _Handler)
+    server.connections = 0
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield 'http://127.0.0.1:%d' % server.server_address[1], server
+    download.pool.clear()
+    server.shutdown()
+    server.server_close()
+
+
+def test_download(http_server, tmpdir):
+    url, server = http_server
+    for name in ('first', 'second'):
+        path = str(tmpdir.join(name))
+        _, checksum, response_time = download.download(
+            url + '/archive.tar.gz', path)
+        with open(path, 'rb') as f:
+            assert f.read() == archive
+        assert checksum == hashlib.sha256(archive).hexdigest()
+        assert response_time >= 0
+
+    # The connection was kept open for the second download
+    assert server.connections == 1
+
+
+@pytest.mark.parametrize('name,resumed', [
+    ('archive.tar.gz', True),
+    ('no-range.tar.gz', False),
+])
+def test_download_resume(http_server, tmpdir, name, resumed):
+    url, server = http_server
+    path = str(tmpdir.join('archive.part'))
+    with open(path, 'wb') as f:
+        f.write(archive[:1000] if resumed else b'garbage')
+
+    _, checksum, _ = download.download(url + '/' + name, path, 'md5')
+    with open(path, 'rb') as f:
+        assert f.read() == archive
+    assert checksum == hashlib.md5(archive).hexdigest()
+    assert server.requests[-1][1] == 'bytes=%d-' % (1000 if resumed else 7)
+
+
+def test_download_redirect(http_server, tmpdir):
+    url, server = http_server
+    path = str(tmpdir.join('archive'))
+    download.download(url + '/redirect', path)
+    with open(path, 'rb') as f:
+        assert f.read() == archive
+    assert [p for p, _ in server.requests] == [
+        '/redirect', '/archive.tar.gz']
+
+
+def test_download_errors(http_server, tmpdir):
+    url, _ = http_server
+    path = str(tmpdir.join('archive'))
+    with pytest.raises(download.DownloadError) as e:
+        download.download(url + '/missing.tar.gz', path)
+    assert not isinstance(e.value, download.ConnectionFailedError)
+
+    # Find a port nobody listens to
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    with pytest.raises(download.ConnectionFailedError):
+        download.download('http://127.0.0.1:%d/archive.tar.gz' % port, path)
+
+
+def test_supported(monkeypatch):
+    monkeypatch.delenv('http_proxy', raising=False)
+    monkeypatch.delenv('HTTP_PROXY', raising=False)
+    assert download.supported('http://example.com/a.tar.gz')
+    assert not download.supported('ftp://example.com/a.tar.gz')
+    assert not download.supported('file:///a.tar.gz')
+
+    # Proxies are left to curl
+    monkeypatch.setenv('http_proxy', 'http://proxy.example.com:3128')
+    assert not download.supported('http://example.com/a.tar.gz')
+
+
+@pytest.mark.usefixtures('config')
+def test_fetch_with_urllib(http_server, mock_stage, monkeypatch):
+    url, server = http_server
+    digest = hashlib.sha256(archive).hexdigest()
+    fetcher = spack.fetch_strategy.URLFetchStrategy(
+        url + '/archive.tar.gz', digest, expand=False)
+
+    with spack.config.override('config:url_fetch_method', 'urllib'):
+        with Stage(fetcher, name='download-test') as stage:
+            stage.fetch()
+
+            # The checksum is known without reading the archive again
+            def fail(*args, **kwargs):
+                raise AssertionError('archive read again')
+            monkeypatch.setattr(spack.util.crypto, 'checksum', fail)
+            stage.check()
+
+            with open(stage.archive_file, 'rb') as f:
+                assert f.read() == archive
+    assert server.requests == [('/archive.tar.gz', None)]
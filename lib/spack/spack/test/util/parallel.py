@@ -0,0 +1,99 @@
+# Copyright 2013-2020 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+import multiprocessing
+import os
+import sys
+import threading
+
+import pytest
+
+import spack.util.parallel as parallel
+
+
+def _add(item, offset):
+    return item + offset, os.getpid()
+
+
+def _increment(item, counter):
+    with counter.get_lock():
+        counter.value += 1
+    return item
+
+
+def _fail(item):
+    raise ValueError(item)
+
+
+@pytest.mark.parametrize('threads', [False, True])
+def test_parallel_map(threads):
+    results = parallel.parallel_map(_add, range(10), 2, (100,), threads)
+    assert [r for r, _ in results] == list(range(100, 110))
+
+    pids = set(pid for _, pid in results)
+    if threads:
+        assert pids == set([os.getpid()])
+    else:
+        assert os.getpid() not in pids
+
+
+def test_parallel_map_shares_arguments():
+    counter = multiprocessing.Value('i', 0)
+    results = parallel.parallel_map(_increment, 'abcd', 2, (counter,))
+    assert results == list('abcd')
+    assert counter.value == 4
+
+
+@pytest.mark.skipif(sys.version_info < (3, 4),
+                    reason='start methods need Python 3.4')
+def test_parallel_map_spawn(monkeypatch):
+    context = multiprocessing.get_context('spawn')
+    monkeypatch.setattr(multiprocessing, 'Pool', context.Pool)
+    # Don't run the main script of the test session again in the workers
+    monkeypatch.delattr(sys.modules['__main__'], '__file__', raising=False)
+    counter = context.Value('i', 0)
+    results = parallel.parallel_map(_increment, 'abcd', 2, (counter,))
+    assert results == list('abcd')
+    assert counter.value == 4
+
+
+def test_parallel_map_errors():
+    with pytest.raises(ValueError):
+        parallel.parallel_map(_fail, range(4), 2)
+
+
+def _use_key(item, state):
+    name, key = item
+    lock, in_use, started = state
+    with lock:
+        in_use[key] = in_use.get(key, 0) + 1
+        assert in_use[key] == 1
+    started[name].set()
+
+    # The first item only finishes once the one using another key started
+    if name == 'a1':
+        assert started['b1'].wait(10)
+    with lock:
+        in_use[key] -= 1
+    return name
+
+
+@pytest.mark.parametrize('jobs', [2, 3])
+def test_parallel_map_max_per_key(jobs):
+    items = [('a1', 'a'), ('a2', 'a'), ('a3', 'a'), ('b1', 'b')]
+    started = dict((name, threading.Event()) for name, _ in items)
+    state = (threading.Lock(), {}, started)
+
+    results = parallel.parallel_map(
+        _use_key, items, jobs, (state,), threads=True,
+        keys=[set([key]) for _, key in items], max_per_key=1)
+    assert results == ['a1', 'a2', 'a3', 'b1']
+
+
+def test_parallel_map_max_per_key_errors():
+    with pytest.raises(ValueError):
+        parallel.parallel_map(_fail, range(4), 2,
+                              keys=[set([i % 2]) for i in range(4)],
+                              max_per_key=1)
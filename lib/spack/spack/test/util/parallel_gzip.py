@@ -0,0 +1,89 @@
+# Copyright 2013-2020 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+import gzip
+import io
+import os
+import tarfile
+
+from contextlib import closing
+
+import pytest
+
+import spack.util.parallel_gzip as parallel_gzip
+
+
+@pytest.fixture()
+def small_blocks(monkeypatch):
+    monkeypatch.setattr(parallel_gzip, 'block_size', 1024)
+
+
+def _compress(data, jobs=4):
+    output = io.BytesIO()
+    with closing(parallel_gzip.GzipWriter(output, jobs=jobs)) as writer:
+        for i in range(0, len(data), 700):
+            writer.write(data[i:i + 700])
+    return output.getvalue()
+
+
+@pytest.mark.usefixtures('small_blocks')
+@pytest.mark.parametrize('size', [0, 10, 1024, 4096, 10000])
+def test_parallel_gzip_roundtrip(size):
+    data = os.urandom(size // 2) + b'spack' * (size // 10)
+
+    compressed = _compress(data)
+
+    # Standard gzip readers can decompress the output
+    with closing(gzip.GzipFile(fileobj=io.BytesIO(compressed))) as f:
+        assert f.read() == data
+
+    # And so can the parallel reader, with reads of any size
+    reader = parallel_gzip.GzipReader(io.BytesIO(compressed), jobs=2)
+    with closing(reader):
+        chunks = []
+        chunk = reader.read(333)
+        while chunk:
+            chunks.append(chunk)
+            chunk = reader.read(333)
+    assert b''.join(chunks) == data
+
+
+@pytest.mark.usefixtures('small_blocks')
+def test_parallel_gzip_tarball(tmpdir):
+    source = tmpdir.ensure('prefix', dir=True)
+    for i in range(5):
+        source.join('file-{0}'.format(i)).write('x' * 3000 * i)
+
+    tarball = str(tmpdir.join('prefix.tar.gz'))
+    with open(tarball, 'wb') as f:
+        with closing(parallel_gzip.GzipWriter(f)) as writer:
+            with closing(tarfile.open(fileobj=writer, mode='w|')) as tar:
+                tar.add(str(source), arcname='prefix')
+
+    assert parallel_gzip.is_parallel_gzip(tarball)
+    with closing(tarfile.open(tarball, 'r:gz')) as tar:
+        expected = sorted(tar.getnames())
+
+    with open(tarball, 'rb') as f:
+        with closing(parallel_gzip.GzipReader(f)) as reader:
+            with closing(tarfile.open(fileobj=reader, mode='r|')) as tar:
+                tar.extractall(str(tmpdir.join('output')))
+
+    output = tmpdir.join('output', 'prefix')
+    assert sorted(['prefix'] + ['prefix/' + x for x in os.listdir(
+        str(output))]) == expected
+    assert output.join('file-4').read() == 'x' * 12000
+
+
+def test_is_parallel_gzip(tmpdir):
+    regular = str(tmpdir.join('regular.gz'))
+    with closing(gzip.GzipFile(regular, 'wb')) as f:
+        f.write(b'spack')
+    assert not parallel_gzip.is_parallel_gzip(regular)
+
+    with pytest.raises(IOError):
+        with open(regular, 'rb') as f:
+            with closing(parallel_gzip.GzipReader(f)) as reader:
+                reader.read()
@@ -5,7 +5,10 @@
 
 import re
 
+import pytest
+
 import spack.config
+import spack.util.spack_yaml as syaml
 from spack.main import SpackCommand
 
 config_cmd = SpackCommand('config')
@@ -65,3 +68,18 @@ def test_config_blame_with_override(config):
         check_blame('verify_ssl', config_file, 13)
         check_blame('checksum', config_file, 14)
         check_blame('dirty', config_file, 15)
+
+
+@pytest.mark.parametrize('data', [
+    {},
+    [],
+    {'version': '1.2', 'versions': ['0.8.13', '20130729', '1.0e3', '0x1f']},
+    {'parameters': {'shared': True, 'opt': False, 'n': 3, 'cflags': []}},
+    {'true': 'TRUE', 'null': '~', 'yes': 'No', 'date': '2020-01-01'},
+    {'external': {'path': '/usr/local', 'module': None}},
+    {'special': ['a b', 'a: b', '#x', '-', '---', '.5', '', "it's"]},
+    {'x' * 130: 'long key'},
+    {'nested': [{'a': [[], {}]}, syaml.syaml_dict([('z', 1), ('a', 2)])]},
+])
+def test_dump_flow(data):
+    assert syaml.dump_flow(data) == syaml.dump(data, default_flow_style=True)
@@ -0,0 +1,248 @@
+# Copyright 2013-2020 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+"""In-process HTTP(S) downloads over persistent connections.
+
+Connections are kept open after a download and reused by the next one
+from the same host, for as long as the process runs. Partial downloads
+are resumed with range requests, and the checksum of the data is computed
+while it is written, so that the file needn't be read again to check it.
+"""
+import os
+import socket
+import ssl
+import threading
+import time
+
+from six.moves import http_client
+from six.moves.urllib.parse import urljoin, urlparse
+from six.moves.urllib.request import getproxies, proxy_bypass
+
+import spack
+import spack.config
+import spack.error
+import spack.util.crypto as crypto
+
+#: Size of the chunks read from responses
+chunk_size = 256 * 1024
+
+#: Maximum number of redirections followed by a download
+max_redirects = 10
+
+_redirect_codes = (301, 302, 303, 307, 308)
+
+# CertificateError is missing before Python 2.7.9
+_ssl_errors = (ssl.SSLError, getattr(ssl, 'CertificateError', ssl.SSLError))
+
+
+def supported(url):
+    """Return True if ``url`` can be downloaded by this module.
+
+    Only HTTP and HTTPS URLs are supported, when they are not accessed
+    through a proxy. HTTPS also needs a Python that can verify
+    certificates, i.e. 2.7.9 or later.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ('http', 'https') or parsed.username:
+        return False
+    if (parsed.scheme == 'https' and
+            not hasattr(ssl, 'create_default_context')):
+        return False
+    return (parsed.scheme not in getproxies() or
+            bool(proxy_bypass(parsed.hostname)))
+
+
+def _connect(scheme, netloc, timeout):
+    if scheme == 'https':
+        if spack.config.get('config:verify_ssl'):
+            context = ssl.create_default_context()  # novm
+        else:
+            context = ssl._create_unverified_context()
+        connection = http_client.HTTPSConnection(
+            netloc, timeout=timeout, context=context)
+    else:
+        connection = http_client.HTTPConnection(netloc, timeout=timeout)
+
+    try:
+        connection.connect()
+    except _ssl_errors as e:
+        connection.close()
+        raise DownloadError(
+            'SSL error while connecting to %s: %s' % (netloc, e),
+            "If you believe your SSL configuration is bad, you can try "
+            "running spack -k, which will not check SSL certificates. Use "
+            "this at your own risk.")
+    except (socket.error, socket.timeout) as e:
+        connection.close()
+        raise ConnectionFailedError(
+            'Cannot connect to %s: %s' % (netloc, e))
+
+    # The timeout only applies to the connection, like curl's
+    connection.sock.settimeout(None)
+    return connection
+
+
+class ConnectionPool(object):
+    """Idle connections, by scheme and network location.
+
+    Connections inherited from a parent process are not reused, since
+    their sockets are shared with it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._pid = os.getpid()
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            self._idle, self._pid = {}, os.getpid()
+
+    def get(self, scheme, netloc, timeout=None):
+        """Return a connection to ``netloc``, and whether it was used
+        before."""
+        with self._lock:
+            self._check_pid()
+            idle = self._idle.get((scheme, netloc))
+            if idle:
+                return idle.pop(), True
+        return _connect(scheme, netloc, timeout), False
+
+    def put(self, scheme, netloc, connection):
+        """Keep ``connection`` to ``netloc`` open for later requests."""
+        with self._lock:
+            self._check_pid()
+            self._idle.setdefault((scheme, netloc), []).append(connection)
+
+    def clear(self):
+        """Close all the idle connections."""
+        with self._lock:
+            self._check_pid()
+            for connections in self._idle.values():
+                for connection in connections:
+                    connection.close()
+            self._idle = {}
+
+
+#: Connections shared by all the downloads of this process
+pool = ConnectionPool()
+
+
+def _request(url, headers, timeout):
+    """Send a GET request for ``url``, and return the response and the
+    connection it came from."""
+    parsed = urlparse(url)
+    path = parsed.path or '/'
+    if parsed.query:
+        path += '?' + parsed.query
+
+    while True:
+        connection, reused = pool.get(parsed.scheme, parsed.netloc, timeout)
+        try:
+            connection.request('GET', path, headers=headers)
+            return connection.getresponse(), connection
+        except (http_client.HTTPException, socket.error) as e:
+            connection.close()
+            # Servers close idle connections whenever they like: try again
+            # with a new one
+            if not reused:
+                raise ConnectionFailedError(
+                    'Request for %s failed: %s' % (url, e))
+
+
+def _release(url, response, connection):
+    """Return ``connection`` to the pool once ``response`` was read."""
+    if response.will_close:
+        connection.close()
+    else:
+        parsed = urlparse(url)
+        pool.put(parsed.scheme, parsed.netloc, connection)
+
+
+def download(url, path, algorithm='sha256', headers=None, timeout=None):
+    """Download ``url`` to ``path``.
+
+    If ``path`` already exists, it is taken to be the beginning of the
+    file, and only the rest is requested from the server. If the server
+    doesn't support range requests, the whole file is downloaded again.
+
+    Arguments:
+        url (str): HTTP or HTTPS URL to download
+        path (str): path of the downloaded file
+        algorithm (str): hash algorithm used to checksum the file
+        headers (dict): additional headers sent with the request
+        timeout (int): timeout in seconds to connect to the server
+
+    Returns:
+        tuple: the headers of the response (an ``HTTPMessage``), the hex
+        digest of the whole file computed with ``algorithm``, and the time
+        in seconds until the headers of the last response were received
+
+    Raises:
+        ConnectionFailedError: if the server could not be reached, or the
+            connection broke during the download. A partial download is
+            left at ``path``, to be resumed later.
+        DownloadError: if the server answered with an error, or there
+            were too many redirections
+    """
+    request_headers = {'User-Agent': 'spack/%s' % spack.spack_version}
+    request_headers.update(headers or {})
+
+    offset = os.path.getsize(path) if os.path.exists(path) else 0
+    start = time.time()
+    for _ in range(max_redirects + 1):
+        if offset:
+            request_headers['Range'] = 'bytes=%d-' % offset
+        else:
+            request_headers.pop('Range', None)
+        response, connection = _request(url, request_headers, timeout)
+        response_time = time.time() - start
+        status = response.status
+
+        if status in _redirect_codes or (status == 416 and offset):
+            # Either follow the redirection, or restart from scratch when
+            # the range can't be satisfied
+            response.read()
+            _release(url, response, connection)
+            if status == 416:
+                offset = 0
+            else:
+                url = urljoin(url, response.getheader('Location'))
+            continue
+
+        if status not in (200, 206):
+            response.read()
+            _release(url, response, connection)
+            raise DownloadError(
+                'HTTP error %d (%s) for %s' % (status, response.reason, url))
+
+        hasher = crypto.hash_fun_for_algo(algorithm)()
+        if status == 206:
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(chunk_size), b''):
+                    hasher.update(block)
+
+        with open(path, 'ab' if status == 206 else 'wb') as f:
+            try:
+                for block in iter(lambda: response.read(chunk_size), b''):
+                    hasher.update(block)
+                    f.write(block)
+            except (http_client.HTTPException, socket.error) as e:
+                connection.close()
+                raise ConnectionFailedError(
+                    'Download of %s interrupted: %s' % (url, e))
+
+        _release(url, response, connection)
+        return response.msg, hasher.hexdigest(), response_time
+
+    raise DownloadError('Too many redirections for %s' % url)
+
+
+class DownloadError(spack.error.SpackError):
+    """Raised when a download fails."""
+
+
+class ConnectionFailedError(DownloadError):
+    """Raised when the server can't be reached, or the connection breaks."""
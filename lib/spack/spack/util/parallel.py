@@ -0,0 +1,135 @@
+# Copyright 2013-2020 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+"""Run a function over many items with a pool of workers.
+
+The items and the extra arguments of the function are handed to each
+worker once, when it starts, and tasks only carry the index of an item.
+With the ``fork`` start method nothing is pickled but the results. With
+``spawn``, the function, the items and the arguments are pickled once per
+worker, so they may include synchronization primitives of
+:mod:`multiprocessing`, which cannot be sent along with a task.
+"""
+import multiprocessing
+import multiprocessing.pool
+
+from six.moves import queue
+
+#: Function, items and extra arguments used by the tasks of a worker
+#: process, set by _initialize_worker() when the worker starts
+_worker_args = None
+
+
+def _initialize_worker(function, items, args):
+    global _worker_args
+    _worker_args = (function, items, args)
+
+
+def _run_task(index):
+    function, items, args = _worker_args
+    return function(items[index], *args)
+
+
+def _run_scheduled_task(index):
+    # Errors are returned rather than raised: the parent only hears about
+    # the tasks that return
+    try:
+        return index, None, _run_task(index)
+    except (Exception, SystemExit) as e:
+        return index, e, None
+
+
+def parallel_map(function, items, jobs, args=(), threads=False,
+                 keys=None, max_per_key=None):
+    """Return ``[function(item, *args) for item in items]``, computed by
+    ``jobs`` worker processes, or threads if ``threads`` is True.
+
+    If ``keys`` is given, it holds for each item the set of keys, like the
+    hosts it connects to, that at most ``max_per_key`` items may use at
+    once. Items are started in order, except that those whose keys are all
+    in use wait in this process, without occupying a worker, and let the
+    next items start.
+
+    Args:
+        function: module-level function called on each item
+        items (list): items passed to ``function`` one at a time
+        jobs (int): number of workers
+        args (tuple): extra arguments passed to each call of ``function``
+        threads (bool): whether to use threads rather than processes, for
+            functions that do not change the state of the process
+        keys (list): sets of keys of the items
+        max_per_key (int): number of items using a key at once
+
+    Returns:
+        list: the results, in the order of ``items``
+    """
+    items = list(items)
+    if threads:
+        # Threads share the memory of the process, so nothing is copied
+        def task(index):
+            return function(items[index], *args)
+
+        def scheduled_task(index):
+            try:
+                return index, None, task(index)
+            except (Exception, SystemExit) as e:
+                return index, e, None
+        pool = multiprocessing.pool.ThreadPool(processes=jobs)
+    else:
+        pool = multiprocessing.Pool(
+            processes=jobs, initializer=_initialize_worker,
+            initargs=(function, items, args))
+        task, scheduled_task = _run_task, _run_scheduled_task
+
+    try:
+        if keys is None or not max_per_key:
+            return pool.map(task, range(len(items)), 1)
+        return _schedule(pool, scheduled_task, len(items), jobs,
+                         keys, max_per_key)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _schedule(pool, task, size, jobs, keys, max_per_key):
+    """Run ``task`` on the indices of the items in ``pool``, submitting
+    only the items whose keys are used by less than ``max_per_key``
+    running items, and at most ``jobs`` items at once."""
+    results = [None] * size
+    pending = list(range(size))
+    in_use = {}
+    running = 0
+    error = None
+    done = queue.Queue()
+
+    while running or (pending and error is None):
+        # Start all the items that may run, in order
+        for index in list(pending):
+            if running >= jobs or error is not None:
+                break
+            if any(in_use.get(k, 0) >= max_per_key for k in keys[index]):
+                continue
+            pending.remove(index)
+            for k in keys[index]:
+                in_use[k] = in_use.get(k, 0) + 1
+            pool.apply_async(task, (index,), callback=done.put)
+            running += 1
+
+        # A timeout keeps the wait interruptible on Python 2
+        while True:
+            try:
+                index, e, result = done.get(True, 1)
+                break
+            except queue.Empty:
+                pass
+        running -= 1
+        for k in keys[index]:
+            in_use[k] -= 1
+        results[index] = result
+        error = error or e
+
+    if error is not None:
+        raise error
+    return results
@@ -0,0 +1,197 @@
+# Copyright 2013-2020 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+"""Block-parallel gzip compression and decompression.
+
+Data is split into independent blocks, each stored as a separate gzip
+member. A stream of concatenated members is a valid gzip file (RFC 1952),
+so anything that reads ``.gz`` files, including older versions of Spack,
+can still read the output.
+
+Each member carries an extra field (``SI1='S'``, ``SI2='P'``) recording
+the total size of the member. That lets a reader find the boundaries of
+the members without inflating them, so that blocks can be decompressed
+concurrently as well. Compression and decompression are done by ``zlib``,
+which releases the GIL, so a thread pool is enough to use several cores.
+"""
+import multiprocessing.pool
+import struct
+import zlib
+
+#: Size of the uncompressed blocks
+block_size = 1024 * 1024
+
+#: Layout of the header written at the beginning of each member:
+#: ID1, ID2, CM, FLG, MTIME, XFL, OS, XLEN, SI1, SI2, LEN, member size
+_header = struct.Struct('<BBBBIBBHBBHI')
+
+#: Layout of the trailer written at the end of each member: CRC32, ISIZE
+_trailer = struct.Struct('<II')
+
+#: Number of bytes needed to recognize a stream written by GzipWriter
+header_size = _header.size
+
+_FEXTRA = 4
+_OS_UNKNOWN = 255
+
+
+def _compress_block(args):
+    data, compresslevel = args
+    compressor = zlib.compressobj(
+        compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS)
+    deflated = compressor.compress(data) + compressor.flush()
+    member_size = _header.size + len(deflated) + _trailer.size
+    header = _header.pack(0x1f, 0x8b, zlib.DEFLATED, _FEXTRA, 0, 0,
+                          _OS_UNKNOWN, 8, ord('S'), ord('P'), 4, member_size)
+    trailer = _trailer.pack(zlib.crc32(data) & 0xffffffff,
+                            len(data) & 0xffffffff)
+    return header + deflated + trailer
+
+
+def _decompress_member(member):
+    # 16 + MAX_WBITS: expect a gzip wrapper, which also checks the CRC
+    return zlib.decompress(member, 16 + zlib.MAX_WBITS)
+
+
+def _member_size(header):
+    """Return the size of the member starting with ``header``, or None if
+    the header was not written by :class:`GzipWriter`."""
+    if len(header) < _header.size:
+        return None
+    fields = _header.unpack(header[:_header.size])
+    id1, id2, cm, flg = fields[:4]
+    si1, si2, slen, size = fields[-4:]
+    if (id1, id2, cm) != (0x1f, 0x8b, zlib.DEFLATED):
+        return None
+    if not (flg & _FEXTRA) or (si1, si2, slen) != (ord('S'), ord('P'), 4):
+        return None
+    return size
+
+
+def is_parallel_gzip(path):
+    """Return True if the file at ``path`` was written by
+    :class:`GzipWriter`, False otherwise."""
+    with open(path, 'rb') as f:
+        return is_parallel_gzip_header(f.read(header_size))
+
+
+def is_parallel_gzip_header(header):
+    """Return True if ``header``, the first :data:`header_size` bytes of a
+    stream, was written by :class:`GzipWriter`, False otherwise."""
+    return _member_size(header) is not None
+
+
+class GzipWriter(object):
+    """Write-only file object that compresses the data written to it in
+    independent blocks, using a pool of threads.
+
+    Args:
+        fileobj: file object where the compressed stream is written
+        jobs (int): number of threads used for compression (default: number
+            of cores)
+        compresslevel (int): zlib compression level
+    """
+
+    def __init__(self, fileobj, jobs=None, compresslevel=6):
+        self.fileobj = fileobj
+        self.compresslevel = compresslevel
+        self.jobs = jobs or multiprocessing.cpu_count()
+        self.pool = multiprocessing.pool.ThreadPool(processes=self.jobs)
+        self.chunks, self.buffered = [], 0
+        self.members = 0
+
+    def write(self, data):
+        self.chunks.append(data)
+        self.buffered += len(data)
+        # Compress as many blocks as there are threads at once
+        if self.buffered >= block_size * self.jobs:
+            self._flush(final=False)
+
+    def _flush(self, final):
+        data = b''.join(self.chunks)
+        nblocks, remainder = divmod(len(data), block_size)
+        if final and (remainder or not (nblocks or self.members)):
+            # the last block may be short; an empty input still needs
+            # one member to be a valid gzip file
+            nblocks += 1
+        blocks = [(data[i * block_size:(i + 1) * block_size],
+                   self.compresslevel) for i in range(nblocks)]
+        for member in self.pool.map(_compress_block, blocks):
+            self.fileobj.write(member)
+        self.members += len(blocks)
+
+        rest = data[nblocks * block_size:]
+        self.chunks, self.buffered = [rest], len(rest)
+
+    def close(self):
+        if self.pool is None:
+            return
+        try:
+            self._flush(final=True)
+        finally:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+
+class GzipReader(object):
+    """Read-only file object that decompresses a stream written by
+    :class:`GzipWriter`, inflating several members at once using a pool of
+    threads.
+
+    Args:
+        fileobj: file object from which the compressed stream is read
+        jobs (int): number of threads used for decompression (default:
+            number of cores)
+    """
+
+    def __init__(self, fileobj, jobs=None):
+        self.fileobj = fileobj
+        self.jobs = jobs or multiprocessing.cpu_count()
+        self.pool = multiprocessing.pool.ThreadPool(processes=self.jobs)
+        self.buffer, self.offset = b'', 0
+        self.eof = False
+
+    def _read_members(self):
+        members = []
+        while len(members) < self.jobs:
+            header = self.fileobj.read(_header.size)
+            if not header:
+                self.eof = True
+                break
+            size = _member_size(header)
+            if size is None:
+                raise IOError('not a block-parallel gzip stream')
+            body = self.fileobj.read(size - _header.size)
+            if len(body) != size - _header.size:
+                raise IOError('truncated block-parallel gzip stream')
+            members.append(header + body)
+        return members
+
+    def read(self, size=-1):
+        available = len(self.buffer) - self.offset
+        if 0 <= size <= available:
+            start, self.offset = self.offset, self.offset + size
+            return self.buffer[start:self.offset]
+
+        chunks = [self.buffer[self.offset:]]
+        while not self.eof and (size < 0 or available < size):
+            blocks = self.pool.map(_decompress_member, self._read_members())
+            chunks.extend(blocks)
+            available += sum(len(b) for b in blocks)
+
+        data = b''.join(chunks)
+        if size < 0 or size >= len(data):
+            self.buffer, self.offset = b'', 0
+            return data
+        self.buffer, self.offset = data, size
+        return data[:size]
+
+    def close(self):
+        if self.pool is None:
+            return
+        self.pool.close()
+        self.pool.join()
+        self.pool = None
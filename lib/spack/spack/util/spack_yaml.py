@@ -13,12 +13,14 @@
 
 """
 import ctypes
+import re
 
 
 from ordereddict_backport import OrderedDict
-from six import string_types, StringIO
+from six import integer_types, string_types, text_type, StringIO
 
 import ruamel.yaml as yaml
+import ruamel.yaml.resolver
 from ruamel.yaml import RoundTripLoader, RoundTripDumper
 
 from llnl.util.tty.color import colorize, clen, cextra
@@ -207,6 +209,69 @@ def dump(obj, default_flow_style=False, stream=None):
                      Dumper=SafeDumper, stream=stream)
 
 
+#: Strings made only of these characters never need escaping, and the
+#: dumper writes them either as they are or in single quotes
+_flow_simple_str = re.compile(r'^[A-Za-z0-9_/+][A-Za-z0-9_./+-]*$')
+
+#: Patterns of the strings that the dumper quotes, since they would be
+#: read back as booleans, numbers, dates, etc.
+_flow_implicit_resolvers = [
+    regexp for versions, tag, regexp, first
+    in ruamel.yaml.resolver.implicit_resolvers
+    if ruamel.yaml.resolver._DEFAULT_VERSION in versions
+]
+
+_flow_str_types = (str, text_type, syaml_str)
+_flow_int_types = integer_types + (syaml_int,)
+
+
+class _FlowDumpError(Exception):
+    """Raised for data that dump_flow() cannot write by itself."""
+
+
+def _flow_str(value, key=False):
+    # Keys of 128 characters or more are not written as simple keys
+    if type(value) not in _flow_str_types or \
+            not _flow_simple_str.match(value) or (key and len(value) >= 128):
+        raise _FlowDumpError()
+
+    for regexp in _flow_implicit_resolvers:
+        if regexp.match(value):
+            return "'" + value + "'"
+    return value
+
+
+def _flow_dump(obj):
+    cls = type(obj)
+    if cls in _flow_str_types:
+        return _flow_str(obj)
+    elif cls is bool:
+        return 'true' if obj else 'false'
+    elif cls in _flow_int_types:
+        return str(obj)
+    elif obj is None:
+        return "!!null ''"
+    elif cls is dict or cls is syaml_dict:
+        return '{' + ', '.join(
+            _flow_str(k, key=True) + ': ' + _flow_dump(v)
+            for k, v in obj.items()) + '}'
+    elif cls is list or cls is syaml_list:
+        return '[' + ', '.join(_flow_dump(v) for v in obj) + ']'
+    raise _FlowDumpError()
+
+
+def dump_flow(obj):
+    """Same as ``dump(obj, default_flow_style=True)``, but much faster for
+    the data found in spec nodes: dictionaries, lists, booleans, integers
+    and strings without special characters. Other data is passed on to
+    the YAML dumper.
+    """
+    try:
+        return _flow_dump(obj) + '\n'
+    except _FlowDumpError:
+        return dump(obj, default_flow_style=True)
+
+
 def file_line(mark):
     """Format a mark as <file>:<line> information."""
     result = mark.name
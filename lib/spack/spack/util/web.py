@@ -12,6 +12,7 @@
 import os.path
 import re
 import shutil
+import socket
 import ssl
 import sys
 import traceback
@@ -127,6 +128,11 @@ def read_from_url(url, accept_content_type=None):
     try:
         response = _urlopen(req, timeout=_timeout, context=context)
     except URLError as err:
+        # Local files that don't exist are reported as socket errors too
+        reason = getattr(err, 'reason', None)
+        if (url.scheme != 'file' and
+                isinstance(reason, (socket.error, socket.timeout))):
+            raise NoNetworkConnectionError(str(err), url_util.format(url))
         raise SpackWebError('Download failed: {ERROR}'.format(
             ERROR=str(err)))
 